@@ -0,0 +1,8 @@
+# Copyright (C) 2013 Che-Liang Chiou.
+
+'''Benchmarks of cbind and the bindings it generates.
+
+Run them from the top of the source tree, e.g.
+
+    python -m benchmark.import_time -o results.json
+'''
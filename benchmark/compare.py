@@ -0,0 +1,108 @@
+# Copyright (C) 2013 Che-Liang Chiou.
+
+'''Compare two results of a benchmark and report regressions.
+
+Results are JSON objects with a "cases" mapping of case names to metrics;
+nested metrics, like {"import_s": {"median": ...}}, are flattened to
+"import_s.median".  Rates, whose names end with "_per_s", are
+higher-is-better; all other metrics are lower-is-better.
+'''
+
+import json
+import sys
+
+
+# Metrics that are not measurements
+IGNORED = frozenset(('error', 'nodes', 'size'))
+
+# Suffix of names of higher-is-better metrics
+RATE_SUFFIX = '_per_s'
+
+
+def flatten(metrics, prefix=''):
+    '''Flatten nested metrics into a dict of dotted names to numbers.'''
+    flat = {}
+    for name, value in metrics.items():
+        if name in IGNORED:
+            continue
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + name + '.'))
+        elif isinstance(value, (int, float)) and \
+                not isinstance(value, bool):
+            flat[prefix + name] = value
+    return flat
+
+
+def compare(base, new, threshold):
+    '''Return rows of (case, metric, base, new, change, regressed).'''
+    rows = []
+    for case in sorted(set(base['cases']) & set(new['cases'])):
+        base_metrics = flatten(base['cases'][case])
+        new_metrics = flatten(new['cases'][case])
+        for metric in sorted(set(base_metrics) & set(new_metrics)):
+            old_value = base_metrics[metric]
+            new_value = new_metrics[metric]
+            if old_value:
+                change = float(new_value - old_value) / abs(old_value)
+            else:
+                change = 0.0 if not new_value else float('inf')
+            if metric.endswith(RATE_SUFFIX):
+                regressed = change < -threshold
+            else:
+                regressed = change > threshold
+            rows.append((case, metric, old_value, new_value, change,
+                         regressed))
+    return rows
+
+
+def format_rows(rows, output):
+    '''Write rows as a table.'''
+    fmt = '{0:<20} {1:<32} {2:>14} {3:>14} {4:>9} {5}\n'
+    output.write(fmt.format('case', 'metric', 'base', 'new', 'change', ''))
+    for case, metric, old_value, new_value, change, regressed in rows:
+        output.write(fmt.format(case, metric,
+                                _format_number(old_value),
+                                _format_number(new_value),
+                                '%+.1f%%' % (change * 100),
+                                'REGRESSED' if regressed else ''))
+
+
+def _format_number(value):
+    '''Format a metric value.'''
+    if isinstance(value, float):
+        return '%.6g' % value
+    return str(value)
+
+
+def main():
+    '''Main function.'''
+    import argparse
+    parser = argparse.ArgumentParser(description='''
+            Compare two results of a benchmark; exit with status 1 if any
+            metric regressed by more than the threshold.
+            ''')
+    parser.add_argument('base', type=argparse.FileType('r'),
+                        help='results of the base commit')
+    parser.add_argument('new', type=argparse.FileType('r'),
+                        help='results of the new commit')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help=('relative increase that counts as regression, '
+                              'default to %(default)s'))
+    args = parser.parse_args()
+    base = json.load(args.base)
+    new = json.load(args.new)
+
+    for results in (base, new):
+        for case, metrics in sorted(results['cases'].items()):
+            if 'error' in metrics:
+                sys.stderr.write('%s: case %s failed: %s\n' %
+                                 (results.get('commit'), case,
+                                  metrics['error']))
+
+    rows = compare(base, new, args.threshold)
+    format_rows(rows, sys.stdout)
+    return 1 if any(row[-1] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,250 @@
+# Copyright (C) 2013 Che-Liang Chiou.
+
+'''Benchmark import time, memory, and call overhead of generated bindings.
+
+Bindings are generated from synthetic headers of preset sizes (see
+benchmark.synthetic) and compared with fixtures checked into the tree.
+Every measurement is taken in a fresh interpreter, and the results are
+written as JSON, which benchmark.compare compares between commits.
+'''
+
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmark import synthetic
+
+
+# Top of the source tree
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Version of the format of results
+VERSION = 1
+
+# Fixtures: name, directory (relative to ROOT), module, and call statement
+FIXTURES = (
+    ('linux_input', 'demo', 'linux_input', None),
+    ('min_cindex', '.', 'cbind.min_cindex', 'clang_getNullCursor()'),
+)
+
+# Statement of calling a function of synthetic bindings
+SYNTHETIC_CALL = '%s_fn0(1)' % synthetic.PREFIX
+
+# Measure in a fresh interpreter; arguments are passed as JSON in argv[1],
+# and results are printed as JSON.
+CHILD = '''
+import importlib
+import json
+import sys
+import time
+import timeit
+
+timer = getattr(time, 'perf_counter', time.time)
+params = json.loads(sys.argv[1])
+sys.path.insert(0, params['path'])
+result = {}
+
+def get_rss():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+if params['mode'] == 'memory':
+    import tracemalloc
+    tracemalloc.start()
+    if params['module']:
+        importlib.import_module(params['module'])
+    result['traced_peak_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+    tracemalloc.stop()
+    result['rss_kb'] = get_rss()
+else:
+    start = timer()
+    module = importlib.import_module(params['module'])
+    result['import_s'] = timer() - start
+    if params['call']:
+        namespace = dict(vars(module))
+        start = timer()
+        eval(params['call'], namespace)
+        result['first_call_s'] = timer() - start
+        try:
+            timing = timeit.Timer(params['call'], globals=namespace)
+        except TypeError:
+            # Before Python 3.5, Timer does not take globals.
+            timing = timeit.Timer(eval('lambda: ' + params['call'],
+                                       namespace))
+        number = params['number']
+        result['call_ns'] = min(timing.repeat(3, number)) / number * 1e9
+
+print(json.dumps(result))
+'''
+
+
+def run_child(params, python=None):
+    '''Run a measurement in a fresh interpreter and return its results.'''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + [path for path in [env.get('PYTHONPATH')] if path])
+    output = subprocess.check_output(
+        [python or sys.executable, '-c', CHILD, json.dumps(params)],
+        env=env, stderr=subprocess.STDOUT)
+    return json.loads(output.decode().splitlines()[-1])
+
+
+def measure(path, module, call, repeat, number, baseline_rss=None):
+    '''Measure import time, memory, and call overhead of a module.'''
+    params = {'path': path, 'module': module, 'call': call,
+              'number': number, 'mode': 'time'}
+    runs = [run_child(params) for _ in range(repeat)]
+    result = {'import_s': _summarize([run['import_s'] for run in runs])}
+    if call:
+        result['first_call_s'] = _summarize(
+            [run['first_call_s'] for run in runs])
+        result['call_ns'] = min(run['call_ns'] for run in runs)
+    params['mode'] = 'memory'
+    result.update(run_child(params))
+    if baseline_rss is not None and result['rss_kb'] is not None:
+        result['rss_delta_kb'] = result['rss_kb'] - baseline_rss
+    return result
+
+
+def _summarize(samples):
+    '''Return min and median of samples.'''
+    samples = sorted(samples)
+    return {'min': samples[0], 'median': samples[len(samples) // 2]}
+
+
+def generate_synthetic(name, size, directory, cbind_args):
+    '''Generate binding of a synthetic library; return time it takes.'''
+    header_path, library_path = synthetic.write_library(size, directory, name)
+    start = time.time()
+    subprocess.check_output(
+        [sys.executable, os.path.join(ROOT, 'bin', 'cbind'),
+         '-i', header_path,
+         '-o', os.path.join(directory, name + '.py'),
+         '-l', library_path] + list(cbind_args),
+        env=dict(os.environ, PYTHONPATH=ROOT), stderr=subprocess.STDOUT)
+    return time.time() - start
+
+
+def run(scales, fixtures=True, repeat=5, number=100000, cbind_args=()):
+    '''Run benchmarks and return the results.'''
+    results = {
+        'version': VERSION,
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.time(),
+        'cbind_args': list(cbind_args),
+        'repeat': repeat,
+        'cases': {},
+    }
+    baseline_rss = run_child({'path': ROOT, 'module': None, 'call': None,
+                              'number': number, 'mode': 'memory'})['rss_kb']
+    results['baseline_rss_kb'] = baseline_rss
+    cases = results['cases']
+
+    work_dir = tempfile.mkdtemp(prefix='cbind-benchmark-')
+    try:
+        for scale in scales:
+            case_name = 'synthetic_' + scale
+            size = synthetic.SCALES[scale]
+            case = cases[case_name] = {'size': size.to_dict()}
+            module = '%s_%s' % (synthetic.PREFIX, scale)
+            try:
+                case['generate_s'] = generate_synthetic(
+                    module, size, work_dir, cbind_args)
+                case['module_bytes'] = os.path.getsize(
+                    os.path.join(work_dir, module + '.py'))
+                case.update(measure(work_dir, module, SYNTHETIC_CALL,
+                                    repeat, number, baseline_rss))
+            except (OSError, subprocess.CalledProcessError) as exc:
+                case['error'] = format_error(exc)
+    finally:
+        shutil.rmtree(work_dir)
+
+    if fixtures:
+        for case_name, directory, module, call in FIXTURES:
+            path = os.path.join(ROOT, directory)
+            case = cases[case_name] = {}
+            try:
+                case.update(measure(path, module, call,
+                                    repeat, number, baseline_rss))
+            except (OSError, subprocess.CalledProcessError) as exc:
+                case['error'] = format_error(exc)
+
+    return results
+
+
+def format_error(exc):
+    '''Return the last line of error output of a failed case.'''
+    output = getattr(exc, 'output', None)
+    if output:
+        return output.decode().strip().splitlines()[-1]
+    return str(exc)
+
+
+def get_commit():
+    '''Return the commit of the source tree, or None.'''
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         cwd=ROOT, stderr=subprocess.STDOUT)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode().strip()
+
+
+def main():
+    '''Main function.'''
+    import argparse
+    parser = argparse.ArgumentParser(description='''
+            Benchmark import time, memory, and call overhead of generated
+            bindings.
+            ''')
+    parser.add_argument('-o', metavar='OUTPUT', default='-',
+                        help='output file, default to \'-\' (stdout)')
+    parser.add_argument('--scale', action='append',
+                        choices=sorted(synthetic.SCALES),
+                        help=('size of synthetic header; may be repeated, '
+                              'default to small and medium'))
+    parser.add_argument('--no-fixtures', action='store_true',
+                        help='skip fixtures of the source tree')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help=('number of imports of each module, default to '
+                              '%(default)s'))
+    parser.add_argument('--number', type=int, default=100000,
+                        help=('number of calls per timing, default to '
+                              '%(default)s'))
+    parser.add_argument('cbind_args', metavar='CBIND_ARGS',
+                        nargs=argparse.REMAINDER,
+                        help=('arguments passed to cbind when generating '
+                              'synthetic bindings, after \'--\''))
+    args = parser.parse_args()
+    cbind_args = args.cbind_args
+    if cbind_args and cbind_args[0] == '--':
+        cbind_args = cbind_args[1:]
+
+    results = run(args.scale or ['small', 'medium'],
+                  fixtures=not args.no_fixtures,
+                  repeat=args.repeat,
+                  number=args.number,
+                  cbind_args=cbind_args)
+    text = json.dumps(results, indent=2, sort_keys=True) + '\n'
+    if args.o == '-':
+        sys.stdout.write(text)
+    else:
+        with open(args.o, 'w') as output:
+            output.write(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
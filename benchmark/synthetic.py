@@ -0,0 +1,269 @@
+# Copyright (C) 2013 Che-Liang Chiou.
+
+'''Generate synthetic C headers (and their sources) of controllable size.'''
+
+import os
+import subprocess
+import sys
+
+# Prefix of names of synthetic declarations
+PREFIX = 'bench'
+
+# Number of enum constants per enum
+ENUM_SIZE = 64
+
+
+class Size(object):
+    '''Size of a synthetic header.
+
+    Records and typedefs are spread over the included headers, if any; the
+    main header has the enums, macros, and functions.
+    '''
+
+    FIELDS = ('functions', 'structs', 'unions', 'typedef_chains',
+              'anonymous', 'enum_constants', 'macros', 'includes', 'depth')
+
+    # pylint: disable=R0913
+    def __init__(self, functions=0, structs=0, unions=0, typedef_chains=0,
+                 anonymous=0, enum_constants=0, macros=0, includes=0,
+                 depth=1):
+        '''Initialize the object.'''
+        self.functions = functions
+        self.structs = structs
+        self.unions = unions
+        self.typedef_chains = typedef_chains
+        self.anonymous = anonymous
+        self.enum_constants = enum_constants
+        self.macros = macros
+        self.includes = includes
+        self.depth = max(depth, 1)
+
+    def to_dict(self):
+        '''Return the size as a dict.'''
+        return dict((name, getattr(self, name)) for name in self.FIELDS)
+
+
+# Preset sizes
+SCALES = {
+    'small': Size(functions=100, structs=20, unions=10, typedef_chains=10,
+                  anonymous=10, enum_constants=100, macros=100, includes=2,
+                  depth=2),
+    'medium': Size(functions=1000, structs=200, unions=100,
+                   typedef_chains=100, anonymous=100, enum_constants=1000,
+                   macros=1000, includes=4, depth=3),
+    'large': Size(functions=10000, structs=2000, unions=1000,
+                  typedef_chains=1000, anonymous=1000, enum_constants=10000,
+                  macros=10000, includes=8, depth=4),
+}
+
+
+def generate_headers(size, name):
+    '''Return list of (file name, contents) of headers of a size.
+
+    The first one is the main header, which includes the others.  There
+    are size.structs struct chains, each of which nests size.depth structs
+    by value; size.unions unions; size.typedef_chains chains of
+    size.depth typedefs; size.anonymous structs of anonymous members and
+    typedef'ed anonymous structs; size.enum_constants constants in enums of
+    ENUM_SIZE constants; size.macros macros of constants, expressions, and
+    strings; and size.functions functions taking an int or a pointer to
+    one of the records.
+    '''
+    includes = [[] for _ in range(size.includes)]
+
+    def get_lines(i):
+        '''Return lines of a header to which the i-th record goes.'''
+        return includes[i % len(includes)] if includes else lines
+
+    lines = []
+    for i in range(0, size.enum_constants, ENUM_SIZE):
+        lines.append('enum %s_enum_%d {' % (PREFIX, i // ENUM_SIZE))
+        for j in range(i, min(i + ENUM_SIZE, size.enum_constants)):
+            lines.append('    %s_E%d = %d,' % (PREFIX.upper(), j, j))
+        lines.extend(['};', ''])
+    for i in range(size.structs):
+        for level in range(size.depth):
+            get_lines(i).extend(_make_struct(i, level))
+    for i in range(size.unions):
+        get_lines(i).extend(['union %s_u%d {' % (PREFIX, i),
+                             '    int i;',
+                             '    double d;',
+                             '    char bytes[8];',
+                             '};',
+                             ''])
+    for i in range(size.typedef_chains):
+        target = 'int'
+        for level in range(size.depth):
+            get_lines(i).append('typedef %s %s_t%d_%d;' %
+                                (target, PREFIX, i, level))
+            target = '%s_t%d_%d' % (PREFIX, i, level)
+        get_lines(i).append('')
+    for i in range(size.anonymous):
+        get_lines(i).extend(['struct %s_a%d {' % (PREFIX, i),
+                             '    struct {',
+                             '        int x;',
+                             '        int y;',
+                             '    } point;',
+                             '    union {',
+                             '        int i;',
+                             '        float f;',
+                             '    } value;',
+                             '};',
+                             '',
+                             'typedef struct {',
+                             '    int a;',
+                             '} %s_anon%d_t;' % (PREFIX, i),
+                             ''])
+    for i in range(size.macros):
+        lines.append('#define %s' % _make_macro(i))
+    if size.macros:
+        lines.append('')
+    for i in range(size.functions):
+        lines.append('%s;' % _make_prototype(size, i)[0])
+    lines.append('')
+
+    headers = [('%s_inc%d.h' % (name, k), _wrap_header(name, k, contents))
+               for k, contents in enumerate(includes)]
+    include_lines = ['#include "%s"' % header_name
+                     for header_name, _ in headers]
+    if include_lines:
+        include_lines.append('')
+    main = (name + '.h', _wrap_header(name, None, include_lines + lines))
+    return [main] + headers
+
+
+def generate_source(size, header_name):
+    '''Return C source that defines functions of the header.'''
+    lines = ['/* Generated by benchmark/synthetic.py */',
+             '#include "%s"' % header_name,
+             '']
+    for i in range(size.functions):
+        prototype, body = _make_prototype(size, i)
+        lines.append('%s { %s }' % (prototype, body))
+    lines.append('')
+    return '\n'.join(lines)
+
+
+def _wrap_header(name, index, lines):
+    '''Add a comment and include guard to lines of a header.'''
+    guard = '%s_H' % name.upper()
+    if index is not None:
+        guard = '%s_INC%d_H' % (name.upper(), index)
+    return '\n'.join(['/* Generated by benchmark/synthetic.py */',
+                      '#ifndef %s' % guard,
+                      '#define %s' % guard,
+                      ''] + lines + ['#endif', ''])
+
+
+def _make_struct(i, level):
+    '''Return lines of a struct of a chain.'''
+    lines = ['struct %s_s%d_%d {' % (PREFIX, i, level)]
+    if level > 0:
+        lines.append('    struct %s_s%d_%d inner;' % (PREFIX, i, level - 1))
+    lines.extend(['    int id;',
+                  '    double value;',
+                  '    char name[16];',
+                  '};',
+                  ''])
+    return lines
+
+
+def _make_macro(i):
+    '''Return the i-th macro, without "#define".'''
+    name = '%s_M%d' % (PREFIX.upper(), i)
+    if i % 3 == 1:
+        return '%s (%s_M%d + %d)' % (name, PREFIX.upper(), i - 1, i)
+    if i % 3 == 2:
+        return '%s "%s%d"' % (name, PREFIX, i)
+    return '%s %d' % (name, i)
+
+
+def _make_prototype(size, i):
+    '''Return prototype and body of the i-th function.'''
+    kind = i % 4
+    if kind == 1 and size.structs:
+        struct = '%s_s%d_%d' % (PREFIX, i // 4 % size.structs,
+                                size.depth - 1)
+        return ('int %s_fn%d(struct %s *arg)' % (PREFIX, i, struct),
+                'return arg->id;')
+    if kind == 2 and size.unions and size.typedef_chains:
+        union = '%s_u%d' % (PREFIX, i // 4 % size.unions)
+        restype = '%s_t%d_%d' % (PREFIX, i // 4 % size.typedef_chains,
+                                 size.depth - 1)
+        return ('%s %s_fn%d(union %s *arg)' % (restype, PREFIX, i, union),
+                'return arg->i;')
+    if kind == 3 and size.anonymous:
+        struct = '%s_a%d' % (PREFIX, i // 4 % size.anonymous)
+        return ('int %s_fn%d(struct %s *arg)' % (PREFIX, i, struct),
+                'return arg->point.x;')
+    return ('int %s_fn%d(int arg)' % (PREFIX, i), 'return arg + %d;' % i)
+
+
+def write_headers(size, directory, name):
+    '''Write headers of a size; return path to the main header.'''
+    headers = generate_headers(size, name)
+    for header_name, contents in headers:
+        with open(os.path.join(directory, header_name), 'w') as header:
+            header.write(contents)
+    return os.path.join(directory, headers[0][0])
+
+
+def write_library(size, directory, name):
+    '''Write headers, source, and shared library of a size.
+
+    Return paths to the main header and the library.  The C compiler is the
+    CC environment variable, default to cc.
+    '''
+    header_path = write_headers(size, directory, name)
+    source_path = os.path.join(directory, name + '.c')
+    library_path = os.path.join(directory, 'lib%s.so' % name)
+    with open(source_path, 'w') as source:
+        source.write(generate_source(size, os.path.basename(header_path)))
+    subprocess.check_call([os.environ.get('CC', 'cc'),
+                           '-shared', '-fPIC', '-O0',
+                           '-o', library_path, source_path])
+    return header_path, library_path
+
+
+def main():
+    '''Write synthetic headers and source to a directory.'''
+    import argparse
+    parser = argparse.ArgumentParser(description='''
+            Generate synthetic C headers of controllable size.
+            ''')
+    parser.add_argument('-o', metavar='DIR', default='.',
+                        help='output directory, default to %(default)s')
+    parser.add_argument('--name', default=PREFIX,
+                        help='name of the main header, default to %(default)s')
+    parser.add_argument('--scale', choices=sorted(SCALES),
+                        help='preset size')
+    for name in Size.FIELDS:
+        parser.add_argument('--' + name.replace('_', '-'), type=int,
+                            help='override %s of the preset size' % name)
+    parser.add_argument('--library', action='store_true',
+                        help=('also write C source that defines the '
+                              'functions, and compile it into a library'))
+    args = parser.parse_args()
+    size = make_size(args)
+    if args.library:
+        paths = write_library(size, args.o, args.name)
+    else:
+        paths = [write_headers(size, args.o, args.name)]
+    for path in paths:
+        sys.stdout.write(path + '\n')
+    return 0
+
+
+def make_size(args):
+    '''Make size from parsed --scale and overriding arguments.'''
+    base = SCALES.get(args.scale) or Size()
+    values = base.to_dict()
+    for name in Size.FIELDS:
+        value = getattr(args, name, None)
+        if value is not None:
+            values[name] = value
+    return Size(**values)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,257 @@
+# Copyright (C) 2013 Che-Liang Chiou.
+
+'''Benchmark throughput of each stage of binding generation.
+
+Every scale of synthetic headers (see benchmark.synthetic) is processed in
+a fresh interpreter, which times parsing, each pass (including those that
+match configuration), generation, and macro parsing, and reports nodes per
+second of each stage and peak RSS.  Exponents of how stage times grow with
+nodes between consecutive scales reveal superlinear stages.
+
+Passes are timed with a profiling pass manager, which runs every pass in a
+traversal of its own, and so pass times are those of unfused passes; the
+parse_fused stage is the time of parse() as cbind runs it, with passes
+sharing traversals.  Configuration is matched only by passes; generation
+reads the annotations that they attach.
+'''
+
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmark import synthetic
+from benchmark.import_time import ROOT, VERSION, format_error, get_commit
+
+
+# Timer of stages
+_timer = getattr(time, 'perf_counter', time.time)
+
+# Exponent of growth above which a stage is reported as superlinear
+SUPERLINEAR = 1.2
+
+# Configuration that exercises matchers of every node of synthetic headers
+CONFIG = {
+    'import': [{'name': '^(%s|%s)' % (synthetic.PREFIX,
+                                      synthetic.PREFIX.upper())}],
+    'rename': [{'name': r'^%s_s(\d+)_0$' % synthetic.PREFIX,
+                'rename': r'%s_leaf\1' % synthetic.PREFIX}],
+    'errcheck': [{'restype': '^c_int$', 'errcheck': 'check_int'}],
+    'mixin': [{'name': '^%s_u' % synthetic.PREFIX,
+               'mixin': ['UnionMixin']}],
+    'enum': [{'parent': {'name': '^%s_enum_' % synthetic.PREFIX},
+              'enum': '{enum_field} = {enum_value}'}],
+}
+
+# Passes that match configuration
+CONFIG_PASSES = ('rename', 'batch', 'enum', 'errcheck', 'method', 'mixin')
+
+
+def run_scale(scale, work_dir, clang_args=None):
+    '''Time stages of generating binding of a scale in this interpreter.'''
+    from cbind.codegen.emitter import Emitter, MemorySink
+    from cbind.ctypes_binding import CtypesBindingGenerator
+    from cbind.macro import MacroGenerator
+    from cbind.passes.manager import PassManager
+
+    size = synthetic.SCALES[scale]
+    name = '%s_%s' % (synthetic.PREFIX, scale)
+    header_path = synthetic.write_headers(size, work_dir, name)
+
+    # Time parse() with fused passes first, and drop it before the profiled
+    # run so that it does not add to the peak RSS.
+    cbgen = CtypesBindingGenerator()
+    cbgen.config(CONFIG)
+    start = _timer()
+    cbgen.parse(header_path, args=clang_args)
+    parse_fused_s = _timer() - start
+    del cbgen
+
+    cbgen = CtypesBindingGenerator()
+    cbgen.pass_manager = PassManager(profile=True)
+    cbgen.config(CONFIG)
+    start = _timer()
+    cbgen.parse(header_path, args=clang_args)
+    parse_s = _timer() - start
+    pass_times = cbgen.pass_manager.pass_times
+    node_counts = cbgen.pass_manager.node_counts
+    nodes = [0]
+
+    def count(_):
+        '''Count a node.'''
+        nodes[0] += 1
+
+    cbgen.syntax_tree_forest[0].traverse(preorder=count)
+    nodes = nodes[0]
+
+    stages = {}
+    # Parsing is the rest of parse() after passes.
+    stages['parse'] = _make_stage(parse_s - sum(pass_times.values()), nodes)
+    stages['parse_fused'] = _make_stage(parse_fused_s, nodes)
+    for pass_name, seconds in pass_times.items():
+        stages['pass.' + pass_name] = _make_stage(seconds,
+                                                  node_counts[pass_name])
+    config_passes = [pass_name for pass_name in pass_times
+                     if pass_name in CONFIG_PASSES]
+    stages['config'] = _make_stage(
+        sum(pass_times[pass_name] for pass_name in config_passes),
+        sum(node_counts[pass_name] for pass_name in config_passes))
+
+    sink = MemorySink()
+    output = Emitter(sink)
+    start = _timer()
+    cbgen.generate(output)
+    output.flush()
+    stages['generate'] = _make_stage(_timer() - start, nodes)
+
+    mcgen = MacroGenerator(session=cbgen.syntax_tree_forest.session)
+    start = _timer()
+    mcgen.parse(header_path, clang_args)
+    stages['macro_parse'] = _make_stage(_timer() - start,
+                                        len(mcgen.symbol_table))
+
+    return {
+        'size': size.to_dict(),
+        'nodes': nodes,
+        'output_bytes': len(sink.getvalue()),
+        'peak_rss_kb': _get_peak_rss(),
+        'stages': stages,
+    }
+
+
+def _make_stage(seconds, nodes):
+    '''Return metrics of a stage.'''
+    return {'seconds': seconds,
+            'nodes': nodes,
+            'nodes_per_s': nodes / seconds if seconds > 0 else None}
+
+
+def _get_peak_rss():
+    '''Return peak RSS of this process in kilobytes, or None.'''
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def get_scaling(cases, scales):
+    '''Return exponents of growth of stage times between scales.
+
+    An exponent of 1 means that the time of a stage grows linearly with the
+    number of nodes it processes; greater exponents mean superlinear.
+    '''
+    scaling = {}
+    scales = [scale for scale in scales if 'error' not in cases[scale]]
+    scales.sort(key=lambda scale: cases[scale]['nodes'])
+    for small, large in zip(scales, scales[1:]):
+        exponents = scaling['%s-%s' % (small, large)] = {}
+        for stage, metrics in cases[large]['stages'].items():
+            base = cases[small]['stages'].get(stage)
+            if (not base or base['seconds'] <= 0 or metrics['seconds'] <= 0 or
+                    not base['nodes'] or metrics['nodes'] <= base['nodes']):
+                continue
+            exponents[stage] = (
+                math.log(metrics['seconds'] / base['seconds']) /
+                math.log(float(metrics['nodes']) / base['nodes']))
+    return scaling
+
+
+def run(scales, clang_args=()):
+    '''Run every scale in a fresh interpreter and return the results.'''
+    results = {
+        'version': VERSION,
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.time(),
+        'clang_args': list(clang_args),
+        'cases': {},
+    }
+    cases = {}
+    work_dir = tempfile.mkdtemp(prefix='cbind-benchmark-')
+    try:
+        for scale in scales:
+            command = [sys.executable, '-m', 'benchmark.throughput',
+                       '--child', scale, '--work-dir', work_dir]
+            if clang_args:
+                command.append('--')
+                command.extend(clang_args)
+            try:
+                output = subprocess.check_output(
+                    command, cwd=ROOT, stderr=subprocess.STDOUT,
+                    env=dict(os.environ, PYTHONPATH=ROOT))
+                cases[scale] = json.loads(output.decode().splitlines()[-1])
+            except (OSError, subprocess.CalledProcessError) as exc:
+                cases[scale] = {'error': format_error(exc)}
+    finally:
+        shutil.rmtree(work_dir)
+    results['scaling'] = get_scaling(cases, list(scales))
+    for scale, case in cases.items():
+        results['cases']['throughput_' + scale] = case
+    return results
+
+
+def report_superlinear(scaling, output):
+    '''Write stages whose exponents of growth exceed SUPERLINEAR.'''
+    for scales, exponents in sorted(scaling.items()):
+        for stage, exponent in sorted(exponents.items()):
+            if exponent > SUPERLINEAR:
+                output.write('%s: stage %s grows superlinearly (n^%.2f)\n' %
+                             (scales, stage, exponent))
+
+
+def main():
+    '''Main function.'''
+    import argparse
+    parser = argparse.ArgumentParser(description='''
+            Benchmark throughput of each stage of binding generation.
+            ''')
+    parser.add_argument('-o', metavar='OUTPUT', default='-',
+                        help='output file, default to \'-\' (stdout)')
+    parser.add_argument('--scale', action='append',
+                        choices=sorted(synthetic.SCALES),
+                        help=('size of synthetic headers; may be repeated, '
+                              'default to all sizes'))
+    parser.add_argument('--child', metavar='SCALE',
+                        help='(internal) run one scale in this process')
+    parser.add_argument('--work-dir', help=argparse.SUPPRESS)
+    parser.add_argument('clang_args', metavar='CCARGS',
+                        nargs=argparse.REMAINDER,
+                        help='arguments passed to clang, after \'--\'')
+    args = parser.parse_args()
+    clang_args = args.clang_args
+    if clang_args and clang_args[0] == '--':
+        clang_args = clang_args[1:]
+
+    if args.child:
+        result = run_scale(args.child, args.work_dir, clang_args or None)
+        sys.stdout.write(json.dumps(result) + '\n')
+        return 0
+
+    scales = args.scale or sorted(synthetic.SCALES, key=_count)
+    results = run(scales, clang_args=clang_args)
+    report_superlinear(results['scaling'], sys.stderr)
+    text = json.dumps(results, indent=2, sort_keys=True) + '\n'
+    if args.o == '-':
+        sys.stdout.write(text)
+    else:
+        with open(args.o, 'w') as output:
+            output.write(text)
+    return 0
+
+
+def _count(scale):
+    '''Return total number of declarations of a scale.'''
+    return sum(synthetic.SCALES[scale].to_dict().values())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
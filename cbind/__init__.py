@@ -38,8 +38,27 @@ def _parse_args(args=None):
                         help='choose cindex implementation')
     parser.add_argument('-l', metavar='LIBRARY',
                         help='library name; use default loader codes')
+    parser.add_argument('--backend', default='ctypes',
+                        choices=['ctypes', 'cffi'],
+                        help=('generate binding of ctypes or cffi (in ABI '
+                              'mode), default to %(default)s'))
     parser.add_argument('--assert-layout', action='store_true',
                         help='generate assertions of struct layout')
+    parser.add_argument('--package', action='store_true',
+                        help=('write a package, which has one module per '
+                              'source file, to the OUTPUT directory'))
+    parser.add_argument('--lazy', action='store_true',
+                        help=('look up and set up functions on their first '
+                              'call rather than at import'))
+    parser.add_argument('--alias-types', action='store_true',
+                        help=('define pointer, array, and function types '
+                              'once as module-level aliases'))
+    parser.add_argument('--numpy-dtype', action='store_true',
+                        help=('generate NumPy structured dtype of structs '
+                              'and unions'))
+    parser.add_argument('--bulk-readers', action='store_true',
+                        help=('generate helpers of viewing buffers as, and '
+                              'reading into, arrays of structs and unions'))
     parser.add_argument('--severity', default='warning',
                         choices=['ignored',
                                  'note',
@@ -51,6 +70,18 @@ def _parse_args(args=None):
                               'to %(default)s'))
     parser.add_argument('--enable-c++', dest='enable_cpp', action='store_true',
                         help='enable C++ translation (experimental)')
+    parser.add_argument('--cache-dir', metavar='DIR',
+                        help=('cache parsed translation units in this '
+                              'directory'))
+    parser.add_argument('--parse-function-bodies', action='store_true',
+                        help=('parse function bodies, which are skipped by '
+                              'default since bindings need only declarations'))
+    parser.add_argument('-j', metavar='N', type=int, default=1,
+                        help=('parse source files with N worker processes, '
+                              'default to %(default)s'))
+    parser.add_argument('--pch', metavar='PRELUDE',
+                        help=('precompile this header and include it before '
+                              'every source file'))
 
     description = ('Translate C macros into Python codes (experimental). '
                    'The PATTERN argument will match macro name.')
@@ -73,12 +104,25 @@ def _parse_args(args=None):
 def main(args=None):
     '''Main function.'''
     import logging
-    import sys
 
     parser, args = _parse_args(args=args)
     if not args.i:
         parser.print_usage()
         return 0
+    if args.package and args.o == '-':
+        parser.error('--package requires an output directory')
+    if args.backend == 'cffi':
+        options = [option for option, value in (
+            ('--assert-layout', args.assert_layout),
+            ('--package', args.package),
+            ('--lazy', args.lazy),
+            ('--alias-types', args.alias_types),
+            ('--numpy-dtype', args.numpy_dtype),
+            ('--bulk-readers', args.bulk_readers),
+            ('--enable-c++', args.enable_cpp)) if value]
+        if options:
+            parser.error('%s not supported by cffi backend' %
+                         ', '.join(options))
 
     logging.basicConfig(format='%(filename)s: %(message)s')
     if args.v > 0:
@@ -92,37 +136,62 @@ def main(args=None):
     choose_cindex_impl(args.cindex)
     from cbind.cindex import Diagnostic
     from cbind.codegen import CodeGen
+    from cbind.codegen.emitter import make_emitter
     from cbind.ctypes_binding import CtypesBindingGenerator
     from cbind.macro import MacroGenerator
-    from cbind.source import SyntaxTree
+    from cbind.source import ParseSession, SyntaxTree
 
     CodeGen.ENABLE_CPP = args.enable_cpp
     CodeGen.ASSERT_LAYOUT = args.assert_layout
+    CodeGen.LAZY = args.lazy
+    CodeGen.ALIAS_TYPES = args.alias_types
+    CodeGen.NUMPY_DTYPE = args.numpy_dtype
+    CodeGen.BULK_READERS = args.bulk_readers
     SyntaxTree.SEVERITY = getattr(Diagnostic, args.severity.capitalize())
 
-    cbgen = CtypesBindingGenerator()
+    if args.cache_dir:
+        from cbind.cache import TranslationUnitCache
+        session = ParseSession(cache=TranslationUnitCache(args.cache_dir))
+    else:
+        session = ParseSession()
+
+    cbgen = CtypesBindingGenerator(
+        session=session, declarations_only=not args.parse_function_bodies,
+        backend=args.backend)
     if args.config:
         try:
             import yaml
         except ImportError:
             parser.error('could not load Python package yaml')
-        cbgen.config(yaml.load(args.config))
-
-    for c_src in args.i:
-        cbgen.parse(c_src, args=clang_args)
-    if args.enable_macro:
-        mcgen = MacroGenerator(macro_int=args.macro_int)
-        for c_src in args.i:
-            mcgen.parse(c_src, args=clang_args)
-
-    if args.o == '-':
-        output = sys.stdout
-    else:
-        output = open(args.o, 'w')
-    with output:
-        cbgen.generate_preamble(parser.prog, args.l, output)
-        cbgen.generate(output)
+        config = yaml.load(args.config)
+        if args.backend == 'cffi' and 'batch' in config:
+            parser.error('batch configuration not supported by cffi backend')
+        cbgen.config(config)
+
+    try:
+        if args.pch:
+            session.add_prelude(args.pch, args=clang_args)
+        cbgen.parse_all(args.i, args=clang_args, jobs=args.j)
+        mcgen = None
         if args.enable_macro:
-            mcgen.generate(output)
+            mcgen = MacroGenerator(macro_int=args.macro_int, session=session)
+            for c_src in args.i:
+                mcgen.parse(c_src, args=clang_args)
+
+        if args.package:
+            cbgen.generate_package(parser.prog, args.l, args.o,
+                                   macro_generator=mcgen)
+        else:
+            # Output file is replaced only if all codes are generated.
+            with make_emitter(args.o) as output:
+                cbgen.generate_preamble(parser.prog, args.l, output)
+                cbgen.generate(output)
+                if mcgen:
+                    mcgen.generate(output)
+        annotation_table = cbgen.syntax_tree_forest.annotation_table
+        logging.info('Annotations use %d bytes',
+                     annotation_table.memory_usage())
+    finally:
+        session.close()
 
     return 0
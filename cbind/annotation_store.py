@@ -0,0 +1,113 @@
+# Copyright (C) 2013 Che-Liang Chiou.
+
+'''Columnar store of annotations of syntax tree nodes.'''
+
+import sys
+
+import cbind.annotations as annotations
+
+
+class AnnotationStore(object):
+    '''Store annotations in one column per annotation name.
+
+    Nodes are identified by their (small integer) key id.  Boolean
+    annotations are stored in bitsets, in which a node has two bits: whether
+    it is annotated and the value; the other annotations are stored in
+    sparse columns.  Looking up an annotation never inserts anything.
+
+    The generation is increased whenever a name annotation is changed, so
+    that results derived from names may be cached until then.
+    '''
+
+    BOOL_KEYS = frozenset((annotations.DECLARED,
+                           annotations.DEFINED,
+                           annotations.FORWARD_DECLARATION,
+                           annotations.REQUIRED))
+
+    NAME_KEYS = frozenset((annotations.NAME, annotations.ORIGINAL_NAME))
+
+    def __init__(self):
+        '''Initialize the object.'''
+        self.generation = 0
+        self._masks = dict((key, bytearray()) for key in self.BOOL_KEYS)
+        self._bits = dict((key, bytearray()) for key in self.BOOL_KEYS)
+        self._values = {}
+
+    def get(self, node, key, default):
+        '''Return annotation of a node, or default if it is not annotated.'''
+        if key in self.BOOL_KEYS:
+            if not _get_bit(self._masks[key], node):
+                return default
+            return _get_bit(self._bits[key], node)
+        column = self._values.get(key)
+        if column is None:
+            return default
+        return column.get(node, default)
+
+    def set(self, node, key, value):
+        '''Annotate a node.'''
+        if key in self.BOOL_KEYS:
+            _set_bit(self._masks[key], node, True)
+            _set_bit(self._bits[key], node, value)
+        else:
+            self._values.setdefault(key, {})[node] = value
+            if key in self.NAME_KEYS:
+                self.generation += 1
+
+    def update(self, node, node_annotations):
+        '''Annotate a node with a dict of annotations.'''
+        for key, value in node_annotations.items():
+            self.set(node, key, value)
+
+    def get_nodes(self, key):
+        '''Return an iterator of nodes whose boolean annotation is true.'''
+        # A bit is set only if its mask bit is.
+        return _iter_bits(self._bits[key])
+
+    def items(self):
+        '''Return a list of (node, dict of annotations) pairs.'''
+        table = {}
+        for key, mask in self._masks.items():
+            bits = self._bits[key]
+            for node in _iter_bits(mask):
+                table.setdefault(node, {})[key] = _get_bit(bits, node)
+        for key, column in self._values.items():
+            for node, value in column.items():
+                table.setdefault(node, {})[key] = value
+        return list(table.items())
+
+    def memory_usage(self):
+        '''Return approximate number of bytes used by the store.'''
+        size = sys.getsizeof(self._values)
+        for bitset in list(self._masks.values()) + list(self._bits.values()):
+            size += sys.getsizeof(bitset)
+        for column in self._values.values():
+            size += sys.getsizeof(column)
+        return size
+
+
+def _get_bit(bitset, index):
+    '''Test a bit of a bitset.'''
+    byte = index >> 3
+    return byte < len(bitset) and bool(bitset[byte] & (1 << (index & 7)))
+
+
+def _set_bit(bitset, index, value):
+    '''Set a bit of a bitset, growing it if needed.'''
+    byte = index >> 3
+    if byte >= len(bitset):
+        bitset.extend(bytearray(max(byte + 1, 2 * len(bitset)) - len(bitset)))
+    if value:
+        bitset[byte] |= 1 << (index & 7)
+    else:
+        bitset[byte] &= ~(1 << (index & 7)) & 0xff
+
+
+def _iter_bits(bitset):
+    '''Generate indexes of bits that are set.'''
+    for byte, bits in enumerate(bitset):
+        if not bits:
+            continue
+        for bit in range(8):
+            if bits & (1 << bit):
+                yield (byte << 3) | bit
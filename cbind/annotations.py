@@ -2,6 +2,7 @@
 
 '''List of annotation names.'''
 
+BATCH = 'batch'
 DECLARED = 'declared'
 DEFINED = 'defined'
 ENUM = 'enum'
@@ -0,0 +1,220 @@
+# Copyright (C) 2013 Che-Liang Chiou.
+
+'''Persistent cache of parsed translation units.'''
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+from cbind.cindex import (TranslationUnitLoadError,
+                          TranslationUnitSaveError,
+                          get_clang_version)
+
+
+class TranslationUnitCache:
+    '''Save translation units to a directory and load them back.
+
+    An entry is keyed by the path and contents of the main file, the clang
+    arguments, the parse options, and the libclang version.  An entry also
+    records the absolute path, modification time, size, and digest of every
+    included file (and of the precompiled header, if any), and it is not
+    used if any of them has changed since.  Like git, contents are digested
+    again only if modification time and size do not tell, i.e., the time
+    differs, or the file was modified around the time the entry was saved.
+    '''
+
+    def __init__(self, directory):
+        '''Initialize the object.'''
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+
+    def load(self, index, path, args, unsaved_files, options):
+        '''Return a translation unit and its diagnostics, or None.'''
+        entry = self._get_entry(path, args, unsaved_files, options)
+        manifest = _read_manifest(entry + '.json')
+        if (manifest is None or
+                not _check_dependencies(manifest['dependencies'],
+                                        manifest['saved_at'])):
+            self.misses += 1
+            return None
+        try:
+            tunit = index.read(entry + '.ast')
+        except TranslationUnitLoadError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        logging.info('Load %s from cache', path)
+        diagnostics = [tuple(diag) for diag in manifest['diagnostics']]
+        return tunit, diagnostics
+
+    def save(self, tunit, diagnostics, path, args, unsaved_files, options):
+        '''Save a translation unit and its diagnostics.'''
+        entry = self._get_entry(path, args, unsaved_files, options)
+        unsaved_names = frozenset(name for name, _ in unsaved_files or ())
+        saved_at = time.time()
+        dependencies = {}
+        for inclusion in tunit.get_includes():
+            name = inclusion.include.name
+            if name in unsaved_names:
+                continue
+            name = _resolve(name, path)
+            if name not in dependencies:
+                dependencies[name] = _fingerprint(name)
+        for name in _get_pch_paths(args):
+            name = os.path.abspath(name)
+            dependencies[name] = _fingerprint(name)
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        try:
+            self._write(entry + '.ast', tunit.save)
+        except TranslationUnitSaveError:
+            logging.info('Could not save %s to cache', path)
+            return
+        manifest = {
+            'path': path,
+            'saved_at': saved_at,
+            'dependencies': sorted(dependencies.items()),
+            'diagnostics': diagnostics,
+        }
+        self._write(entry + '.json',
+                    lambda tmp_path: _write_manifest(tmp_path, manifest))
+
+    def get_ast_path(self, path, args, unsaved_files, options):
+        '''Return path to the saved AST file, or None if not saved.'''
+        ast_path = self._get_entry(path, args, unsaved_files, options) + '.ast'
+        if not os.path.exists(ast_path):
+            return None
+        return ast_path
+
+    def _get_entry(self, path, args, unsaved_files, options):
+        '''Return path (without suffix) of the cache entry.'''
+        if self._version is None:
+            self._version = get_clang_version()
+        digest = hashlib.sha1()
+        _update(digest, self._version)
+        _update(digest, str(options))
+        _update(digest, os.path.abspath(path))
+        for arg in args or ():
+            _update(digest, arg)
+        if unsaved_files:
+            for name, contents in unsaved_files:
+                _update(digest, name)
+                _update(digest, contents)
+        else:
+            with open(path, 'rb') as source:
+                _update(digest, source.read())
+        return os.path.join(self.directory, digest.hexdigest())
+
+    def _write(self, path, write):
+        '''Write a file atomically.'''
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            write(tmp_path)
+            _replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+# os.replace() is not available in Python 2.7
+_replace = getattr(os, 'replace', os.rename)  # pylint: disable=C0103
+
+
+def _update(digest, data):
+    '''Add data to the digest; data are separated by NUL character.'''
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    digest.update(data)
+    digest.update(b'\0')
+
+
+# Modification times this close to the time an entry was saved are not
+# trusted, as a file could be modified again within the resolution of
+# timestamps (seconds on some file systems) without changing them.
+RACY_SECONDS = 2
+
+
+def _resolve(name, path):
+    '''Return absolute path of an included file.
+
+    Clang names included files relative to the working directory of the
+    parse; fall back to the directory of the main file.
+    '''
+    if os.path.isabs(name):
+        return name
+    if os.path.exists(name):
+        return os.path.abspath(name)
+    return os.path.join(os.path.dirname(os.path.abspath(path)), name)
+
+
+def _stat(path):
+    '''Return (mtime, size) of a file, or None if it is unavailable.'''
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime, stat.st_size]
+
+
+def _digest(path):
+    '''Return SHA-1 digest of contents of a file, or None.'''
+    digest = hashlib.sha1()
+    try:
+        with open(path, 'rb') as input_file:
+            for block in iter(lambda: input_file.read(65536), b''):
+                digest.update(block)
+    except (IOError, OSError):
+        return None
+    return digest.hexdigest()
+
+
+def _fingerprint(path):
+    '''Return (mtime, size, digest) of a file, or None.'''
+    stat = _stat(path)
+    if stat is None:
+        return None
+    return stat + [_digest(path)]
+
+
+def _get_pch_paths(args):
+    '''Return paths of precompiled headers in clang arguments.'''
+    args = list(args or ())
+    return [args[i + 1] for i in range(len(args) - 1)
+            if args[i] == '-include-pch']
+
+
+def _check_dependencies(dependencies, saved_at):
+    '''Check if dependent files are not changed.'''
+    for name, fingerprint in dependencies:
+        if fingerprint is None:
+            return False
+        mtime, size, digest = fingerprint
+        stat = _stat(name)
+        if stat is None or stat[1] != size:
+            return False
+        if stat[0] == mtime and mtime < saved_at - RACY_SECONDS:
+            continue
+        if digest is None or _digest(name) != digest:
+            return False
+    return True
+
+
+def _read_manifest(path):
+    '''Read the manifest of a cache entry.'''
+    try:
+        with open(path) as manifest_file:
+            return json.load(manifest_file)
+    except (IOError, ValueError):
+        return None
+
+
+def _write_manifest(path, manifest):
+    '''Write the manifest of a cache entry.'''
+    with open(path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file)
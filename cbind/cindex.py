@@ -12,14 +12,24 @@ if cbind.choose_cindex_impl() == cbind.MIN_CINDEX:
                                   Type, TypeKind,
                                   LinkageKind,
                                   RefQualifierKind)
+    from cbind.min_cindex_helper import (TranslationUnit,
+                                         TranslationUnitLoadError,
+                                         TranslationUnitSaveError,
+                                         get_clang_version)
 else:
     from cbind.clang_cindex import (Index,
                                     Cursor, CursorKind,
                                     Diagnostic,
                                     Type, TypeKind,
                                     LinkageKind,
-                                    RefQualifierKind)
+                                    RefQualifierKind,
+                                    TranslationUnit,
+                                    TranslationUnitLoadError,
+                                    TranslationUnitSaveError,
+                                    get_clang_version)
 
 
 __all__ = ['Index', 'Cursor', 'CursorKind', 'Diagnostic',
-           'Type', 'TypeKind', 'LinkageKind', 'RefQualifierKind']
+           'Type', 'TypeKind', 'LinkageKind', 'RefQualifierKind',
+           'TranslationUnit', 'TranslationUnitLoadError',
+           'TranslationUnitSaveError', 'get_clang_version']
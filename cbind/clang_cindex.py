@@ -9,17 +9,27 @@ from clang.cindex import (Index,
                           CursorKind,
                           Diagnostic,
                           RefQualifierKind,
+                          TranslationUnit,
+                          TranslationUnitLoadError,
+                          TranslationUnitSaveError,
                           Type,
                           TypeKind)
 
 
 __all__ = ['Index', 'Cursor', 'CursorKind', 'Diagnostic',
-           'Type', 'TypeKind', 'LinkageKind', 'RefQualifierKind']
+           'Type', 'TypeKind', 'LinkageKind', 'RefQualifierKind',
+           'TranslationUnit', 'TranslationUnitLoadError',
+           'TranslationUnitSaveError', 'get_clang_version']
 
 
 # Register libclang function.
 _cindex.register_function(_cindex.conf.lib,
                           ('clang_getCursorLinkage', [Cursor], c_uint), False)
+_cindex.register_function(_cindex.conf.lib,
+                          ('clang_getClangVersion', [],
+                           _cindex._CXString,
+                           _cindex._CXString.from_result),
+                          False)  # pylint: disable=W0212
 
 
 class LinkageKind:  # pylint: disable=R0903
@@ -60,5 +70,16 @@ def _cursor_linkage_kind(self):
     return LinkageKind(_cindex.conf.lib.clang_getCursorLinkage(self))
 
 
+def _cursor_hash(self):
+    '''Call clang_hashCursor().'''
+    return _cindex.conf.lib.clang_hashCursor(self)
+
+
+Cursor.__hash__ = _cursor_hash
 Cursor.get_num_arguments = _cursor_get_num_arguments
 Cursor.linkage_kind = property(_cursor_linkage_kind)
+
+
+def get_clang_version():
+    '''Call clang_getClangVersion().'''
+    return _cindex.conf.lib.clang_getClangVersion()
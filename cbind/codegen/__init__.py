@@ -1,13 +1,86 @@
 # Copyright (C) 2013 Che-Liang Chiou.
 
-'''Generate ctypes binding from syntax tree.'''
+'''Generate binding from syntax tree.
 
-from cbind.codegen.helper import gen_tree_node, gen_record
+Bindings are generated by a backend: ctypes, which is the default, or cffi
+(in ABI mode).  Both are generated from the same annotated syntax tree.
+'''
+
+from cbind.cindex import CursorKind
+from cbind.codegen.emitter import make_emitter
+from cbind.codegen.ctypes_runtime import (HEADER,
+                                          LOAD_LIBRARY,
+                                          METHOD_DESCRIPTOR,
+                                          LAZY_FUNCTION,
+                                          BATCH_FUNCTOR,
+                                          NUMPY_DTYPE,
+                                          BULK_READERS,
+                                          LAYOUT_TABLE)
+from cbind.codegen.helper import gen_tree_node, gen_record, gen_enum_header
+from cbind.codegen.type_alias import TypeAliases
 from cbind.codegen.helper import make_function_argtypes, make_function_restype
 import cbind.annotations as annotations
 
 
-class CodeGen:
+CTYPES = 'ctypes'
+CFFI = 'cffi'
+
+
+def make_codegen(backend=None):
+    '''Make code generator of a backend.'''
+    if backend in (None, CTYPES):
+        return CodeGen()
+    if backend == CFFI:
+        from cbind.codegen.cffi_backend import CffiCodeGen
+        return CffiCodeGen()
+    raise ValueError('Unknown backend: %s' % backend)
+
+
+class BaseCodeGen(object):
+    '''Interface of code generators of backends.
+
+    The binding generator writes HEADER, followed by the preamble and
+    LOAD_LIBRARY, which loads the library into _lib, and then calls
+    generate_runtime before generating syntax trees.
+    '''
+
+    # Name of the backend
+    BACKEND = None
+
+    # Header and library loader codes
+    HEADER = None
+    LOAD_LIBRARY = None
+
+    def set_output(self, output):
+        '''Set output emitter.'''
+        raise NotImplementedError
+
+    def flush(self):
+        '''Write buffered codes to the output.'''
+        raise NotImplementedError
+
+    def generate_runtime(self, config):
+        '''Generate helper classes that the binding uses.'''
+        raise NotImplementedError
+
+    def generate(self, tree):
+        '''Generate binding of a syntax tree.'''
+        raise NotImplementedError
+
+    def generate_record_definition(self, tree):
+        '''Generate definition of record.'''
+        raise NotImplementedError
+
+    def generate_record_forward_decl(self, tree):
+        '''Generate forward declaration of record.'''
+        raise NotImplementedError
+
+    def generate_type_declaration(self, tree):
+        '''Generate class of user-defined type, leaving out its body.'''
+        raise NotImplementedError
+
+
+class CodeGen(BaseCodeGen):
     '''Generate ctypes binding from syntax tree.'''
 
     # Generate C++ bindings
@@ -18,6 +91,22 @@ class CodeGen:
 
     ASSERT_LAYOUT = False
 
+    # Look up functions in the library on their first use
+    LAZY = False
+
+    # Define compound types once as module-level aliases
+    ALIAS_TYPES = False
+
+    # Generate NumPy dtype of structs and unions
+    NUMPY_DTYPE = False
+
+    # Generate helpers of reading arrays of structs and unions
+    BULK_READERS = False
+
+    BACKEND = CTYPES
+    HEADER = HEADER
+    LOAD_LIBRARY = LOAD_LIBRARY
+
     make_function_argtypes = staticmethod(make_function_argtypes)
     make_function_restype = staticmethod(make_function_restype)
 
@@ -25,12 +114,34 @@ class CodeGen:
         self.output = None
 
     def set_output(self, output):
-        '''Set output buffer.'''
-        self.output = output
+        '''Set output emitter; a file object is wrapped in an emitter.'''
+        self.output = make_emitter(output)
+        if self.ALIAS_TYPES and self.output.type_aliases is None:
+            self.output.type_aliases = TypeAliases()
+
+    def flush(self):
+        '''Write buffered codes to the output.'''
+        self.output.flush()
+
+    def generate_runtime(self, config):
+        '''Generate helper classes.'''
+        if 'method' in config:
+            self.output.write(METHOD_DESCRIPTOR)
+        if 'batch' in config:
+            self.output.write(BATCH_FUNCTOR)
+        if self.LAZY:
+            self.output.write(LAZY_FUNCTION)
+        if self.ASSERT_LAYOUT:
+            self.output.write(LAYOUT_TABLE)
+        if self.NUMPY_DTYPE:
+            self.output.write(NUMPY_DTYPE)
+        if self.BULK_READERS:
+            self.output.write(BULK_READERS)
 
     def generate(self, tree):
         '''Generate ctypes binding of a syntax tree.'''
         gen_tree_node(tree, self.output)
+        self.output.end_chunk()
 
     def generate_record_definition(self, tree):
         '''Generate definition of record (struct, union, or class).'''
@@ -48,3 +159,18 @@ class CodeGen:
         declared = tree.get_annotation(annotations.DECLARED, False)
         gen_record(tree, self.output, declared=declared, declaration=True)
         tree.annotate(annotations.DECLARED, True)
+
+    def generate_type_declaration(self, tree):
+        '''Generate class of user-defined type, leaving out its body.'''
+        if not tree.get_annotation(annotations.REQUIRED, False):
+            return
+        if tree.get_annotation(annotations.DECLARED, False):
+            return
+        if tree.is_user_defined_pod_decl():
+            gen_record(tree, self.output, declared=False, declaration=True)
+        elif (tree.kind == CursorKind.ENUM_DECL and tree.is_definition() and
+              tree.name):
+            gen_enum_header(tree, self.output)
+        else:
+            return
+        tree.annotate(annotations.DECLARED, True)
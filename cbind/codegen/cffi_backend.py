@@ -0,0 +1,451 @@
+# Copyright (C) 2013 Che-Liang Chiou.
+
+'''Generate cffi ABI-mode binding from syntax tree.'''
+
+from cbind.cindex import CursorKind, TypeKind
+from cbind.codegen import CFFI, BaseCodeGen
+from cbind.codegen.emitter import Emitter, MemorySink, make_emitter
+import cbind.annotations as annotations
+
+
+HEADER = '''# This is generated by {progname} and should not be edited.
+
+import sys as _python_sys
+from cffi import FFI as _python_FFI
+
+ffi = _python_FFI()
+
+'''
+
+
+LOAD_LIBRARY = '''
+if _python_sys.platform == 'darwin':
+    _lib = ffi.dlopen('{darwin_library}')
+elif _python_sys.platform == 'win32' or _python_sys.platform == 'cygwin':
+    _lib = ffi.dlopen('{windows_library}')
+else:
+    _lib = ffi.dlopen('{posix_library}')
+
+'''
+
+
+# Structs and unions are wrapped in classes so that they may have mix-in
+# classes and methods; field access is forwarded to the cdata.  Renamed
+# fields are mapped from C names to Python names in _field_names_.
+CFFI_RECORD = '''
+class _CffiRecord(object):
+    _ctype_ = None
+    _field_names_ = {}
+
+    def __init__(self, cdata=None, **fields):
+        if cdata is None:
+            cdata = ffi.new(self._ctype_ + ' *')
+        object.__setattr__(self, '_cdata', cdata)
+        names = self._python_get_field_names()
+        for name, value in fields.items():
+            setattr(cdata, names.get(name, name), value)
+
+    @classmethod
+    def _python_get_field_names(cls):
+        names = cls.__dict__.get('_python_field_names')
+        if names is None:
+            fields = ffi.typeof(cls._ctype_).fields or ()
+            names = dict((cls._field_names_.get(name, name), name)
+                         for name, _ in fields)
+            cls._python_field_names = names
+        return names
+
+    def __getattr__(self, name):
+        if name == '_cdata':
+            raise AttributeError(name)
+        return getattr(self._cdata,
+                       self._python_get_field_names().get(name, name))
+
+    def __setattr__(self, name, value):
+        names = self._python_get_field_names()
+        if name in names:
+            setattr(self._cdata, names[name], value)
+        else:
+            object.__setattr__(self, name, value)
+
+'''
+
+
+CFFI_FUNCTOR = '''
+import functools as _python_functools
+
+class _CffiFunctor(object):
+    def __init__(self, functor, by_value=False):
+        self.functor = functor
+        self.by_value = by_value
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self.functor
+        cdata = obj._cdata[0] if self.by_value else obj._cdata
+        return _python_functools.partial(self.functor, cdata)
+
+'''
+
+
+CFFI_ERRCHECK = '''
+class _CffiErrcheck(object):
+    __slots__ = ('function', 'errcheck')
+
+    def __init__(self, function, errcheck):
+        self.function = function
+        self.errcheck = errcheck
+
+    def __call__(self, *args):
+        return self.errcheck(self.function(*args), self.function, args)
+
+'''
+
+
+# Map of clang type to C type that cffi understands
+C_TYPE_MAP = {
+    TypeKind.VOID:              'void',
+    TypeKind.BOOL:              '_Bool',
+    TypeKind.CHAR_U:            'char',
+    TypeKind.UCHAR:             'unsigned char',
+    TypeKind.CHAR16:            'char16_t',
+    TypeKind.CHAR32:            'char32_t',
+    TypeKind.USHORT:            'unsigned short',
+    TypeKind.UINT:              'unsigned int',
+    TypeKind.ULONG:             'unsigned long',
+    TypeKind.ULONGLONG:         'unsigned long long',
+    TypeKind.CHAR_S:            'char',
+    TypeKind.SCHAR:             'signed char',
+    TypeKind.WCHAR:             'wchar_t',
+    TypeKind.SHORT:             'short',
+    TypeKind.INT:               'int',
+    TypeKind.LONG:              'long',
+    TypeKind.LONGLONG:          'long long',
+    TypeKind.FLOAT:             'float',
+    TypeKind.DOUBLE:            'double',
+    TypeKind.LONGDOUBLE:        'long double',
+}
+
+# Typedef'ed types that cffi knows, which must not be declared again
+COMMON_TYPES = frozenset(
+    ['size_t', 'ssize_t', 'ptrdiff_t', 'wchar_t', 'char16_t', 'char32_t',
+     'intptr_t', 'uintptr_t', 'intmax_t', 'uintmax_t'] +
+    ['%sint%s%d_t' % (sign, kind, width)
+     for sign in ('', 'u')
+     for kind in ('', '_least', '_fast')
+     for width in (8, 16, 32, 64)])
+
+# Indent by 4 speces
+INDENT = '    '
+
+# Name of the library
+LIBNAME = '_lib'
+
+
+class CffiCodeGen(BaseCodeGen):
+    '''Generate cffi ABI-mode binding from syntax tree.
+
+    C declarations are collected into one cdef, which is written, ahead of
+    the Python codes, when the output is flushed.  Names of the Python
+    codes honor rename annotations, while the cdef uses names of C sources
+    (functions and variables are looked up by their symbols).
+    '''
+
+    BACKEND = CFFI
+    HEADER = HEADER
+    LOAD_LIBRARY = LOAD_LIBRARY
+
+    def __init__(self):
+        self.output = None
+        self._target = None
+        self._cdefs = []
+
+    def set_output(self, output):
+        '''Set output emitter; Python codes are buffered until flushed.'''
+        self._target = make_emitter(output)
+        self.output = Emitter(MemorySink())
+        self._cdefs = []
+
+    def flush(self):
+        '''Write the cdef and buffered Python codes to the output.'''
+        self.output.flush()
+        if self._cdefs:
+            self._target.write('ffi.cdef(\'\'\'\n%s\'\'\')\n\n' %
+                               ''.join(self._cdefs))
+        self._target.write(self.output.sink.getvalue())
+        self._target.flush()
+        self.output = Emitter(MemorySink())
+        self._cdefs = []
+
+    def generate_runtime(self, config):
+        '''Generate helper classes.'''
+        if 'batch' in config:
+            raise ValueError('batch configuration not supported by cffi '
+                             'backend')
+        self.output.write(CFFI_RECORD)
+        if 'method' in config:
+            self.output.write(CFFI_FUNCTOR)
+        if 'errcheck' in config:
+            self.output.write(CFFI_ERRCHECK)
+
+    def generate(self, tree):
+        '''Generate cffi binding of a syntax tree.'''
+        if not tree.get_annotation(annotations.REQUIRED, False):
+            return
+        # Do not define a node twice.
+        if tree.get_annotation(annotations.DEFINED, False):
+            return
+        declaration = False
+        if tree.kind == CursorKind.TYPEDEF_DECL:
+            written = self._make_typedef(tree)
+        elif tree.kind == CursorKind.FUNCTION_DECL:
+            written = self._make_function(tree)
+        elif tree.is_user_defined_pod_decl():
+            declaration = not tree.is_definition()
+            written = self._make_record(tree, declaration)
+        elif tree.kind == CursorKind.ENUM_DECL and tree.is_definition():
+            written = self._make_enum(tree)
+        elif tree.kind == CursorKind.VAR_DECL:
+            written = self._make_var(tree)
+        else:
+            return
+        if written:
+            self.output.write('\n')
+        if declaration:
+            tree.annotate(annotations.DECLARED, True)
+        else:
+            tree.annotate(annotations.DEFINED, True)
+        self.output.end_chunk()
+
+    def generate_record_definition(self, tree):
+        '''Generate definition of record (struct or union).'''
+        self._make_record(tree, False)
+        tree.annotate(annotations.DECLARED, True)
+        tree.annotate(annotations.DEFINED, True)
+
+    def generate_record_forward_decl(self, tree):
+        '''Generate forward declaration of record (struct or union).'''
+        if not tree.get_annotation(annotations.REQUIRED, False):
+            return
+        if not tree.get_annotation(annotations.FORWARD_DECLARATION, False):
+            return
+        self._make_record(tree, True)
+        tree.annotate(annotations.DECLARED, True)
+
+    def generate_type_declaration(self, tree):
+        '''Generate class of record, leaving out its body.'''
+        if not tree.get_annotation(annotations.REQUIRED, False):
+            return
+        if tree.get_annotation(annotations.DECLARED, False):
+            return
+        if not tree.is_user_defined_pod_decl():
+            return
+        self._make_record(tree, True)
+        tree.annotate(annotations.DECLARED, True)
+
+    def _make_typedef(self, tree):
+        '''Generate cdef of a typedef, and alias of a record class.'''
+        type_ = tree.underlying_typedef_type
+        # Handle special case "typedef void foo;"
+        if type_.kind == TypeKind.VOID or tree.original_name in COMMON_TYPES:
+            return False
+        self._cdefs.append('typedef %s;\n' %
+                           make_declarator(type_, tree.original_name))
+        # Other types are referred by their C names through ffi.
+        canonical = type_.get_canonical()
+        if not canonical.is_user_defined_type():
+            return False
+        decl = canonical.get_declaration()
+        if not decl.is_user_defined_pod_decl():
+            return False
+        self.output.write('%s = %s\n' % (tree.name, decl.name))
+        return True
+
+    def _make_function(self, tree):
+        '''Generate cdef and Python binding of a function declaration.'''
+        if not tree.is_external_linkage():
+            return False
+        self._cdefs.append('%s;\n' % make_declarator(
+            tree.result_type,
+            '%s(%s)' % (tree.spelling, _make_parameters(tree))))
+
+        name = tree.name
+        function = '%s.%s' % (LIBNAME, tree.spelling)
+        errcheck = tree.get_annotation(annotations.ERRCHECK, False)
+        if errcheck:
+            function = '_CffiErrcheck(%s, %s)' % (function, errcheck)
+        self.output.write('%s = %s\n' % (name, function))
+
+        method = tree.get_annotation(annotations.METHOD, False)
+        if method:
+            args = list(tree.get_arguments())
+            by_value = (args and
+                        args[0].type.get_canonical().kind == TypeKind.RECORD)
+            if by_value:
+                fmt = '%s = _CffiFunctor(%s, True)\n'
+            else:
+                fmt = '%s = _CffiFunctor(%s)\n'
+            self.output.write(fmt % (method, name))
+        return True
+
+    def _make_record(self, tree, declaration):
+        '''Generate cdef and class of a struct or union.'''
+        tag = make_tag(tree)
+        fields = tuple(tree.get_field_declaration())
+        if declaration or not fields:
+            # cffi does not accept empty bodies; declare it as opaque.
+            self._cdefs.append('%s;\n' % tag)
+        else:
+            self._cdefs.append('%s {\n%s};\n' % (
+                tag, ''.join('%s%s;\n' % (INDENT, _make_field(field))
+                             for field in fields)))
+        field_names = '' if declaration else _make_field_names(fields)
+        if tree.get_annotation(annotations.DECLARED, False):
+            if not field_names:
+                return False
+            self.output.write('%s._field_names_ = %s\n' %
+                              (tree.name, field_names))
+            return True
+        mixin = tuple(tree.get_annotation(annotations.MIXIN, ()))
+        self.output.write(
+            'class {name}({bases}):\n{indent}_ctype_ = \'{tag}\'\n'.format(
+                name=tree.name, indent=INDENT, tag=tag,
+                bases=', '.join(mixin + ('_CffiRecord',))))
+        if field_names:
+            self.output.write('%s_field_names_ = %s\n' %
+                              (INDENT, field_names))
+        return True
+
+    def _make_enum(self, tree):
+        '''Generate cdef of an enum and Python enum constants.'''
+        enumerators = ''.join('%s%s = %d,\n' % (INDENT, enum.original_name,
+                                                enum.enum_value)
+                              for enum in tree.get_children())
+        if tree.original_name:
+            enum_type = make_tag(tree)
+            self._cdefs.append('%s {\n%s};\n' % (enum_type, enumerators))
+        else:
+            enum_type = make_declarator(tree.enum_type, '')
+            self._cdefs.append('enum {\n%s};\n' % enumerators)
+        written = False
+        for enum in tree.get_children():
+            if not enum.get_annotation(annotations.REQUIRED, False):
+                continue
+            fmt = enum.get_annotation(annotations.ENUM,
+                                      '{enum_field} = {enum_value}')
+            self.output.write(fmt.format(enum_name=tree.name,
+                                         enum_type=enum_type,
+                                         enum_field=enum.name,
+                                         enum_value=enum.enum_value))
+            self.output.write('\n')
+            written = True
+        return written
+
+    def _make_var(self, tree):
+        '''Generate cdef of a variable and pointer to it.'''
+        self._cdefs.append('%s;\n' %
+                           make_declarator(tree.type, tree.spelling))
+        self.output.write('{0} = ffi.addressof({1}, \'{2}\')\n'.format(
+            tree.name, LIBNAME, tree.spelling))
+        return True
+
+
+def make_tag(tree):
+    '''Return C name of a struct, union, or enum, like "struct foo".'''
+    if tree.kind == CursorKind.UNION_DECL:
+        keyword = 'union'
+    elif tree.kind == CursorKind.ENUM_DECL:
+        keyword = 'enum'
+    else:
+        keyword = 'struct'
+    return '%s %s' % (keyword, tree.original_name)
+
+
+def make_declarator(type_, declarator):
+    '''Generate C declaration of declarator of a type.
+
+    Typedefs are expanded (except those known to cffi) so that the cdef does
+    not depend on the order of typedefs.
+    '''
+    kind = type_.kind
+    if kind == TypeKind.TYPEDEF:
+        name = type_.get_declaration().original_name
+        if name in COMMON_TYPES:
+            return _join(name, declarator)
+        return make_declarator(type_.get_canonical(), declarator)
+    if kind == TypeKind.POINTER:
+        pointee = type_.get_pointee()
+        if pointee.get_canonical().kind in (TypeKind.CONSTANTARRAY,
+                                            TypeKind.INCOMPLETEARRAY,
+                                            TypeKind.FUNCTIONPROTO,
+                                            TypeKind.FUNCTIONNOPROTO):
+            declarator = '(*%s)' % declarator
+        else:
+            declarator = '*' + declarator
+        return make_declarator(pointee, declarator)
+    if kind == TypeKind.CONSTANTARRAY:
+        return make_declarator(type_.get_array_element_type(),
+                               '%s[%d]' % (declarator,
+                                           type_.get_array_size()))
+    if kind == TypeKind.INCOMPLETEARRAY:
+        return make_declarator(type_.get_array_element_type(),
+                               '%s[]' % declarator)
+    if kind in (TypeKind.FUNCTIONPROTO, TypeKind.FUNCTIONNOPROTO):
+        if kind == TypeKind.FUNCTIONNOPROTO:
+            params = ''
+        else:
+            params = [make_declarator(arg, '')
+                      for arg in type_.get_argument_types()]
+            if type_.is_function_variadic():
+                params.append('...')
+            params = ', '.join(params) or 'void'
+        return make_declarator(type_.get_result(),
+                               '%s(%s)' % (declarator, params))
+    if type_.is_user_defined_type():
+        decl = type_.get_declaration()
+        if decl.is_user_defined_type_decl() and decl.original_name:
+            return _join(make_tag(decl), declarator)
+        if decl.kind == CursorKind.ENUM_DECL:
+            # Anonymous enum
+            return make_declarator(decl.enum_type, declarator)
+        canonical = type_.get_canonical()
+        if canonical.kind != kind:
+            return make_declarator(canonical, declarator)
+    c_type = C_TYPE_MAP.get(kind)
+    if c_type is None:
+        raise TypeError('Unsupported TypeKind: %s' % kind)
+    return _join(c_type, declarator)
+
+
+def _make_parameters(tree):
+    '''Generate parameter list of a function declaration.'''
+    if tree.type.kind == TypeKind.FUNCTIONNOPROTO:
+        return ''
+    params = [make_declarator(arg.type, '') for arg in tree.get_arguments()]
+    if tree.type.is_function_variadic():
+        params.append('...')
+    return ', '.join(params) or 'void'
+
+
+def _make_field(field):
+    '''Generate C declaration of a field, which keeps its C name.'''
+    decl = make_declarator(field.type, field.spelling)
+    if field.is_bitfield():
+        decl += ' : %d' % field.get_bitfield_width()
+    return decl
+
+
+def _make_field_names(fields):
+    '''Generate the map of renamed fields, or '' if none is renamed.'''
+    items = ['%r: %r' % (field.spelling, field.name) for field in fields
+             if field.name != field.spelling]
+    if not items:
+        return ''
+    return '{%s}' % ', '.join(items)
+
+
+def _join(c_type, declarator):
+    '''Join type specifier and declarator.'''
+    if declarator:
+        return '%s %s' % (c_type, declarator)
+    return c_type
@@ -0,0 +1,275 @@
+# Copyright (C) 2013 Che-Liang Chiou.
+
+'''Runtime codes of ctypes binding.'''
+
+
+HEADER = '''# This is generated by {progname} and should not be edited.
+
+import sys as _python_sys
+from ctypes import *
+
+'''
+
+
+LOAD_LIBRARY = '''
+if _python_sys.platform == 'darwin':
+    _lib = cdll.LoadLibrary('{darwin_library}')
+elif _python_sys.platform == 'win32' or _python_sys.platform == 'cygwin':
+    _lib = cdll.LoadLibrary('{windows_library}')
+else:
+    _lib = cdll.LoadLibrary('{posix_library}')
+
+'''
+
+
+METHOD_DESCRIPTOR = '''
+import types as _python_types
+
+class _CtypesFunctor(object):
+    def __init__(self, functor):
+        self.functor = functor
+
+    def _get_functor(self):
+        # Unwrap a lazy function so that it is looked up only once.
+        resolve = getattr(self.functor, '_resolve', None)
+        if resolve is not None:
+            self.functor = resolve()
+        return self.functor
+
+    if _python_sys.version_info.major == 3:
+        def __get__(self, obj, objtype=None):
+            if obj is None:
+                return self._get_functor()
+            else:
+                return _python_types.MethodType(self._get_functor(), obj)
+
+    else:
+        def __get__(self, obj, objtype=None):
+            return _python_types.MethodType(self._get_functor(), obj,
+                                            objtype)
+
+'''
+
+
+LAZY_FUNCTION = '''
+class _LazyFunction(object):
+    __slots__ = ('_namespace', '_name', '_symbol', '_get_attrs', '_function')
+
+    def __init__(self, namespace, name, symbol, get_attrs):
+        self._namespace = namespace
+        self._name = name
+        self._symbol = symbol
+        self._get_attrs = get_attrs
+        self._function = None
+
+    def _resolve(self):
+        if self._function is None:
+            function = getattr(_lib, self._symbol)
+            for attr, value in self._get_attrs().items():
+                setattr(function, attr, value)
+            self._function = function
+            if self._namespace.get(self._name) is self:
+                self._namespace[self._name] = function
+        return self._function
+
+    def __call__(self, *args):
+        return self._resolve()(*args)
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+    def __setattr__(self, attr, value):
+        if attr in _LazyFunction.__slots__:
+            object.__setattr__(self, attr, value)
+        else:
+            setattr(self._resolve(), attr, value)
+
+'''
+
+
+# Batch wrappers take sequences of arguments and return a list of results.
+# If every value is of the Python type that ctypes passes as its argument
+# type by default (int as c_int, float as c_double, and strings as pointers
+# to char or wchar_t), the values are passed to a function object without
+# argtypes, which skips the conversion that argtypes makes on every call.
+# Otherwise the wrapper calls a function object with argtypes, as a plain
+# loop would.  Function objects are the wrapper's own, without errcheck, and
+# are looked up on first call under lazy mode.
+BATCH_FUNCTOR = '''
+import ctypes as _python_ctypes
+
+_python_batch_types = {
+    _python_ctypes.c_int: int,
+    _python_ctypes.c_double: float,
+    _python_ctypes.c_char_p: bytes,
+    _python_ctypes.c_wchar_p: type(u''),
+}
+
+class _BatchFunctor(object):
+    def __init__(self, symbol, argtypes, restype, lazy=False):
+        self.symbol = symbol
+        self.argtypes = argtypes
+        self.restype = restype
+        self.python_types = [_python_batch_types.get(argtype)
+                             for argtype in argtypes]
+        self.functions = None
+        if not lazy:
+            self._resolve()
+
+    def _resolve(self):
+        if self.functions is None:
+            typed, untyped = _lib[self.symbol], _lib[self.symbol]
+            typed.argtypes = self.argtypes
+            typed.restype = untyped.restype = self.restype
+            self.functions = (typed, untyped)
+        return self.functions
+
+    def __call__(self, *args):
+        if len(args) != len(self.argtypes):
+            raise TypeError('expect %d sequences of arguments' %
+                            len(self.argtypes))
+        count = len(args[0]) if args else 0
+        if any(len(arg) != count for arg in args):
+            raise ValueError('expect sequences of the same length')
+        typed, untyped = self._resolve()
+        function = untyped
+        for python_type, arg in zip(self.python_types, args):
+            if python_type is None or \\
+                    not all(type(value) is python_type for value in arg):
+                function = typed
+                break
+        rows = zip(*args)
+        if self.restype is None:
+            for row in rows:
+                function(*row)
+            return None
+        return [function(*row) for row in rows]
+
+'''
+
+
+# NumPy is imported on first access to the dtype of a record.  A run of bit
+# fields sharing a storage unit becomes one field, named after all of them
+# (e.g. 'a|b'), of the type of the storage unit.
+NUMPY_DTYPE = '''
+import ctypes as _python_ctypes
+
+class _NumpyDtype(object):
+    def __init__(self, offsets, itemsize):
+        self.offsets = offsets
+        self.itemsize = itemsize
+        self.dtype = None
+
+    def __get__(self, obj, cls):
+        if self.dtype is None:
+            import numpy
+            names, formats, offsets = [], [], []
+            last_bitfield_offset = None
+            for field, offset in zip(cls._fields_, self.offsets):
+                if len(field) == 3 and offset == last_bitfield_offset:
+                    names[-1] += '|' + field[0]
+                    continue
+                if len(field) == 3:
+                    last_bitfield_offset = offset
+                else:
+                    last_bitfield_offset = None
+                names.append(field[0])
+                formats.append(_python_numpy_format(numpy, field[1]))
+                offsets.append(offset)
+            self.dtype = numpy.dtype({'names': names,
+                                      'formats': formats,
+                                      'offsets': offsets,
+                                      'itemsize': self.itemsize})
+        return self.dtype
+
+
+def _python_numpy_format(numpy, ctype):
+    dtype = getattr(ctype, '_numpy_dtype_', None)
+    if dtype is not None:
+        return dtype
+    if issubclass(ctype, _python_ctypes.Array):
+        return (_python_numpy_format(numpy, ctype._type_), (ctype._length_,))
+    if (issubclass(ctype, (_python_ctypes._Pointer,
+                           _python_ctypes._CFuncPtr)) or
+            ctype in (c_void_p, c_char_p, c_wchar_p)):
+        return numpy.uintp
+    return numpy.dtype(ctype)
+
+'''
+
+
+# read_array returns the whole records of one read, which may be fewer than
+# count, like os.read does; it reads again only to complete a partial record,
+# and a file that ends in the middle of a record is an error.  Records are
+# read into a new buffer, or into the buffer given by the caller, which the
+# returned array shares.
+BULK_READERS = '''
+import os as _python_os
+
+class _BulkRecordMixin(object):
+
+    @classmethod
+    def array_from_buffer(cls, buffer, count=None, offset=0):
+        if count is None:
+            count = (memoryview(buffer).nbytes - offset) // sizeof(cls)
+        return (cls * count).from_buffer(buffer, offset)
+
+    @classmethod
+    def read_array(cls, file, count, buffer=None):
+        record_size = sizeof(cls)
+        size = count * record_size
+        if buffer is None:
+            buffer = bytearray(size)
+        view = memoryview(buffer).cast('B')
+        if len(view) < size:
+            raise ValueError('buffer is smaller than %d records' % count)
+        view = view[:size]
+        nbytes = _python_read_into(file, view) or 0
+        while nbytes % record_size:
+            chunk_size = _python_read_into(file, view[nbytes:])
+            if not chunk_size:
+                raise EOFError('%s: read %d bytes of a %d-byte record' %
+                               (cls.__name__, nbytes % record_size,
+                                record_size))
+            nbytes += chunk_size
+        return cls.array_from_buffer(buffer, nbytes // record_size)
+
+
+def _python_read_into(file, view):
+    if not isinstance(file, int):
+        # Buffered files fill the view unless asked for one raw read.
+        return getattr(file, 'readinto1', file.readinto)(view)
+    if hasattr(_python_os, 'readv'):
+        return _python_os.readv(file, [view])
+    data = _python_os.read(file, len(view))
+    view[:len(data)] = data
+    return len(data)
+
+'''
+
+
+LAYOUT_TABLE = '''
+import os as _python_os
+
+_python_layouts = []
+
+
+def _python_check_layouts(layouts):
+    for cls, _, _, offsets in layouts:
+        for name, offset in offsets:
+            assert getattr(cls, name).offset == offset, \\
+                '%s.%s.offset == %d' % (cls.__name__, name, offset)
+
+'''
+
+
+# Entries of the layout table are (class, size, alignment, field offsets).
+# Only offsets are checked since ctypes does not know about the trailing
+# padding of C++ classes.
+#
+# Set CBIND_SKIP_LAYOUT_CHECK to skip the check at import; you may still
+# call _python_check_layouts(_python_layouts) on demand.
+CHECK_LAYOUTS = '''
+if not _python_os.environ.get('CBIND_SKIP_LAYOUT_CHECK'):
+    _python_check_layouts(_python_layouts)
+'''
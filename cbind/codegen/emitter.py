@@ -0,0 +1,174 @@
+# Copyright (C) 2013 Che-Liang Chiou.
+
+'''Buffer generated codes and write them to a sink in large blocks.'''
+
+import os
+import stat
+import sys
+import tempfile
+
+from cbind.compatibility import StringIO
+
+
+class Emitter(object):
+    '''Collect generated codes and write them to a sink in large blocks.
+
+    Codes are collected in chunks; a chunk usually holds the codes of one
+    declaration.  When a chunk ends and the collected codes exceed the
+    block size, they are joined and written to the sink in one call.
+    '''
+
+    BLOCK_SIZE = 64 * 1024
+
+    def __init__(self, sink, block_size=None):
+        '''Initialize the object.'''
+        self.sink = sink
+        self.block_size = block_size or self.BLOCK_SIZE
+        # Table of type aliases of this output, if we alias types
+        self.type_aliases = None
+        self._pieces = []
+        self._size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(commit=exc_type is None)
+
+    def write(self, codes):
+        '''Append codes to the current chunk.'''
+        self._pieces.append(codes)
+        self._size += len(codes)
+
+    def end_chunk(self):
+        '''End the current chunk; write codes if they fill a block.'''
+        if self._size >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        '''Write all collected codes to the sink.'''
+        if self._pieces:
+            self.sink.write(''.join(self._pieces))
+            self._pieces = []
+            self._size = 0
+
+    def close(self, commit=True):
+        '''Flush codes and close the sink, or discard them if not commit.'''
+        if commit:
+            self.flush()
+        else:
+            self._pieces = []
+            self._size = 0
+        self.sink.close(commit=commit)
+
+
+class StreamSink(object):
+    '''Write to a file object, such as sys.stdout, which is not closed.'''
+
+    def __init__(self, stream):
+        '''Initialize the object.'''
+        self.stream = stream
+
+    def write(self, block):
+        '''Write a block.'''
+        self.stream.write(block)
+
+    def close(self, commit=True):
+        '''Flush the stream.'''
+        # pylint: disable=W0613
+        self.stream.flush()
+
+
+class FileSink(StreamSink):
+    '''Write to a file, which is opened and closed by the sink.'''
+
+    def __init__(self, path):
+        '''Initialize the object.'''
+        super(FileSink, self).__init__(open(path, 'w'))
+
+    def close(self, commit=True):
+        '''Close the file.'''
+        # pylint: disable=W0613
+        self.stream.close()
+
+
+class MemorySink(StreamSink):
+    '''Write to a string buffer.'''
+
+    def __init__(self):
+        '''Initialize the object.'''
+        super(MemorySink, self).__init__(StringIO())
+
+    def getvalue(self):
+        '''Return codes written so far.'''
+        return self.stream.getvalue()
+
+
+class AtomicFileSink(StreamSink):
+    '''Write to a temporary file and rename it to the path on commit.
+
+    If the output is not committed, the temporary file is removed, and so
+    a failed run never leaves a partially written file at the path.
+    '''
+
+    def __init__(self, path):
+        '''Initialize the object.'''
+        self.path = path
+        # Create the temporary file in the same directory so that renaming
+        # it does not cross file systems.
+        fd, self.temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(path)),
+            prefix='.%s.' % os.path.basename(path),
+            suffix='.tmp')
+        super(AtomicFileSink, self).__init__(os.fdopen(fd, 'w'))
+
+    def close(self, commit=True):
+        '''Close the temporary file, and then rename or remove it.'''
+        if self.stream.closed:
+            return
+        try:
+            self.stream.close()
+            if commit:
+                # mkstemp creates files that only the owner may read; keep
+                # the mode of the file we replace, if any.
+                try:
+                    mode = stat.S_IMODE(os.stat(self.path).st_mode)
+                except OSError:
+                    mode = 0o666 & ~_UMASK
+                os.chmod(self.temp_path, mode)
+                _replace(self.temp_path, self.path)
+        finally:
+            if os.path.exists(self.temp_path):
+                os.remove(self.temp_path)
+
+
+def _get_umask():
+    '''Return the file mode creation mask of the process.'''
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# Read the umask once, at import time, since setting it (even briefly)
+# affects files that other threads create meanwhile.
+_UMASK = _get_umask()
+
+
+def make_emitter(output):
+    '''Return an emitter of an output path, file object, or emitter.'''
+    if isinstance(output, Emitter):
+        return output
+    if output == '-':
+        return Emitter(StreamSink(sys.stdout))
+    if isinstance(output, str):
+        return Emitter(AtomicFileSink(output))
+    return Emitter(StreamSink(output))
+
+
+def _replace(src, dst):
+    '''Rename src to dst, replacing dst if it exists.'''
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)  # pylint: disable=E1101
+    else:
+        # On POSIX, rename replaces dst atomically.
+        os.rename(src, dst)
@@ -3,6 +3,7 @@
 '''Generate ctypes binding from syntax tree.'''
 
 import logging
+from collections import namedtuple
 
 from cbind.cindex import CursorKind, TypeKind
 from cbind.mangler import mangle
@@ -68,6 +69,9 @@ BUILTIN_TYPEDEFS = {
     'wchar_t': 'c_wchar_t',
 }
 
+# Layout of a record; offsets are in bits
+Layout = namedtuple('Layout', 'size align offsets')
+
 # Indent by 4 speces
 INDENT = '    '
 
@@ -117,10 +121,25 @@ def gen_record(tree, output, declared=False, declaration=False):
                     _make_method(method, cls_name, output)
         if cbind.codegen.CodeGen.ASSERT_LAYOUT:
             _make_layout_assertion(tree, cls_name, output)
+        if cbind.codegen.CodeGen.NUMPY_DTYPE:
+            _make_numpy_dtype(tree, cls_name, output)
+
+
+def _alias_type(c_type, output):
+    '''Return alias of a type expression if the output aliases types.'''
+    type_aliases = getattr(output, 'type_aliases', None)
+    if type_aliases is None:
+        return c_type
+    return type_aliases.alias(c_type, output)
 
 
 def _make_type(type_):
     '''Generate ctypes binding of a clang type.'''
+    return type_.get_memoized('ctypes', _translate_type)
+
+
+def _translate_type(type_):
+    '''Translate a clang type into ctypes.'''
     c_type = None
     if type_.is_user_defined_type():
         tree = type_.get_declaration()
@@ -195,7 +214,8 @@ def _make_typedef(tree, output):
     # Handle special case "typedef void foo;"
     if type_.kind == TypeKind.VOID:
         return
-    output.write('%s = %s\n' % (tree.name, _make_type(type_)))
+    c_type = _alias_type(_make_type(type_), output)
+    output.write('%s = %s\n' % (tree.name, c_type))
 
 
 def _make_function(tree, output, cls_name=None):
@@ -210,17 +230,30 @@ def _make_function(tree, output, cls_name=None):
     else:
         name = tree.name
         symbol_name = tree.spelling
-    output.write('{0} = {1}.{2}\n'.format(name, LIBNAME, symbol_name))
-
-    argtypes = ', '.join(make_function_argtypes(tree))
+    attrs = []
+    argtypes = ', '.join(_alias_type(argtype, output)
+                         for argtype in make_function_argtypes(tree))
     if argtypes:
-        output.write('%s.argtypes = [%s]\n' % (name, argtypes))
+        attrs.append(('argtypes', '[%s]' % argtypes))
     if tree.result_type.kind != TypeKind.VOID:
-        restype = make_function_restype(tree)
-        output.write('%s.restype = %s\n' % (name, restype))
+        restype = _alias_type(make_function_restype(tree), output)
+        attrs.append(('restype', restype))
+    else:
+        restype = 'None'
     errcheck = tree.get_annotation(annotations.ERRCHECK, False)
     if errcheck:
-        output.write('%s.errcheck = %s\n' % (name, errcheck))
+        attrs.append(('errcheck', errcheck))
+
+    if cbind.codegen.CodeGen.LAZY and not cxx_method:
+        # Look up and set up the function on its first use.
+        output.write('{0} = _LazyFunction(globals(), \'{0}\', \'{1}\', '
+                     'lambda: dict({2}))\n'.format(
+                         name, symbol_name,
+                         ', '.join('%s=%s' % attr for attr in attrs)))
+    else:
+        output.write('{0} = {1}.{2}\n'.format(name, LIBNAME, symbol_name))
+        for attr, value in attrs:
+            output.write('%s.%s = %s\n' % (name, attr, value))
 
     method = tree.get_annotation(annotations.METHOD, False)
     if cxx_method:
@@ -233,9 +266,27 @@ def _make_function(tree, output, cls_name=None):
     elif method:
         output.write('%s = _CtypesFunctor(%s)\n' % (method, name))
 
+    batch = tree.get_annotation(annotations.BATCH, False)
+    if batch and not cxx_method:
+        if batch is True:
+            batch = '%s_batch' % name
+        # Batch wrapper calls its own function objects, without errcheck;
+        # under lazy mode it looks them up on first call.
+        if cbind.codegen.CodeGen.LAZY:
+            lazy = ', lazy=True'
+        else:
+            lazy = ''
+        output.write("{0} = _BatchFunctor('{1}', [{2}], {3}{4})\n".format(
+            batch, symbol_name, argtypes, restype, lazy))
+
 
 def make_function_argtypes(tree):
     '''Generate ctypes binding of function's arguments.'''
+    return tree.get_memoized('argtypes', _make_function_argtypes)
+
+
+def _make_function_argtypes(tree):
+    '''Translate types of function's arguments.'''
     if tree.type.is_function_variadic() or tree.get_num_arguments() <= 0:
         return ()
     return tuple(_make_type(arg.type) for arg in tree.get_arguments())
@@ -255,6 +306,8 @@ def _make_pod_header(tree, name, output):
     else:
         pod_kind = 'Structure'
     mixin = tree.get_annotation(annotations.MIXIN, ())
+    if cbind.codegen.CodeGen.BULK_READERS:
+        mixin = tuple(mixin) + ('_BulkRecordMixin',)
     if mixin:
         fmt = 'class {name}({mixin}, {kind}):\n{indent}pass\n'
     else:
@@ -268,45 +321,60 @@ def _make_pod_body(tree, name, output):
     fields = tuple(tree.get_field_declaration())
     if not fields:
         return
-    begin = '%s.' % name
-    field_stmt = '%s_fields_ = [' % begin
-    indent = ' ' * len(field_stmt)
-    output.write(field_stmt)
-    offset = tree.type.get_offset(fields[0].original_name.encode()) / 8
+    layout = get_layout(tree)
+    # Make fields before writing the statement since type aliases are
+    # written on first use.
+    field_stmts = []
+    offset = layout.offsets[0] // 8
     if offset != 0:
         # Add padding here; we probably encounter a vtable...
-        output.write('(\'__python_struct_padding\', c_char * %d)' % offset)
-        first = False
-    else:
-        first = True
+        field_stmts.append('(\'__python_struct_padding\', c_char * %d)' %
+                           offset)
     last_offset = -1  # Offsets of struct and class should be increasing
-    for field in fields:
-        offset = tree.type.get_offset(field.original_name.encode())
+    for field, offset in zip(fields, layout.offsets):
         assert tree.kind == CursorKind.UNION_DECL or last_offset < offset
         last_offset = offset
-        if not first:
-            output.write(',\n%s' % indent)
-        _make_pod_field(field, output)
-        first = False
+        field_stmts.append(_make_pod_field(field, output))
+    field_stmt = '%s._fields_ = [' % name
+    indent = ' ' * len(field_stmt)
+    output.write(field_stmt)
+    output.write((',\n%s' % indent).join(field_stmts))
     output.write(']\n')
 
 
+def get_layout(tree):
+    '''Return size, alignment, and field offsets (in bits) of a record.'''
+    return tree.get_memoized('layout', _compute_layout)
+
+
+def _compute_layout(tree):
+    '''Query layout of a record.'''
+    type_ = tree.type
+    offsets = tuple(type_.get_offset(field.original_name.encode())
+                    for field in tree.get_field_declaration())
+    return Layout(type_.get_size(), type_.get_align(), offsets)
+
+
 def _make_pod_field(field, output):
     '''Generate the field part of POD.'''
-    blob = ['\'%s\'' % field.name, _make_type(field.type)]
+    c_type = _alias_type(_make_type(field.type), output)
+    blob = ['\'%s\'' % field.name, c_type]
     if field.is_bitfield():
         blob.append(str(field.get_bitfield_width()))
-    field_stmt = '(%s)' % ', '.join(blob)
-    output.write('%s' % field_stmt)
+    return '(%s)' % ', '.join(blob)
 
 
 def _make_layout_assertion(tree, cls_name, output):
-    '''Generate assertions of struct layout for ABI compatibility.'''
-    if tree.kind == CursorKind.UNION_DECL:
+    '''Generate entry of the layout table for ABI compatibility check.'''
+    fields = tuple(tree.get_field_declaration())
+    if not fields:
         return
+    layout = get_layout(tree)
+    field_offsets = []
     first_bitfield_offset = None
-    for field in tree.get_field_declaration():
-        offset = tree.type.get_offset(field.original_name.encode()) / 8
+    for field, offset in zip(fields, layout.offsets):
+        offset //= 8
+        # ctypes reports the offset of the storage unit of bit fields.
         if field.is_bitfield():
             if first_bitfield_offset is None:
                 first_bitfield_offset = offset
@@ -314,8 +382,36 @@ def _make_layout_assertion(tree, cls_name, output):
                 offset = first_bitfield_offset
         else:
             first_bitfield_offset = None
-        assertion = '%s.%s.offset == %d' % (cls_name, field.name, offset)
-        output.write('assert %s, \'%s\'\n' % (assertion, assertion))
+        field_offsets.append('(\'%s\', %d)' % (field.name, offset))
+    output.write('_python_layouts.append((%s, %d, %d, [%s]))\n' %
+                 (cls_name, layout.size, layout.align,
+                  ', '.join(field_offsets)))
+
+
+def _make_numpy_dtype(tree, cls_name, output):
+    '''Generate NumPy dtype descriptor with offsets of _fields_ entries.'''
+    fields = tuple(tree.get_field_declaration())
+    if not fields:
+        return
+    layout = get_layout(tree)
+    offsets = []
+    if layout.offsets[0] != 0:
+        offsets.append(0)  # Offset of the padding
+    # Bit fields are put in containers, which are their storage units.
+    container = None
+    for field, offset in zip(fields, layout.offsets):
+        if field.is_bitfield():
+            width = field.get_bitfield_width()
+            if container is None or offset + width > container[1]:
+                unit = field.type.get_size() * 8
+                begin = offset // unit * unit
+                container = (begin, begin + unit)
+            offset = container[0]
+        else:
+            container = None
+        offsets.append(str(offset // 8))
+    output.write('%s._numpy_dtype_ = _NumpyDtype([%s], %d)\n' %
+                 (cls_name, ', '.join(offsets), layout.size))
 
 
 def _make_method(method, cls_name, output):
@@ -323,6 +419,18 @@ def _make_method(method, cls_name, output):
     _make_function(method, output, cls_name=cls_name)
 
 
+def gen_enum_header(tree, output):
+    '''Generate the 'class ...' part of enum.'''
+    mixin = tree.get_annotation(annotations.MIXIN, ())
+    if mixin:
+        fmt = 'class {name}({mixin}, {type}):\n{indent}pass\n'
+    else:
+        fmt = 'class {name}({type}):\n{indent}pass\n'
+    output.write(fmt.format(name=tree.name, indent=INDENT,
+                            type=_make_type(tree.enum_type),
+                            mixin=', '.join(mixin)))
+
+
 def _make_enum(tree, output):
     '''Generate ctypes binding of a enum definition.'''
     if tree.name:
@@ -331,14 +439,8 @@ def _make_enum(tree, output):
     else:
         enum_name = ''
         enum_type = _make_type(tree.enum_type)
-    if tree.name:
-        mixin = tree.get_annotation(annotations.MIXIN, ())
-        if mixin:
-            fmt = 'class {name}({mixin}, {type}):\n{indent}pass\n'
-        else:
-            fmt = 'class {name}({type}):\n{indent}pass\n'
-        output.write(fmt.format(name=enum_name, indent=INDENT,
-                                type=enum_type, mixin=', '.join(mixin)))
+    if tree.name and not tree.get_annotation(annotations.DECLARED, False):
+        gen_enum_header(tree, output)
     for enum in tree.get_children():
         if not enum.get_annotation(annotations.REQUIRED, False):
             continue
@@ -353,7 +455,7 @@ def _make_enum(tree, output):
 
 def _make_var(tree, output):
     '''Generate ctypes binding of a variable declaration.'''
-    c_type = _make_type(tree.type)
+    c_type = _alias_type(_make_type(tree.type), output)
     output.write('{0} = {1}.in_dll({2}, \'{3}\')\n'.format(tree.name,
                                                            c_type,
                                                            LIBNAME,
@@ -0,0 +1,96 @@
+# Copyright (C) 2013 Che-Liang Chiou.
+
+'''Define compound ctypes type expressions once as module-level aliases.'''
+
+import ast
+import re
+
+# Prefix of alias names
+PREFIX = '_T_'
+
+
+class TypeAliases(object):
+    '''Table of aliases of type expressions of an output.
+
+    An alias is written to the output when it is first used, and so the
+    caller must not be in the middle of writing a statement.
+    '''
+
+    def __init__(self):
+        '''Initialize the object.'''
+        self.aliases = {}
+        self._names = set()
+        self._num_functions = 0
+
+    def alias(self, c_type, output):
+        '''Return alias of a type expression, defining it if needed.'''
+        name = self.aliases.get(c_type)
+        if name is None:
+            name = self._alias_node(ast.parse(c_type, mode='eval').body,
+                                    output)
+            self.aliases[c_type] = name
+        return name
+
+    def _alias_node(self, node, output):
+        '''Return alias (or name) of an expression node.'''
+        if isinstance(node, ast.Name):
+            return node.id
+        if _is_call(node, 'POINTER'):
+            pointee = self._alias_node(node.args[0], output)
+            c_type = 'POINTER(%s)' % pointee
+            stem = 'ptr_' + _strip_prefix(pointee)
+        elif _is_call(node, 'CFUNCTYPE'):
+            types = [self._alias_node(arg, output) for arg in node.args]
+            c_type = 'CFUNCTYPE(%s)' % ', '.join(types)
+            stem = None
+        elif isinstance(node, ast.BinOp) and isinstance(node.op, ast.Mult):
+            element = self._alias_node(node.left, output)
+            length = _get_constant(node.right)
+            c_type = '(%s * %d)' % (element, length)
+            stem = 'arr%d_%s' % (length, _strip_prefix(element))
+        elif _get_constant(node) is None:
+            # Restype of CFUNCTYPE
+            return 'None'
+        else:
+            raise TypeError('Could not alias type: %s' % ast.dump(node))
+        name = self.aliases.get(c_type)
+        if name is None:
+            name = self.aliases[c_type] = self._make_name(stem)
+            output.write('%s = %s\n' % (name, c_type))
+        return name
+
+    def _make_name(self, stem):
+        '''Make a unique alias name.'''
+        if stem is None:
+            self._num_functions += 1
+            stem = 'fn%d' % self._num_functions
+        stem = re.sub(r'\W', '_', stem)
+        name = PREFIX + stem
+        suffix = 1
+        while name in self._names:
+            suffix += 1
+            name = '%s%s_%d' % (PREFIX, stem, suffix)
+        self._names.add(name)
+        return name
+
+
+def _is_call(node, func_name):
+    '''Test if node calls a function.'''
+    return (isinstance(node, ast.Call) and
+            isinstance(node.func, ast.Name) and
+            node.func.id == func_name)
+
+
+def _strip_prefix(name):
+    '''Strip the alias prefix from a name.'''
+    if name.startswith(PREFIX):
+        return name[len(PREFIX):]
+    return name
+
+
+def _get_constant(node):
+    '''Return value of a constant node.'''
+    for attr in ('value', 'n'):
+        if hasattr(node, attr):
+            return getattr(node, attr)
+    raise TypeError('Not a constant: %s' % ast.dump(node))
@@ -42,6 +42,7 @@ def check_matcher_data(field_names):
 
 class SyntaxTreeMatcher(namedtuple('SyntaxTreeMatcher', '''
         argtypes
+        batch
         enum
         errcheck
         import_
@@ -96,6 +97,7 @@ class SyntaxTreeMatcher(namedtuple('SyntaxTreeMatcher', '''
             rename = None
         # pylint: disable=W0142
         return cls(rename=rename,
+                   batch=spec.get('batch'),
                    enum=spec.get('enum'),
                    errcheck=spec.get('errcheck'),
                    import_=spec.get('import', True),
@@ -196,6 +198,13 @@ class SyntaxTreeMatcher(namedtuple('SyntaxTreeMatcher', '''
         tree.annotate(annotations.MIXIN, self.mixin)
         return True
 
+    @call_do_match
+    @check_matcher_data(('batch', ))
+    def do_batch(self, tree):
+        '''Make batch wrapper.'''
+        tree.annotate(annotations.BATCH, self.batch)
+        return True
+
     @call_do_match
     @check_matcher_data(('enum', ))
     def do_enum(self, tree):
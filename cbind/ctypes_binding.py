@@ -2,70 +2,119 @@
 
 '''Parse and generate ctypes binding from C sources with clang.'''
 
+import ast
 import functools
-from cbind.codegen import CodeGen
+import multiprocessing
+import os
+import re
+
+import cbind
+from cbind.cache import TranslationUnitCache
+from cbind.cindex import TranslationUnit
+from cbind.codegen import CodeGen, make_codegen
+from cbind.codegen.ctypes_runtime import CHECK_LAYOUTS
+from cbind.codegen.emitter import Emitter, MemorySink, make_emitter
 from cbind.config import SyntaxTreeMatcher
-from cbind.passes import (custom_pass,
-                          scan_required_nodes,
-                          scan_and_rename,
-                          scan_forward_decl,
-                          scan_va_list_tag,
-                          scan_anonymous_pod)
-from cbind.source import SyntaxTreeForest
+from cbind.passes import (PassManager,
+                          AnonymousPodPass,
+                          DeclarationGraph,
+                          ForwardDeclPass,
+                          RequiredNodesPass,
+                          VaListTagPass,
+                          find_required_files,
+                          find_value_dependencies,
+                          make_custom_pass,
+                          make_rename_pass,
+                          export_va_list_tag,
+                          import_va_list_tag)
+from cbind.passes.util import is_function_body
+from cbind.source import ParseSession, SyntaxTree, SyntaxTreeForest
 import cbind.annotations as annotations
 
 
-HEADER = '''# This is generated by {progname} and should not be edited.
+# Since _base is imported with "import *", export private names, like _lib,
+# as well.
+BASE_EXPORTS = '''
+__all__ = [_python_name for _python_name in list(globals())
+           if not _python_name.startswith('__')]
+'''
+
 
-import sys as _python_sys
-from ctypes import *
+SHARD_HEADER = '''# This is generated by {progname} and should not be edited.
 
+from ._base import *
 '''
 
 
-LOAD_LIBRARY = '''
-if _python_sys.platform == 'darwin':
-    _lib = cdll.LoadLibrary('{darwin_library}')
-elif _python_sys.platform == 'win32' or _python_sys.platform == 'cygwin':
-    _lib = cdll.LoadLibrary('{windows_library}')
-else:
-    _lib = cdll.LoadLibrary('{posix_library}')
+PACKAGE_INIT = '''# This is generated by {progname} and should not be edited.
 
-'''
+import importlib as _python_importlib
+import sys as _python_sys
 
+_python_shards = {shards!r}
 
-METHOD_DESCRIPTOR = '''
-import types as _python_types
+_python_shard_names = {shard_names!r}
 
-class _CtypesFunctor(object):
-    def __init__(self, functor):
-        self.functor = functor
 
-    if _python_sys.version_info.major == 3:
-        def __get__(self, obj, objtype=None):
-            if obj is None:
-                return self.functor
-            else:
-                return _python_types.MethodType(self.functor, obj)
+def _python_import_shard(shard):
+    return _python_importlib.import_module('.' + shard, __name__)
 
-    else:
-        def __get__(self, obj, objtype=None):
-            return _python_types.MethodType(self.functor, obj, objtype)
 
+if _python_sys.version_info >= (3, 7):
+    __all__ = sorted(_python_shard_names)
+
+    def __getattr__(name):
+        if name not in _python_shard_names:
+            raise AttributeError('module %r has no attribute %r' %
+                                 (__name__, name))
+        for shard in _python_shard_names[name]:
+            namespace = vars(_python_import_shard(shard))
+        value = namespace[name]
+        # A lazy function replaces itself in its shard on first call; keep
+        # it out of here, or calls through the package would go through it
+        # for good.
+        lazy_function = vars(_python_import_shard('_base')).get(
+            '_LazyFunction')
+        if lazy_function is None or not isinstance(value, lazy_function):
+            globals()[name] = value
+        return value
+
+    def __dir__():
+        return sorted(set(globals()) | set(_python_shard_names))
+
+else:
+    for _python_shard in _python_shards:
+        for _python_name, _python_value in \\
+                vars(_python_import_shard(_python_shard)).items():
+            if not _python_name.startswith('__'):
+                globals()[_python_name] = _python_value
 '''
 
 
 class CtypesBindingGenerator:
     '''Generate ctypes binding from C source files with libclang.'''
 
-    def __init__(self):
-        '''Initialize the object.'''
-        self.codegen = CodeGen()
-        self.syntax_tree_forest = SyntaxTreeForest()
+    def __init__(self, session=None, declarations_only=True, backend=None):
+        '''Initialize the object.
+
+        In declarations-only mode, which is the default, libclang skips
+        function bodies since we only generate bindings of declarations.
+        The backend chooses the code generator, default to ctypes.
+        '''
+        if declarations_only:
+            self.parse_options = TranslationUnit.PARSE_SKIP_FUNCTION_BODIES
+        else:
+            self.parse_options = TranslationUnit.PARSE_NONE
+        self.codegen = make_codegen(backend)
+        self.pass_manager = PassManager()
+        self.declaration_graph = DeclarationGraph()
+        self.syntax_tree_forest = SyntaxTreeForest(session=session)
         self._config = {}
+        self._config_data = None
 
     def config(self, config_data):
         '''Configure the generator.'''
+        self._config_data = config_data
         if 'preamble' in config_data:
             preamble = config_data['preamble']
             if isinstance(preamble, str):
@@ -75,33 +124,115 @@ class CtypesBindingGenerator:
                 self._config['library'] = preamble.get('library')
                 self._config['use_custom_loader'] = \
                     preamble.get('use_custom_loader')
-        for name in 'enum errcheck import method mixin rename'.split():
+        for name in 'batch enum errcheck import method mixin rename'.split():
             if name in config_data:
                 matcher = SyntaxTreeMatcher.make(config_data[name])
                 self._config[name] = getattr(matcher, 'do_' + name)
 
     def parse(self, path, contents=None, args=None):
         '''Call parser.parse().'''
-        if 'import' in self._config:
+        self._parse(path, contents=contents, args=args)
+
+    def _parse(self, path, contents=None, args=None, config_passes=True):
+        '''Parse a source file and run passes on it; return the tree.
+
+        Passes of the config are run only if config_passes is true.
+        '''
+        # Without import rules, only declarations of the file itself are
+        # checked, and so the snapshot skips the subtrees of other files.
+        files = None if 'import' in self._config else [path]
+        syntax_tree = self.syntax_tree_forest.parse(
+            path, contents=contents, args=args, options=self.parse_options,
+            files=files)
+        if files is None:
             check_required = self._config['import']
         else:
+            # Translation units loaded from the cache name files by absolute
+            # path; match the name libclang uses.
+            path = syntax_tree.snapshot.find_file(path)
             check_required = functools.partial(check_locally_defined,
                                                path=path)
+            files = [path]
+        required_nodes = RequiredNodesPass(check_required,
+                                           graph=self.declaration_graph)
+        self.pass_manager.run(syntax_tree, [required_nodes], files=files)
 
-        syntax_tree = self.syntax_tree_forest.parse(path,
-                                                    contents=contents,
-                                                    args=args)
-        scan_required_nodes(syntax_tree, check_required)
-        scan_forward_decl(syntax_tree)
-        scan_va_list_tag(syntax_tree)
-        scan_anonymous_pod(syntax_tree)
+        # Other passes skip files that have nothing required.
+        passes = [ForwardDeclPass(),
+                  VaListTagPass(syntax_tree),
+                  AnonymousPodPass()]
 
         # Since now tree is "complete", we may attach information to it.
+        if config_passes:
+            passes.extend(self._make_config_passes())
+
+        self.pass_manager.run(syntax_tree, passes,
+                              files=find_required_files(syntax_tree))
+        return syntax_tree
+
+    def _make_config_passes(self):
+        '''Return passes of the config.'''
+        passes = []
         if 'rename' in self._config:
-            scan_and_rename(syntax_tree, self._config['rename'])
-        for name in 'enum errcheck method mixin'.split():
+            passes.append(make_rename_pass(self._config['rename']))
+        for name in 'batch enum errcheck method mixin'.split():
             if name in self._config:
-                custom_pass(syntax_tree, self._config[name])
+                passes.append(make_custom_pass(name, self._config[name]))
+        return passes
+
+    def parse_all(self, paths, args=None, jobs=1):
+        '''Parse C source files with a pool of worker processes.
+
+        Each worker parses a source file, runs the passes on it, and sends
+        back its snapshot and annotations.  The translation units are saved
+        to the cache of the parse session (a temporary one if the session
+        has no cache), and are loaded back from the cache here, with their
+        snapshots restored rather than extracted again.
+
+        Annotations are merged in the order of the source files.  Passes of
+        different files are independent, except that a rename rule may match
+        a name that an earlier file has renamed (a declaration of a header
+        included by both); so if there are rename rules, the workers do not
+        run passes of the config, and they are run here in order instead.
+        '''
+        if jobs <= 1 or len(paths) <= 1:
+            for path in paths:
+                self.parse(path, args=args)
+            return
+        session = self.syntax_tree_forest.session
+        if not session.cache:
+            session.cache = TranslationUnitCache(
+                os.path.join(session.get_temporary_directory(), 'cache'))
+        worker_args = list(args or ()) + session.prelude_args
+        serial_config_passes = 'rename' in self._config
+        tasks = [(SyntaxTree.SEVERITY,
+                  CodeGen.ENABLE_CPP,
+                  self.parse_options,
+                  self._config_data,
+                  not serial_config_passes,
+                  session.cache.directory,
+                  path,
+                  worker_args) for path in paths]
+        # Choose cindex implementation in the initializer, which is run
+        # before tasks (and thus this module and cbind.cindex) are unpickled
+        # in a worker process.
+        pool = multiprocessing.Pool(min(jobs, len(paths)),
+                                    initializer=cbind.choose_cindex_impl,
+                                    initargs=(cbind.choose_cindex_impl(),))
+        try:
+            results = pool.map(_parse_in_worker, tasks)
+        finally:
+            pool.close()
+            pool.join()
+        for path, (state, table, va_list_tag) in zip(paths, results):
+            syntax_tree = self.syntax_tree_forest.parse(
+                path, args=args, options=self.parse_options, state=state)
+            self.syntax_tree_forest.merge_annotations(table)
+            # Syntax trees are not exported, only their keys.
+            import_va_list_tag(syntax_tree, va_list_tag)
+            if serial_config_passes:
+                self.pass_manager.run(syntax_tree, self._make_config_passes(),
+                                      files=find_required_files(syntax_tree))
 
     def get_translation_units(self):
         '''Get translation units.'''
@@ -110,12 +241,13 @@ class CtypesBindingGenerator:
 
     def generate_preamble(self, progname, library, output):
         '''Generate preamble of Python binding.'''
-        output.write(HEADER.format(progname=progname))
+        header = self.codegen.HEADER
+        output.write(header.format(progname=progname))
         preamble = self._config.get('preamble', '')
         library = library or self._config.get('library')
         if library:
             if not self._config.get('use_custom_loader'):
-                preamble += LOAD_LIBRARY
+                preamble += self.codegen.LOAD_LIBRARY
             library_name = library.partition('.so')[0]
             output.write(preamble.format(
                 posix_library=library,
@@ -125,10 +257,104 @@ class CtypesBindingGenerator:
             output.write(preamble)
 
     def generate(self, output):
-        '''Generate ctypes binding.'''
+        '''Generate binding.'''
         self.codegen.set_output(output)
-        if 'method' in self._config:
-            output.write(METHOD_DESCRIPTOR)
+        output = self.codegen.output
+        self._generate_runtime()
+        for syntax_tree in self.syntax_tree_forest:
+            syntax_tree.traverse(
+                preorder=self.codegen.generate_record_forward_decl,
+                postorder=self.codegen.generate,
+                prune=is_function_body,
+                files=find_required_files(syntax_tree))
+        if CodeGen.ASSERT_LAYOUT:
+            output.write(CHECK_LAYOUTS)
+        self.codegen.flush()
+
+    def generate_package(self, progname, library, directory,
+                         macro_generator=None):
+        '''Generate ctypes binding as a package.
+
+        The package has one module (shard) per source file.  Classes of all
+        user-defined types are declared in the _base module, which every
+        shard imports, and so shards only import the shards that define
+        types they contain by value.  On Python 3.7 or later, the package
+        imports the shards that bind a name on first access to that name.
+        '''
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # Preamble of base has its own header.
+        base = _Shard('_base', '')
+        self.generate_preamble(progname, library, base.emitter)
+        self.codegen.set_output(base.emitter)
+        self._generate_runtime()
+        for syntax_tree in self.syntax_tree_forest:
+            syntax_tree.traverse(
+                preorder=self.codegen.generate_type_declaration,
+                prune=is_function_body,
+                files=find_required_files(syntax_tree))
+        base.emitter.write(BASE_EXPORTS)
+
+        shards = {}
+        owners = {}
+        for syntax_tree in self.syntax_tree_forest:
+            files = find_required_files(syntax_tree)
+            for decl in syntax_tree.get_top_level_decls(files):
+                location = decl.location
+                path = location.file.name if location.file else None
+                if path not in shards:
+                    name = _make_shard_name(
+                        path, set(shard.name for shard in shards.values()))
+                    shards[path] = _Shard(name, SHARD_HEADER, len(shards))
+                    if CodeGen.ASSERT_LAYOUT:
+                        # Each module checks layouts of its own records.
+                        shards[path].emitter.write('_python_layouts = []\n\n')
+                shard = shards[path]
+                for dependency in find_value_dependencies(decl):
+                    owner = owners.get(dependency)
+                    if owner not in (None, shard) and \
+                            owner not in shard.imports:
+                        shard.imports.append(owner)
+                self.codegen.set_output(shard.emitter)
+                decl.traverse(
+                    postorder=functools.partial(self._generate_shard_node,
+                                                shard=shard,
+                                                owners=owners),
+                    prune=is_function_body)
+        shards = sorted(shards.values(), key=lambda shard: shard.order)
+        if CodeGen.ASSERT_LAYOUT:
+            for shard in [base] + shards:
+                shard.emitter.write(CHECK_LAYOUTS)
+
+        if macro_generator:
+            macros = _Shard('_macros', SHARD_HEADER)
+            for shard in shards:
+                macros.emitter.write('from .%s import *\n' % shard.name)
+            macros.emitter.write('\n')
+            macro_generator.generate(macros.emitter)
+            shards.append(macros)
+
+        # Map names to shards that bind them; base declares classes of all
+        # user-defined types, and shards define their bodies.
+        shard_names = {}
+        for shard in [base] + shards:
+            for name in sorted(shard.get_bound_names()):
+                shard_names.setdefault(name, []).append(shard.name)
+
+        base.write(progname, directory)
+        for shard in shards:
+            shard.write(progname, directory)
+        with make_emitter(os.path.join(directory, '__init__.py')) as output:
+            output.write(PACKAGE_INIT.format(
+                progname=progname,
+                shards=['_base'] + [shard.name for shard in shards],
+                shard_names=shard_names))
+
+    def _generate_runtime(self):
+        '''Generate helper classes and builtin types.'''
+        output = self.codegen.output
+        self.codegen.generate_runtime(self._config)
         for syntax_tree in self.syntax_tree_forest:
             va_list_tag = syntax_tree.get_annotation(
                 annotations.USE_VA_LIST_TAG, False)
@@ -136,10 +362,97 @@ class CtypesBindingGenerator:
                 self.codegen.generate_record_definition(va_list_tag)
                 output.write('\n')
                 break
-        for syntax_tree in self.syntax_tree_forest:
-            syntax_tree.traverse(
-                preorder=self.codegen.generate_record_forward_decl,
-                postorder=self.codegen.generate)
+
+    def _generate_shard_node(self, tree, shard, owners):
+        '''Generate a node into a shard and record the shard defining it.'''
+        defined = tree.get_annotation(annotations.DEFINED, False)
+        self.codegen.generate(tree)
+        if not defined and tree.get_annotation(annotations.DEFINED, False):
+            owners[tree] = shard
+
+
+class _Shard(object):
+    '''A module of package output.'''
+
+    def __init__(self, name, header, order=0):
+        '''Initialize the object.'''
+        self.name = name
+        self.header = header
+        self.order = order
+        self.imports = []
+        self.sink = MemorySink()
+        self.emitter = Emitter(self.sink)
+
+    def get_bound_names(self):
+        '''Return names that top-level statements of the shard bind.
+
+        Assigning an attribute of a name, like "Foo._fields_ = ...", counts
+        as binding the name, since Foo is incomplete without it.
+        '''
+        self.emitter.flush()
+        names = set()
+        for stmt in ast.parse(self.sink.getvalue()).body:
+            if isinstance(stmt, (ast.ClassDef, ast.FunctionDef)):
+                names.add(stmt.name)
+            elif isinstance(stmt, ast.Assign):
+                for target in stmt.targets:
+                    while isinstance(target, ast.Attribute):
+                        target = target.value
+                    if isinstance(target, ast.Name):
+                        names.add(target.id)
+        names.discard('__all__')
+        return names
+
+    def write(self, progname, directory):
+        '''Write the module.'''
+        self.emitter.flush()
+        path = os.path.join(directory, self.name + '.py')
+        with make_emitter(path) as output:
+            if self.header:
+                output.write(self.header.format(progname=progname))
+                for shard in self.imports:
+                    output.write('from . import %s\n' % shard.name)
+                output.write('\n')
+            output.write(self.sink.getvalue())
+
+
+def _make_shard_name(path, names):
+    '''Make a unique module name of a source file.'''
+    if path:
+        stem = re.sub(r'\W', '_', os.path.basename(path))
+    else:
+        stem = 'builtin'
+    name = '_' + stem
+    suffix = 1
+    while name in names:
+        suffix += 1
+        name = '_%s_%d' % (stem, suffix)
+    return name
+
+
+def _parse_in_worker(task):
+    '''Parse a source file in a worker process.
+
+    Return the snapshot, the annotations, and the key of __va_list_tag.
+    '''
+    (severity, enable_cpp, parse_options, config_data, config_passes,
+     cache_dir, path, args) = task
+    SyntaxTree.SEVERITY = severity
+    CodeGen.ENABLE_CPP = enable_cpp
+    session = ParseSession(cache=TranslationUnitCache(cache_dir))
+    try:
+        cbgen = CtypesBindingGenerator(session=session)
+        cbgen.parse_options = parse_options
+        if config_data:
+            cbgen.config(config_data)
+        # pylint: disable=W0212
+        syntax_tree = cbgen._parse(path, args=args,
+                                   config_passes=config_passes)
+        return (syntax_tree.snapshot.export(),
+                cbgen.syntax_tree_forest.export_annotations(),
+                export_va_list_tag(syntax_tree))
+    finally:
+        session.close()
 
 
 def check_locally_defined(tree, path):
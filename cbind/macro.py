@@ -9,7 +9,7 @@ import subprocess
 from collections import OrderedDict, namedtuple
 from cbind.cindex import CursorKind
 from cbind.compatibility import StringIO, decode_str
-from cbind.source import SyntaxTree
+from cbind.source import ParseSession, SyntaxTree
 
 
 # List of direct-translation symbols.
@@ -37,10 +37,11 @@ class MacroException(Exception):
 class MacroGenerator:
     '''Generate Python code from macro constants.'''
 
-    def __init__(self, macro_int=None):
+    def __init__(self, macro_int=None, session=None):
         '''Initialize object.'''
         self.symbol_table = OrderedDict()
         self.parser = Parser()
+        self.session = session or ParseSession()
         if macro_int:
             self.macro_int = re.compile(macro_int).match
         else:
@@ -78,17 +79,16 @@ class MacroGenerator:
         self.symbol_table[new_symbol.name] = new_symbol
         return True
 
-    @classmethod
-    def _translate_const_int(cls, c_path, args, symbols):
+    def _translate_const_int(self, c_path, args, symbols):
         '''Translate constant integers with libclang.'''
-        enums = cls._clang_const_int(c_path, args, symbols)
+        enums = self._clang_const_int(c_path, args, symbols)
         regex_name = re.compile(r'^%s_(\w+)$' % _MAGIC)
         symbol_map = dict((symbol.name, symbol) for symbol in symbols)
         for enum in enums:
             match = regex_name.match(enum.spelling)
             if match:
-                yield cls._make_int_literal(symbol_map[match.group(1)],
-                                            enum.enum_value)
+                yield self._make_int_literal(symbol_map[match.group(1)],
+                                             enum.enum_value)
 
     @staticmethod
     def _make_int_literal(symbol, value):
@@ -97,8 +97,7 @@ class MacroGenerator:
         expr = Expression(this=int_literal, children=())
         return MacroSymbol.set_expr(symbol, expr)
 
-    @classmethod
-    def _clang_const_int(cls, c_path, args, symbols):
+    def _clang_const_int(self, c_path, args, symbols):
         '''Run clang on constant integers.'''
         c_abs_path = os.path.abspath(c_path)
         src = StringIO()
@@ -108,8 +107,8 @@ class MacroGenerator:
             src.write('%s_%s = %s,\n' % (_MAGIC, symbol.name, symbol.body))
         src.write('};\n')
         syntax_tree = SyntaxTree.parse('input.c', contents=src.getvalue(),
-                                       args=args)
-        return cls._find_enums(syntax_tree)
+                                       args=args, session=self.session)
+        return self._find_enums(syntax_tree)
 
     @staticmethod
     def _find_enums(syntax_tree):
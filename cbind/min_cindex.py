@@ -108,10 +108,22 @@ clang_getDiagnosticSpelling.argtypes = [c_void_p]
 clang_getDiagnosticSpelling.restype = String
 clang_getDiagnosticSpelling.errcheck = lambda result, *_: decode_str(clang_getCString(result))
 
+clang_createTranslationUnit = _lib.clang_createTranslationUnit
+clang_createTranslationUnit.argtypes = [c_void_p, c_char_p]
+clang_createTranslationUnit.restype = POINTER(TranslationUnitImpl)
+
 clang_parseTranslationUnit = _lib.clang_parseTranslationUnit
 clang_parseTranslationUnit.argtypes = [c_void_p, c_char_p, POINTER(c_char_p), c_int, POINTER(UnsavedFile), c_uint, c_uint]
 clang_parseTranslationUnit.restype = POINTER(TranslationUnitImpl)
 
+clang_defaultSaveOptions = _lib.clang_defaultSaveOptions
+clang_defaultSaveOptions.argtypes = [POINTER(TranslationUnitImpl)]
+clang_defaultSaveOptions.restype = c_uint
+
+clang_saveTranslationUnit = _lib.clang_saveTranslationUnit
+clang_saveTranslationUnit.argtypes = [POINTER(TranslationUnitImpl), c_char_p, c_uint]
+clang_saveTranslationUnit.restype = c_int
+
 clang_disposeTranslationUnit = _lib.clang_disposeTranslationUnit
 clang_disposeTranslationUnit.argtypes = [POINTER(TranslationUnitImpl)]
 
@@ -504,6 +516,11 @@ clang_Type_getClassType.restype = Type
 clang_Type_getClassType.errcheck = ref_translation_unit
 Type.get_class_type = _CtypesFunctor(clang_Type_getClassType)
 
+clang_Type_getSizeOf = _lib.clang_Type_getSizeOf
+clang_Type_getSizeOf.argtypes = [Type]
+clang_Type_getSizeOf.restype = c_longlong
+Type.get_size = _CtypesFunctor(clang_Type_getSizeOf)
+
 clang_Type_getOffsetOf = _lib.clang_Type_getOffsetOf
 clang_Type_getOffsetOf.argtypes = [Type, c_char_p]
 clang_Type_getOffsetOf.restype = c_longlong
@@ -547,3 +564,10 @@ clang_CXXMethod_isStatic.argtypes = [Cursor]
 clang_CXXMethod_isStatic.restype = c_uint
 Cursor.is_static_method = _CtypesFunctor(clang_CXXMethod_isStatic)
 
+clang_getClangVersion = _lib.clang_getClangVersion
+clang_getClangVersion.restype = String
+clang_getClangVersion.errcheck = lambda result, *_: decode_str(clang_getCString(result))
+
+clang_getInclusions = _lib.clang_getInclusions
+clang_getInclusions.argtypes = [POINTER(TranslationUnitImpl), CFUNCTYPE(None, c_void_p, POINTER(SourceLocation), c_uint, c_void_p), c_void_p]
+
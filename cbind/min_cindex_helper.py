@@ -3,7 +3,7 @@
 '''Helpers for min_cindex module.'''
 
 from collections import namedtuple
-from ctypes import CFUNCTYPE, byref, c_uint, c_char_p, c_void_p
+from ctypes import CFUNCTYPE, POINTER, byref, c_uint, c_char_p, c_void_p
 
 import cbind.min_cindex
 
@@ -54,9 +54,14 @@ class Index(ClangObject):
         '''Delete the object.'''
         cbind.min_cindex.clang_disposeIndex(self)
 
-    def parse(self, path, args=None, unsaved_files=None):
+    def parse(self, path, args=None, unsaved_files=None, options=0):
         '''Call TranslationUnit.from_source.'''
-        return TranslationUnit.from_source(path, args, unsaved_files, self)
+        return TranslationUnit.from_source(path, args, unsaved_files, self,
+                                           options=options)
+
+    def read(self, path):
+        '''Call TranslationUnit.from_ast_file.'''
+        return TranslationUnit.from_ast_file(path, self)
 
 
 class TranslationUnitLoadError(Exception):
@@ -64,13 +69,38 @@ class TranslationUnitLoadError(Exception):
     pass
 
 
+class TranslationUnitSaveError(Exception):
+    '''Exception raised by TranslationUnit.save().'''
+    pass
+
+
+class FileInclusion(namedtuple('FileInclusion',
+                               'source include location depth')):
+    '''An inclusion of a file in a translation unit.'''
+    # pylint: disable=W0232
+    pass
+
+
 class TranslationUnit(ClangObject):
     '''Represent a source code translation unit.'''
 
+    # Flags of parse options
+    PARSE_NONE = 0
+    PARSE_DETAILED_PROCESSING_RECORD = 1
+    PARSE_INCOMPLETE = 2
+    PARSE_PRECOMPILED_PREAMBLE = 4
+    PARSE_CACHE_COMPLETION_RESULTS = 8
+    PARSE_SKIP_FUNCTION_BODIES = 64
+
+    def __init__(self, object_, index):
+        '''Initialize the object.'''
+        super(TranslationUnit, self).__init__(object_)
+        # Keep the Index alive until this translation unit is disposed.
+        self.index = index
+
     @classmethod
-    def from_source(cls, filename, args, unsaved_files, index):
+    def from_source(cls, filename, args, unsaved_files, index, options=0):
         '''Create translation unit.'''
-        options = 0
         args = args or []
         unsaved_files = unsaved_files or []
         index = index or Index.create()
@@ -102,12 +132,53 @@ class TranslationUnit(ClangObject):
                                                           options)
         if not ptr:
             raise TranslationUnitLoadError('Error parsing translation unit.')
-        return cls(ptr)
+        return cls(ptr, index)
+
+    @classmethod
+    def from_ast_file(cls, filename, index=None):
+        '''Load translation unit from an AST file.'''
+        index = index or Index.create()
+        ptr = cbind.min_cindex.clang_createTranslationUnit(index,
+                                                           filename.encode())
+        if not ptr:
+            raise TranslationUnitLoadError(filename)
+        return cls(ptr, index)
 
     def __del__(self):
         '''Delete the object.'''
         cbind.min_cindex.clang_disposeTranslationUnit(self)
 
+    def save(self, filename):
+        '''Save translation unit to an AST file.'''
+        options = cbind.min_cindex.clang_defaultSaveOptions(self)
+        result = cbind.min_cindex.clang_saveTranslationUnit(self,
+                                                            filename.encode(),
+                                                            options)
+        if result != 0:
+            raise TranslationUnitSaveError(result)
+
+    def get_includes(self):
+        '''Return an iterator of FileInclusion objects.'''
+        includes = []
+
+        def visit(file_, stack, depth, _):
+            '''Visit inclusions callback.'''
+            if depth > 0:
+                # Copy the location out of libclang's inclusion stack.
+                location = cbind.min_cindex.SourceLocation.from_buffer_copy(
+                    stack[0])
+                includes.append(FileInclusion(location.file, File(file_),
+                                              location, depth))
+
+        callback_proto = CFUNCTYPE(None,
+                                   c_void_p,
+                                   POINTER(cbind.min_cindex.SourceLocation),
+                                   c_uint,
+                                   c_void_p)
+        visit_callback = callback_proto(visit)
+        cbind.min_cindex.clang_getInclusions(self, visit_callback, None)
+        return iter(includes)
+
     @property
     def cursor(self):
         '''cursor property.'''
@@ -122,6 +193,11 @@ class TranslationUnit(ClangObject):
             yield Diagnostic(diag)
 
 
+def get_clang_version():
+    '''Return the version string of libclang.'''
+    return cbind.min_cindex.clang_getClangVersion()
+
+
 def ref_translation_unit(result, _, arguments):
     '''Store a reference to TranslationUnit in the Python object so that
     it is not GC'ed before this cursor.'''
@@ -157,6 +233,15 @@ class cached_property(object):  # pylint: disable=C0103
         return value
 
 
+class File(ClangObject):
+    '''A file in a translation unit.'''
+
+    @cached_property
+    def name(self):
+        '''name property.'''
+        return cbind.min_cindex.clang_getFileName(self)
+
+
 class SourceLocationData(namedtuple('SourceLocationData',
                                     'file line column offset')):
     '''Data blob of source location.'''
@@ -197,8 +282,7 @@ class SourceLocationMixin(object):
                                                         byref(column),
                                                         byref(offset))
         if file_:
-            file_ = ClangObject(file_)
-            setattr(file_, 'name', cbind.min_cindex.clang_getFileName(file_))
+            file_ = File(file_)
         else:
             file_ = None
         return SourceLocationData(file_, line.value, column.value,
@@ -214,6 +298,9 @@ class CursorMixin(object):
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def __hash__(self):
+        return cbind.min_cindex.clang_hashCursor(self)
+
     @cached_property
     def enum_type(self):
         '''enum_type property.'''
@@ -295,14 +382,52 @@ class CursorMixin(object):
             children.append(child)
             return 1  # continue
 
-        callback_proto = CFUNCTYPE(cbind.min_cindex.ChildVisitResult,
-                                   cbind.min_cindex.Cursor,
-                                   cbind.min_cindex.Cursor,
-                                   c_void_p)
-        visit_callback = callback_proto(visit)
+        visit_callback = _get_visitor_prototype()(visit)
         cbind.min_cindex.clang_visitChildren(self, visit_callback, None)
         return children
 
+    def walk_subtree(self, prune=None):
+        '''Return a list of (cursor, depth) of descendants in preorder.
+
+        The whole subtree is visited in one clang_visitChildren call.  A
+        pruned cursor is in the list, but its descendants are not.
+        '''
+        descendants = []
+        ancestors = [self]
+        translation_unit = self._translation_unit
+
+        def visit(child, parent, _):
+            '''Visit descendants callback.'''
+            while ancestors[-1] != parent:
+                ancestors.pop()
+            # Store reference to TranslationUnit...
+            setattr(child, '_translation_unit', translation_unit)
+            descendants.append((child, len(ancestors)))
+            if prune and prune(child):
+                return 1  # continue
+            ancestors.append(child)
+            return 2  # recurse
+
+        visit_callback = _get_visitor_prototype()(visit)
+        cbind.min_cindex.clang_visitChildren(self, visit_callback, None)
+        return descendants
+
+
+_VISITOR_PROTOTYPE = None
+
+
+def _get_visitor_prototype():
+    '''Return the prototype of clang_visitChildren callback.'''
+    # Create it on first use since min_cindex is not loaded when this module
+    # is imported.
+    global _VISITOR_PROTOTYPE  # pylint: disable=W0603
+    if _VISITOR_PROTOTYPE is None:
+        _VISITOR_PROTOTYPE = CFUNCTYPE(cbind.min_cindex.ChildVisitResult,
+                                       cbind.min_cindex.Cursor,
+                                       cbind.min_cindex.Cursor,
+                                       c_void_p)
+    return _VISITOR_PROTOTYPE
+
 
 class TypeMixin(object):
     '''Mixin class of Type.'''
@@ -2,14 +2,26 @@
 
 '''Package of syntax tree passes (transformations).'''
 
-from cbind.passes.required_nodes import scan_required_nodes
-from cbind.passes.rename import scan_and_rename
-from cbind.passes.forward_decl import scan_forward_decl
-from cbind.passes.va_list_tag import scan_va_list_tag
-from cbind.passes.anonymous_pod import scan_anonymous_pod
+from cbind.passes.manager import CustomPass, Pass, PassManager, run_pass
+from cbind.passes.declaration_graph import (DeclarationGraph,
+                                             find_value_dependencies)
+from cbind.passes.required_nodes import (scan_required_nodes,
+                                         find_required_files,
+                                         RequiredNodesPass)
+from cbind.passes.rename import scan_and_rename, make_rename_pass
+from cbind.passes.forward_decl import scan_forward_decl, ForwardDeclPass
+from cbind.passes.va_list_tag import (export_va_list_tag,
+                                      import_va_list_tag,
+                                      scan_va_list_tag,
+                                      VaListTagPass)
+from cbind.passes.anonymous_pod import scan_anonymous_pod, AnonymousPodPass
 
 
 def custom_pass(syntax_tree, func):
     '''Run a custom pass over the tree.'''
-    from cbind.passes.util import traverse_postorder
-    traverse_postorder(syntax_tree, func)
+    run_pass(syntax_tree, make_custom_pass('custom', func))
+
+
+def make_custom_pass(name, func):
+    '''Make a pass that runs after the builtin passes and renaming.'''
+    return CustomPass(name, func, requires=('anonymous_pod', 'rename'))
@@ -4,21 +4,27 @@
 
 import re
 from cbind.cindex import CursorKind, TypeKind
-from cbind.passes.util import traverse_postorder
+from cbind.passes.manager import Pass, run_pass
 import cbind.annotations as annotations
 
 
 def scan_anonymous_pod(syntax_tree):
     '''Scan anonymous PODs.'''
-    traverse_postorder(syntax_tree, _scan_tree)
+    run_pass(syntax_tree, AnonymousPodPass())
 
 
-def _scan_tree(tree):
-    '''Scan anonymous PODs.'''
-    if tree.kind == CursorKind.TYPEDEF_DECL:
-        _typedef_pod(tree)
-    elif tree.is_user_defined_pod_decl():
-        _real_anonymous_pod(tree)
+class AnonymousPodPass(Pass):
+    '''Name anonymous PODs.'''
+
+    name = 'anonymous_pod'
+    requires = ('required_nodes',)
+
+    def visit(self, tree):
+        '''Scan anonymous PODs.'''
+        if tree.kind == CursorKind.TYPEDEF_DECL:
+            _typedef_pod(tree)
+        elif tree.is_user_defined_pod_decl():
+            _real_anonymous_pod(tree)
 
 
 def _typedef_pod(tree):
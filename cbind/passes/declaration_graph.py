@@ -0,0 +1,96 @@
+# Copyright (C) 2013 Che-Liang Chiou.
+
+'''Graph of dependencies between declarations of user-defined types.'''
+
+from cbind.cindex import CursorKind, TypeKind
+from cbind.passes.util import is_function_body, strip_type
+
+
+class DeclarationGraph(object):
+    '''Edges from a declaration to the declarations its types reference.
+
+    A declaration depends on the user-defined types referenced, through
+    typedef, pointer, and array, by the types of the declaration and of all
+    nodes under it (fields, nested records, function signatures).  Edges
+    are computed on first query and then kept for the whole forest.
+    '''
+
+    def __init__(self):
+        '''Initialize the object.'''
+        self.node_count = 0
+        self._edges = {}
+
+    def get_dependencies(self, decl):
+        '''Return declarations that a declaration depends on.'''
+        # Trees are interned, and so their identity is stable.
+        entry = self._edges.get(id(decl))
+        if entry is None:
+            entry = self._edges[id(decl)] = (decl, self._scan(decl))
+        return entry[1]
+
+    def _scan(self, decl):
+        '''Scan types of nodes under a declaration.'''
+        dependencies = []
+
+        def scan_type(tree):
+            '''Resolve type of a node.'''
+            self.node_count += 1
+            dependency = resolve_declaration(tree.type)
+            if dependency is not None:
+                dependencies.append(dependency)
+
+        decl.traverse(postorder=scan_type, prune=is_function_body)
+        return dependencies
+
+
+def resolve_declaration(type_):
+    '''Return declaration of the user-defined type that a type references.'''
+    while type_:
+        if type_.is_user_defined_type():
+            tree = type_.get_declaration()
+            if not tree.is_user_defined_type_decl():
+                return None
+            return tree
+        type_ = strip_type(type_)
+    return None
+
+
+def find_value_dependencies(decl):
+    '''Return declarations that must be defined before decl is.
+
+    These are the user-defined types that fields, variables, and typedefs
+    under decl contain by value, rather than through pointers.
+    '''
+    dependencies = []
+
+    def scan_type(tree):
+        '''Resolve type of a node.'''
+        if tree.kind == CursorKind.TYPEDEF_DECL:
+            type_ = tree.underlying_typedef_type
+        elif tree.kind in (CursorKind.FIELD_DECL, CursorKind.VAR_DECL):
+            type_ = tree.type
+        else:
+            return
+        dependency = resolve_value_declaration(type_)
+        if dependency is not None:
+            dependencies.append(dependency)
+
+    decl.traverse(postorder=scan_type, prune=is_function_body)
+    return dependencies
+
+
+def resolve_value_declaration(type_):
+    '''Return declaration of the user-defined type a type contains.'''
+    while type_:
+        if type_.is_user_defined_type():
+            tree = type_.get_declaration()
+            if not tree.is_user_defined_type_decl():
+                return None
+            return tree
+        if type_.kind == TypeKind.TYPEDEF:
+            type_ = type_.get_canonical()
+        elif type_.kind == TypeKind.CONSTANTARRAY:
+            type_ = type_.get_array_element_type()
+        else:
+            return None
+    return None
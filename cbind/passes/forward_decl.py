@@ -3,27 +3,38 @@
 '''Scan syntax tree for forward declarations.'''
 
 from cbind.cindex import CursorKind
-from cbind.passes.util import traverse_postorder, strip_type
+from cbind.passes.manager import Pass, run_pass
+from cbind.passes.util import strip_type
 import cbind.annotations as annotations
 
 
 def scan_forward_decl(syntax_tree):
     '''Scan syntax tree for forward declarations.'''
-    has_seen = set()
-    traverse_postorder(syntax_tree, lambda tree: _scan_tree(tree, has_seen))
+    run_pass(syntax_tree, ForwardDeclPass())
 
 
-def _scan_tree(tree, has_seen):
-    '''Scan tree for forward declarations.'''
-    if tree.is_user_defined_type_decl():
-        has_seen.add(tree)
+class ForwardDeclPass(Pass):
+    '''Mark types that are used before they are declared.'''
 
-    if tree.kind == CursorKind.FUNCTION_DECL:
-        for type_ in tree.type.get_argument_types():
-            _scan_type_forward_decl(type_, has_seen)
-        _scan_type_forward_decl(tree.result_type, has_seen)
-    else:
-        _scan_type_forward_decl(tree.type, has_seen)
+    name = 'forward_decl'
+
+    def __init__(self):
+        '''Initialize the object.'''
+        super(ForwardDeclPass, self).__init__()
+        self.has_seen = set()
+
+    def visit(self, tree):
+        '''Scan tree for forward declarations.'''
+        has_seen = self.has_seen
+        if tree.is_user_defined_type_decl():
+            has_seen.add(tree)
+
+        if tree.kind == CursorKind.FUNCTION_DECL:
+            for type_ in tree.type.get_argument_types():
+                _scan_type_forward_decl(type_, has_seen)
+            _scan_type_forward_decl(tree.result_type, has_seen)
+        else:
+            _scan_type_forward_decl(tree.type, has_seen)
 
 
 def _scan_type_forward_decl(type_, has_seen):
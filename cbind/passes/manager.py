@@ -0,0 +1,131 @@
+# Copyright (C) 2013 Che-Liang Chiou.
+
+'''Run passes that share traversals of syntax tree.'''
+
+import logging
+import time
+
+from cbind.passes.util import traverse_postorder
+
+
+class Pass(object):
+    '''Base class of passes.
+
+    A pass visits nodes in post order.  Passes that do not require each
+    other share one traversal, in which every node is visited by them in
+    the order that they are given to the pass manager.
+    '''
+
+    # Name of this pass
+    name = None
+
+    # Names of passes that must be completed before this pass starts
+    requires = ()
+
+    def __init__(self):
+        '''Initialize the object.'''
+        self.done = False
+        self.node_count = 0
+
+    def visit(self, tree):
+        '''Visit a node; set self.done to stop visiting.'''
+        raise NotImplementedError
+
+    def finish(self):
+        '''Called after the traversal.'''
+        pass
+
+
+class CustomPass(Pass):
+    '''A pass that calls a function on every node.'''
+
+    def __init__(self, name, func, requires=()):
+        '''Initialize the object.'''
+        super(CustomPass, self).__init__()
+        self.name = name
+        self.visit = func
+        self.requires = requires
+
+
+# Timer of profiling passes
+_timer = getattr(time, 'perf_counter', time.time)
+
+
+class _StopTraversal(Exception):
+    '''Raised when all passes of a traversal are done.'''
+    pass
+
+
+class PassManager(object):
+    '''Schedule passes into as few traversals as possible.'''
+
+    def __init__(self, profile=False):
+        '''Initialize the object.
+
+        If profile is true, every pass runs in its own traversal, and the
+        time it takes is added up in pass_times.
+        '''
+        self.profile = profile
+        self.node_counts = {}
+        self.pass_times = {}
+
+    def run(self, syntax_tree, passes, files=None):
+        '''Run passes over the tree.
+
+        If files is given, skip top-level declarations of other files.
+        '''
+        if not self.profile:
+            for stage in schedule(passes):
+                _run_stage(syntax_tree, stage, files)
+        else:
+            for pass_ in passes:
+                start = _timer()
+                _run_stage(syntax_tree, [pass_], files)
+                self.pass_times[pass_.name] = (
+                    self.pass_times.get(pass_.name, 0) + _timer() - start)
+        for pass_ in passes:
+            self.node_counts[pass_.name] = \
+                self.node_counts.get(pass_.name, 0) + pass_.node_count
+            logging.info('Pass %s visited %d nodes',
+                         pass_.name, pass_.node_count)
+
+
+def schedule(passes):
+    '''Group passes into stages, each of which is one traversal.'''
+    stages = []
+    stage = []
+    for pass_ in passes:
+        if any(other.name in pass_.requires for other in stage):
+            stages.append(stage)
+            stage = []
+        stage.append(pass_)
+    if stage:
+        stages.append(stage)
+    return stages
+
+
+def run_pass(syntax_tree, pass_):
+    '''Run a pass alone.'''
+    _run_stage(syntax_tree, [pass_])
+
+
+def _run_stage(syntax_tree, stage, files=None):
+    '''Run passes in one traversal.'''
+    active = list(stage)
+
+    def visit(tree):
+        '''Visit the node by every active pass.'''
+        for pass_ in active:
+            pass_.node_count += 1
+            pass_.visit(tree)
+        if any(pass_.done for pass_ in active):
+            active[:] = [pass_ for pass_ in active if not pass_.done]
+            if not active:
+                raise _StopTraversal()
+
+    try:
+        traverse_postorder(syntax_tree, visit, files=files)
+    except _StopTraversal:
+        pass
+    for pass_ in stage:
+        pass_.finish()
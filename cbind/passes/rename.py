@@ -2,9 +2,18 @@
 
 '''Scan syntax tree and rename nodes.'''
 
-from cbind.passes.util import traverse_postorder
+from cbind.passes.manager import CustomPass, run_pass
 
 
 def scan_and_rename(syntax_tree, rename):
     '''Scan syntax tree and rename nodes.'''
-    traverse_postorder(syntax_tree, rename)
+    run_pass(syntax_tree, make_rename_pass(rename))
+
+
+def make_rename_pass(rename):
+    '''Make a pass that renames nodes.
+
+    Renaming matches on the original names of nodes, which are completed by
+    the anonymous POD pass.
+    '''
+    return CustomPass('rename', rename, requires=('anonymous_pod',))
@@ -2,58 +2,78 @@
 
 '''Scan syntax tree for required nodes.'''
 
+from collections import deque
+
 from cbind.cindex import CursorKind, TypeKind
-from cbind.passes.util import traverse_postorder, strip_type
+from cbind.passes.declaration_graph import (DeclarationGraph,
+                                            resolve_declaration)
+from cbind.passes.manager import Pass, run_pass
 import cbind.annotations as annotations
 
 
-def scan_required_nodes(syntax_tree, check_required):
+def scan_required_nodes(syntax_tree, check_required, graph=None):
     '''Breadth-first scan for required symbols.'''
+    run_pass(syntax_tree, RequiredNodesPass(check_required, graph=graph))
+
+
+class RequiredNodesPass(Pass):
+    '''Mark required nodes and then, breadth-first, their types.'''
 
-    def _scan_required(tree):
+    name = 'required_nodes'
+
+    def __init__(self, check_required, graph=None):
+        '''Initialize the object.'''
+        super(RequiredNodesPass, self).__init__()
+        self.check_required = check_required
+        self.graph = graph or DeclarationGraph()
+        self.visited = set()
+        self.todo = deque()
+
+    def visit(self, tree):
         '''Mark nodes as required.'''
-        if not check_required(tree):
+        if not self.check_required(tree):
             return
         tree.annotate(annotations.REQUIRED, True)
-        _scan_type_definition(tree.type, todo, visited)
+        self._add_type(tree.type)
         if tree.is_field_decl():
-            _scan_type_definition(tree.semantic_parent.type, todo, visited)
+            self._add_type(tree.semantic_parent.type)
         elif tree.kind == CursorKind.FUNCTION_DECL:
             if (not tree.type.is_function_variadic() and
                     tree.get_num_arguments() > 0):
                 for arg in tree.get_arguments():
-                    _scan_type_definition(arg.type, todo, visited)
+                    self._add_type(arg.type)
             if tree.result_type.kind != TypeKind.VOID:
-                _scan_type_definition(tree.result_type, todo, visited)
-
-    visited = set()
-    todo = []
-    traverse_postorder(syntax_tree, _scan_required)
-    call_scan_type_definition = lambda tree: \
-        _scan_type_definition(tree.type, todo, visited)
-    while todo:
-        # Trick is to copy todo and then empty it without creating a new list.
-        trees = list(todo)
-        todo[:] = []
-        for tree in trees:
-            tree.annotate(annotations.REQUIRED, True)
-            traverse_postorder(tree, call_scan_type_definition)
-
-
-def _scan_type_definition(type_, todo, visited):
-    '''Scan type definition.'''
-    if type_.is_user_defined_type():
-        tree = type_.get_declaration()
-        if not tree.is_user_defined_type_decl():
-            return
-        if tree in visited:
-            return
-        todo.append(tree)
-        visited.add(tree)
-        for field in tree.get_field_declaration():
-            _scan_type_definition(field.type, todo, visited)
-        return
-
-    stripped_type = strip_type(type_)
-    if stripped_type:
-        _scan_type_definition(stripped_type, todo, visited)
+                self._add_type(tree.result_type)
+
+    def finish(self):
+        '''Mark declarations reachable in the dependency graph required.'''
+        node_count = self.graph.node_count
+        todo, visited = self.todo, self.visited
+        while todo:
+            decl = todo.popleft()
+            decl.annotate(annotations.REQUIRED, True)
+            for dependency in self.graph.get_dependencies(decl):
+                if dependency not in visited:
+                    visited.add(dependency)
+                    todo.append(dependency)
+        self.node_count += self.graph.node_count - node_count
+
+    def _add_type(self, type_):
+        '''Add declaration of the type to the worklist.'''
+        decl = resolve_declaration(type_)
+        if decl is not None and decl not in self.visited:
+            self.visited.add(decl)
+            self.todo.append(decl)
+
+
+def find_required_files(syntax_tree):
+    '''Return names of files that have a required node.'''
+    snapshot = syntax_tree.snapshot
+    files = snapshot.find_files(
+        syntax_tree.annotation_table.get_nodes(annotations.REQUIRED))
+    # Trees under shallow nodes are not in the snapshot.
+    for tree in snapshot.other_trees.values():
+        location = tree.location
+        if location.file and tree.get_annotation(annotations.REQUIRED, False):
+            files.add(location.file.name)
+    return files
@@ -5,10 +5,15 @@
 from cbind.cindex import CursorKind, TypeKind
 
 
-def traverse_postorder(syntax_tree, postorder):
+def is_function_body(tree):
+    '''Test if a node is a function body, which we never traverse.'''
+    return tree.kind == CursorKind.COMPOUND_STMT
+
+
+def traverse_postorder(syntax_tree, postorder, files=None):
     '''Traverse syntax tree post order.'''
-    prune = lambda tree: tree.kind == CursorKind.COMPOUND_STMT
-    syntax_tree.traverse(postorder=postorder, prune=prune)
+    syntax_tree.traverse(postorder=postorder, prune=is_function_body,
+                         files=files)
 
 
 def strip_type(type_):
@@ -2,32 +2,63 @@
 
 '''Scan syntax tree's use of __va_list_tag.'''
 
-from cbind.passes.util import traverse_postorder, strip_type
+from cbind.passes.manager import Pass, run_pass
+from cbind.passes.util import strip_type
 import cbind.annotations as annotations
 
 
 def scan_va_list_tag(syntax_tree):
     '''Scan use of __va_list_tag.'''
-    try:
-        postorder = lambda tree: _scan_tree(tree, syntax_tree)
-        traverse_postorder(syntax_tree, postorder)
-    except StopIteration:
-        pass
+    run_pass(syntax_tree, VaListTagPass(syntax_tree))
 
 
-def _scan_tree(tree, root):
-    '''Scan this tree for __va_list_tag.'''
-    if not tree.get_annotation(annotations.REQUIRED, False):
+def export_va_list_tag(syntax_tree):
+    '''Return the key of __va_list_tag if it is used, or None.'''
+    va_list_tag = syntax_tree.get_annotation(annotations.USE_VA_LIST_TAG,
+                                             None)
+    return va_list_tag and va_list_tag.key
+
+
+def import_va_list_tag(syntax_tree, key):
+    '''Annotate use of __va_list_tag from its key (see export).
+
+    __va_list_tag is a builtin declaration, which is not in any file; scan
+    the syntax tree again if it is not found among them.
+    '''
+    if key is None:
         return
-    type_ = tree.type
-    while True:
-        if tree.name == '__va_list_tag':
-            root.annotate(annotations.USE_VA_LIST_TAG, tree)
-            raise StopIteration()  # Return from deeply recursion
+    for tree in syntax_tree.get_top_level_decls([None]):
+        if tree.key == key:
+            syntax_tree.annotate(annotations.USE_VA_LIST_TAG, tree)
+            return
+    scan_va_list_tag(syntax_tree)
+
+
+class VaListTagPass(Pass):
+    '''Find the first required node that uses __va_list_tag.'''
+
+    name = 'va_list_tag'
+    requires = ('required_nodes',)
+
+    def __init__(self, root):
+        '''Initialize the object.'''
+        super(VaListTagPass, self).__init__()
+        self.root = root
+
+    def visit(self, tree):
+        '''Scan this tree for __va_list_tag.'''
+        if not tree.get_annotation(annotations.REQUIRED, False):
+            return
+        type_ = tree.type
         while True:
-            type_ = strip_type(type_)
-            if not type_:
+            if tree.name == '__va_list_tag':
+                self.root.annotate(annotations.USE_VA_LIST_TAG, tree)
+                self.done = True
                 return
-            if type_.is_user_defined_type():
-                tree = type_.get_declaration()
-                break
+            while True:
+                type_ = strip_type(type_)
+                if not type_:
+                    return
+                if type_.is_user_defined_type():
+                    tree = type_.get_declaration()
+                    break
@@ -0,0 +1,422 @@
+# Copyright (C) 2013 Che-Liang Chiou.
+
+'''Flattened snapshot of a syntax tree.'''
+
+from array import array
+from collections import namedtuple
+from os.path import abspath, basename
+
+from cbind.cindex import CursorKind
+
+
+class File(namedtuple('File', 'name')):
+    '''A file of the snapshot.'''
+    # pylint: disable=W0232
+    pass
+
+
+class Location(namedtuple('Location', 'file line column offset')):
+    '''Source location of a node.'''
+    # pylint: disable=W0232
+    pass
+
+
+def make_key(kind, spelling, location):
+    '''Return the key of a node.
+
+    Declarations of the same kind and name share a key, and so do their
+    annotations; anonymous nodes are identified by their location.
+    '''
+    # Use kind value since kind objects may not survive pickling.
+    kind = getattr(kind, 'value', kind)
+    if spelling:
+        return (kind, spelling)
+    if location.file:
+        filename = basename(location.file.name)
+    else:
+        filename = '?'
+    return (kind, filename, location.offset)
+
+
+class KeyTable(object):
+    '''Identity table of node keys.
+
+    Key ids are small integers that index annotation stores, and so a key
+    table is owned by a forest and dropped along with its annotations.
+    '''
+
+    def __init__(self):
+        '''Initialize the object.'''
+        self._key_ids = {}
+        self._keys = []
+
+    def __len__(self):
+        '''Return number of keys.'''
+        return len(self._keys)
+
+    def intern(self, key):
+        '''Return the id of a node key.'''
+        key_id = self._key_ids.get(key)
+        if key_id is None:
+            key_id = self._key_ids[key] = len(self._keys)
+            self._keys.append(key)
+        return key_id
+
+    def get_key(self, key_id):
+        '''Return the node key of an id.'''
+        return self._keys[key_id]
+
+    def get_keys(self):
+        '''Return a list of all keys, indexed by their ids.'''
+        return list(self._keys)
+
+
+class Snapshot(object):
+    '''Columns of node properties extracted in a walk of a syntax tree.
+
+    Nodes are numbered in preorder, and so the descendants of node i are
+    the nodes in range(i + 1, ends[i]).  Function bodies are recorded as
+    leaf nodes; we never descend into them.  Neither do we descend into
+    shallow nodes, which are top-level nodes of files that are not
+    extracted; their children are read from libclang on demand.
+
+    A snapshot may be exported to, and restored in, another process that
+    has the same translation unit.  Cursors of a restored snapshot are
+    resolved on first use, one top-level subtree at a time.
+    '''
+
+    def __init__(self, root, key_table, files=None, state=None):
+        '''Extract properties of the tree under root cursor.
+
+        Node keys are interned in key_table.  If files is given, only
+        top-level nodes of the files are descended into; files are compared
+        by absolute path, as libclang may name them either way.  If state is
+        given, the properties are restored from it instead (see export()).
+        '''
+        self.key_table = key_table
+        # Interned syntax trees and types of this snapshot
+        self.other_trees = {}
+        self.types = {}
+        self._nodes = None
+        self._key_files = None
+        if state is not None:
+            self._restore(root, state)
+            return
+        if files is None:
+            self.extracted_files = None
+        else:
+            self.extracted_files = frozenset(
+                abspath(name) if name else None for name in files)
+        self.shallow = set()
+        self.cursors = []
+        self.kinds = []
+        self.spellings = []
+        self.parents = array('l')
+        self.ends = array('l')
+        self.files = array('l')
+        self.lines = array('l')
+        self.columns = array('l')
+        self.offsets = array('l')
+        self.key_ids = array('l')
+        self.file_table = []
+        self.top_level = {}
+        self._file_ids = {}
+        self._extract(root)
+        self.trees = [None] * len(self.kinds)
+        self._resolved = None
+
+    def __len__(self):
+        '''Return number of nodes.'''
+        return len(self.kinds)
+
+    def get_children(self, node):
+        '''Return an iterator of the children of a node.'''
+        child = node + 1
+        end = self.ends[node]
+        while child < end:
+            yield child
+            child = self.ends[child]
+
+    def get_cursor(self, node):
+        '''Return the cursor of a node.'''
+        cursor = self.cursors[node]
+        if cursor is None:
+            self._resolve(node)
+            cursor = self.cursors[node]
+        return cursor
+
+    def find_node(self, cursor):
+        '''Return the node of a cursor, or None if it is not a node.'''
+        if self._nodes is None:
+            self._nodes = dict((node_cursor, node) for node, node_cursor
+                               in enumerate(self.cursors)
+                               if node_cursor is not None)
+        node = self._nodes.get(cursor)
+        if node is None and self._resolved is not None:
+            node = self._find_unresolved_node(cursor)
+        return node
+
+    def export(self):
+        '''Return a picklable copy of the snapshot, without cursors.
+
+        Key ids are exported along with the keys of the key table, as ids
+        are local to a key table.
+        '''
+        return {
+            'kinds': array('l', (getattr(kind, 'value', kind)
+                                 for kind in self.kinds)),
+            'spellings': self.spellings,
+            'parents': self.parents,
+            'ends': self.ends,
+            'files': self.files,
+            'lines': self.lines,
+            'columns': self.columns,
+            'offsets': self.offsets,
+            'key_ids': self.key_ids,
+            'keys': self.key_table.get_keys(),
+            'file_table': [file_.name for file_ in self.file_table],
+            'top_level': self.top_level,
+            'shallow': self.shallow,
+            'extracted_files': self.extracted_files,
+        }
+
+    def get_top_level_nodes(self, file_names):
+        '''Return children of the root that are in the files, in order.
+
+        The name of the file of nodes that are not in any file is None.
+        '''
+        nodes = []
+        for name in file_names:
+            if name is None:
+                file_id = -1
+            else:
+                file_id = self._file_ids.get(name)
+            nodes.extend(self.top_level.get(file_id, ()))
+        nodes.sort()
+        return nodes
+
+    def find_file(self, path):
+        '''Return the name of a file as the snapshot names it, or path.
+
+        Names are compared by absolute path.
+        '''
+        abs_path = abspath(path)
+        for file_ in self.file_table:
+            if abspath(file_.name) == abs_path:
+                return file_.name
+        return path
+
+    def find_files(self, key_ids):
+        '''Return names of files that have a node of any of the key ids.
+
+        A node is in the file of its top-level ancestor.  The index from key
+        ids to files is built on first call.
+        '''
+        if self._key_files is None:
+            self._key_files = self._index_key_files()
+        file_ids = set()
+        for key_id in key_ids:
+            file_ids.update(self._key_files.get(key_id, ()))
+        return set(None if file_id < 0 else self.file_table[file_id].name
+                   for file_id in file_ids)
+
+    def _index_key_files(self):
+        '''Map key ids to ids of files that have a node of the key.'''
+        key_files = {}
+        key_ids = self.key_ids
+        for file_id, top_level_nodes in self.top_level.items():
+            for node in top_level_nodes:
+                for descendant in range(node, self.ends[node]):
+                    key_id = key_ids[descendant]
+                    file_ids = key_files.get(key_id)
+                    if file_ids is None:
+                        key_files[key_id] = file_ids = set()
+                    file_ids.add(file_id)
+        return key_files
+
+    def get_location(self, node):
+        '''Return source location of a node.'''
+        file_id = self.files[node]
+        if file_id < 0:
+            file_ = None
+        else:
+            file_ = self.file_table[file_id]
+        return Location(file_,
+                        self.lines[node],
+                        self.columns[node],
+                        self.offsets[node])
+
+    def _extract(self, root):
+        '''Walk the tree in preorder.'''
+        self._add(root, -1)
+        extracted = {}
+        for cursor in root.get_children():
+            node = self._add(cursor, 0)
+            file_id = self.files[node]
+            self.top_level.setdefault(file_id, array('l')).append(node)
+            if _is_function_body(cursor):
+                continue
+            if self.extracted_files is not None:
+                if file_id not in extracted:
+                    extracted[file_id] = self._is_extracted(file_id)
+                if not extracted[file_id]:
+                    self.shallow.add(node)
+                    continue
+            self._extract_subtree(cursor, node)
+        self.ends[0] = len(self.kinds)
+
+    def _restore(self, root, state):
+        '''Restore properties exported from a snapshot.'''
+        self.kinds = [_get_kind(value) for value in state['kinds']]
+        self.spellings = state['spellings']
+        self.parents = state['parents']
+        self.ends = state['ends']
+        self.files = state['files']
+        self.lines = state['lines']
+        self.columns = state['columns']
+        self.offsets = state['offsets']
+        # Re-intern keys in our key table.
+        key_ids = [self.key_table.intern(key) for key in state['keys']]
+        self.key_ids = array('l', (key_ids[key_id]
+                                   for key_id in state['key_ids']))
+        self.file_table = [File(name) for name in state['file_table']]
+        self._file_ids = dict((file_.name, file_id) for file_id, file_
+                              in enumerate(self.file_table))
+        self.top_level = state['top_level']
+        self.shallow = state['shallow']
+        self.extracted_files = state['extracted_files']
+        self.cursors = [None] * len(self.kinds)
+        self.cursors[0] = root
+        self.trees = [None] * len(self.kinds)
+        # Top-level nodes whose subtrees have been resolved
+        self._resolved = set()
+
+    def _resolve(self, node):
+        '''Resolve cursors of the top-level subtree of a node.'''
+        if not self._resolved:
+            top_level_nodes = list(self.get_children(0))
+            cursors = list(self.cursors[0].get_children())
+            if len(cursors) != len(top_level_nodes):
+                raise ValueError('Snapshot does not match translation unit')
+            for top_level_node, cursor in zip(top_level_nodes, cursors):
+                self._set_cursor(top_level_node, cursor)
+            self._resolved.add(0)
+        while self.parents[node] > 0:
+            node = self.parents[node]
+        if node in self._resolved:
+            return
+        self._resolved.add(node)
+        if node in self.shallow or self.ends[node] == node + 1:
+            return
+        cursor = self.cursors[node]
+        if hasattr(cursor, 'walk_subtree'):
+            descendants = cursor.walk_subtree(prune=_is_function_body)
+        else:
+            descendants = list(_walk_subtree(cursor, _is_function_body))
+        if len(descendants) != self.ends[node] - node - 1:
+            raise ValueError('Snapshot does not match translation unit')
+        for descendant, (cursor, _) in enumerate(descendants, node + 1):
+            self._set_cursor(descendant, cursor)
+
+    def _set_cursor(self, node, cursor):
+        '''Set the cursor of a node.'''
+        self.cursors[node] = cursor
+        if self._nodes is not None:
+            self._nodes[cursor] = node
+
+    def _find_unresolved_node(self, cursor):
+        '''Resolve the subtrees that may have a cursor and find it.
+
+        A cursor is most likely under the last top-level node of its file
+        that does not start after it; failing that, resolve the whole file.
+        '''
+        self._resolve(0)
+        location = cursor.location
+        if location.file:
+            # The snapshot may name the file differently (see find_file).
+            file_id = self._file_ids.get(self.find_file(location.file.name))
+        else:
+            file_id = -1
+        top_level_nodes = self.top_level.get(file_id, ())
+        candidates = [node for node in top_level_nodes
+                      if self.offsets[node] <= location.offset]
+        for nodes in (candidates[-1:], top_level_nodes):
+            for node in nodes:
+                self._resolve(node)
+            node = self._nodes.get(cursor)
+            if node is not None:
+                return node
+        return None
+
+    def _is_extracted(self, file_id):
+        '''Test if nodes of a file are extracted.'''
+        if file_id < 0:
+            return None in self.extracted_files
+        name = abspath(self.file_table[file_id].name)
+        return name in self.extracted_files
+
+    def _extract_subtree(self, cursor, node):
+        '''Walk the descendants of a top-level node in preorder.'''
+        if hasattr(cursor, 'walk_subtree'):
+            descendants = cursor.walk_subtree(prune=_is_function_body)
+        else:
+            descendants = _walk_subtree(cursor, _is_function_body)
+        ancestors = [node]
+        for descendant, depth in descendants:
+            while len(ancestors) > depth:
+                self.ends[ancestors.pop()] = len(self.kinds)
+            ancestors.append(self._add(descendant, ancestors[-1]))
+        while ancestors:
+            self.ends[ancestors.pop()] = len(self.kinds)
+
+    def _add(self, cursor, parent):
+        '''Append a node to the columns.'''
+        node = len(self.kinds)
+        self.cursors.append(cursor)
+        self.kinds.append(cursor.kind)
+        self.spellings.append(cursor.spelling)
+        self.parents.append(parent)
+        self.ends.append(node + 1)
+        location = cursor.location
+        if location.file:
+            self.files.append(self._get_file_id(location.file.name))
+        else:
+            self.files.append(-1)
+        self.lines.append(location.line)
+        self.columns.append(location.column)
+        self.offsets.append(location.offset)
+        self.key_ids.append(self.key_table.intern(make_key(
+            self.kinds[node], self.spellings[node], location)))
+        return node
+
+    def _get_file_id(self, name):
+        '''Return index of a file in the file table.'''
+        file_id = self._file_ids.get(name)
+        if file_id is None:
+            file_id = self._file_ids[name] = len(self.file_table)
+            self.file_table.append(File(name))
+        return file_id
+
+
+def _get_kind(value):
+    '''Return the cursor kind of a value.'''
+    # clang.cindex makes kinds with from_id(); min_cindex, with the class.
+    return getattr(CursorKind, 'from_id', CursorKind)(value)
+
+
+def _is_function_body(cursor):
+    '''Test if a cursor is a function body, which we never descend into.'''
+    return cursor.kind == CursorKind.COMPOUND_STMT
+
+
+def _walk_subtree(root, prune):
+    '''Generate (cursor, depth) of descendants in preorder.'''
+    stack = [iter(root.get_children())]
+    while stack:
+        for cursor in stack[-1]:
+            yield cursor, len(stack)
+            if not prune(cursor):
+                stack.append(iter(cursor.get_children()))
+                break
+        else:
+            stack.pop()
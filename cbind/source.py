@@ -2,42 +2,242 @@
 
 '''Data structures representing C source codes'''
 
-from collections import defaultdict
 from os.path import basename
 import logging
+import os
+import shutil
+import tempfile
 
+from cbind.annotation_store import AnnotationStore
 import cbind.annotations as annotations
+from cbind.snapshot import KeyTable, Snapshot, make_key
 from cbind.cindex import (Index, Cursor, CursorKind, Diagnostic,
-                          Type, TypeKind, LinkageKind)
+                          Type, TypeKind, LinkageKind, TranslationUnit)
+
+
+class ParseSession:
+    '''Hold the libclang objects that are shared among parses.'''
+
+    def __init__(self, cache=None):
+        '''Initialize the object.'''
+        self._index = None
+        self._pch_args = []
+        self._tmp_dir = None
+        self.cache = cache
+
+    @property
+    def index(self):
+        '''Return the Index object, creating it on first use.'''
+        if self._index is None:
+            self._index = Index.create()
+        return self._index
+
+    def parse(self, path, args=None, unsaved_files=None, options=0):
+        '''Parse C source file into a translation unit.
+
+        Return the translation unit and a list of (severity, message) pairs
+        of its diagnostics.
+        '''
+        args = list(args or ()) + self._pch_args
+        if self.cache:
+            result = self.cache.load(self.index, path, args, unsaved_files,
+                                     options)
+            if result:
+                return result
+        tunit = self.index.parse(path, args=args, unsaved_files=unsaved_files,
+                                 options=options)
+        diagnostics = _format_diagnostics(tunit)
+        if self.cache:
+            self.cache.save(tunit, diagnostics, path, args, unsaved_files,
+                            options)
+        return tunit, diagnostics
+
+    def add_prelude(self, path, args=None):
+        '''Precompile a header and include it in every later parse.'''
+        if self._pch_args:
+            raise ValueError('Could not add more than one prelude')
+        options = TranslationUnit.PARSE_INCOMPLETE
+        tunit, diagnostics = self.parse(path, args=args, options=options)
+        _check_diagnostics(diagnostics, SyntaxTree.SEVERITY)
+        pch_path = None
+        if self.cache:
+            # A translation unit parsed as incomplete is a PCH file.
+            pch_path = self.cache.get_ast_path(path, args, None, options)
+        if not pch_path:
+            pch_path = os.path.join(self.get_temporary_directory(),
+                                    basename(path) + '.pch')
+            tunit.save(pch_path)
+        self._pch_args = ['-include-pch', pch_path]
+
+    @property
+    def prelude_args(self):
+        '''Return clang arguments that include the precompiled prelude.'''
+        return list(self._pch_args)
+
+    def get_temporary_directory(self):
+        '''Return a directory that is removed when the session is closed.'''
+        if self._tmp_dir is None:
+            self._tmp_dir = tempfile.mkdtemp(prefix='cbind-')
+        return self._tmp_dir
+
+    def close(self):
+        '''Release the Index object and temporary files.
+
+        Translation units hold their own reference to the Index, and so
+        the Index is disposed after the last translation unit is.
+        '''
+        self._index = None
+        self._pch_args = []
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir)
+            self._tmp_dir = None
+
+
+def _format_diagnostics(tunit):
+    '''Format diagnostics of translation unit.'''
+    diagnostics = []
+    for diag in tunit.diagnostics:
+        # I can't think of any test cases or real world scenarios
+        # that diag.location.file is None...
+        assert diag.location.file
+        severity_str = {
+            Diagnostic.Ignored: 'IGNORE',
+            Diagnostic.Note:    'NOTE',
+            Diagnostic.Warning: 'WARNING',
+            Diagnostic.Error:   'ERROR',
+            Diagnostic.Fatal:   'FATAL',
+        }[diag.severity]
+        message = '%s:%d:%d: %s: %s' % (diag.location.file.name,
+                                        diag.location.line,
+                                        diag.location.column,
+                                        severity_str,
+                                        diag.spelling)
+        diagnostics.append((diag.severity, message))
+    return diagnostics
+
+
+def _check_diagnostics(diagnostics, severity):
+    '''Raise diagnostics of high severity; log the others.'''
+    for diag_severity, message in diagnostics:
+        if diag_severity >= severity:
+            raise SyntaxError(message)
+        logging.info(message)
 
 
 class SyntaxTreeForest(list):
-    '''A list of syntax trees that share a common annotation table.'''
+    '''A list of syntax trees that share a common annotation table.
+
+    The annotation table is indexed by ids of node keys, which are interned
+    in the key table of the forest.
+    '''
 
-    def __init__(self):
+    def __init__(self, session=None):
         '''Initialize the object.'''
-        self.annotation_table = defaultdict(dict)
+        self.key_table = KeyTable()
+        self.annotation_table = AnnotationStore()
+        self.session = session or ParseSession()
         super(SyntaxTreeForest, self).__init__()
 
-    def parse(self, path, contents=None, args=None):
-        '''Parse C source file.'''
+    def parse(self, path, contents=None, args=None, options=0, files=None,
+              state=None):
+        '''Parse C source file.
+
+        If files is given, only top-level nodes of the files are extracted
+        into the snapshot (see Snapshot).  If state is given, the snapshot
+        is restored from it rather than extracted.
+        '''
         syntax_tree = SyntaxTree.parse(path, contents=contents, args=args,
-                                       annotation_table=self.annotation_table)
+                                       options=options, files=files,
+                                       state=state,
+                                       annotation_table=self.annotation_table,
+                                       key_table=self.key_table,
+                                       session=self.session)
         self.append(syntax_tree)
         return syntax_tree
 
+    def export_annotations(self):
+        '''Return a picklable copy of the annotation table.
+
+        Annotations whose value is a syntax tree are not exported because
+        a syntax tree is bound to the process that parsed it.
+        '''
+        table = {}
+        for key_id, node_annotations in self.annotation_table.items():
+            node_annotations = dict((name, value) for name, value
+                                    in node_annotations.items()
+                                    if not isinstance(value, SyntaxTree))
+            if node_annotations:
+                table[self.key_table.get_key(key_id)] = node_annotations
+        return table
+
+    def merge_annotations(self, table):
+        '''Merge annotations exported from another forest.'''
+        for key, node_annotations in table.items():
+            self.annotation_table.update(self.key_table.intern(key),
+                                         node_annotations)
+
+
+# Key table of trees that are not in any snapshot, which are only made by
+# tests
+_DETACHED_KEY_TABLE = KeyTable()
+
 
 def _make_subtree_iterator(iter_cursors):
     '''Create wrapper of cursor iterator.'''
     def wrapper(self):
         '''Wrapper of cursor iterator.'''
         for cursor in iter_cursors(self.cursor):
-            yield SyntaxTree(cursor, None, self.annotation_table)
+            yield _get_tree(self, cursor)
     return wrapper
 
 
-class SyntaxTree:
-    '''Class represents an abstract syntax tree.'''
+def _get_tree(owner, cursor):
+    '''Return the tree of a cursor, which is interned in the snapshot.'''
+    snapshot = owner.snapshot
+    if snapshot is None:
+        return SyntaxTree(cursor, None, owner.annotation_table)
+    node = snapshot.find_node(cursor)
+    if node is not None:
+        return _get_node_tree(snapshot, owner.annotation_table, node)
+    tree = snapshot.other_trees.get(cursor)
+    if tree is None:
+        tree = SyntaxTree(cursor, None, owner.annotation_table, snapshot)
+        snapshot.other_trees[cursor] = tree
+    return tree
+
+
+def _get_node_tree(snapshot, annotation_table, node):
+    '''Return the tree of a snapshot node.'''
+    tree = snapshot.trees[node]
+    if tree is None:
+        # The cursor is resolved on first use (see SyntaxTree.cursor).
+        tree = SyntaxTree(None, None, annotation_table, snapshot, node)
+        snapshot.trees[node] = tree
+    return tree
+
+
+def _get_type(syntax_tree, c_type):
+    '''Return the type object, which is interned in the snapshot.'''
+    snapshot = syntax_tree.snapshot
+    if snapshot is None:
+        return SyntaxTreeType(c_type, syntax_tree)
+    # Types are equal if and only if their data are equal.
+    key = (c_type.kind.value, c_type.data[0], c_type.data[1])
+    type_ = snapshot.types.get(key)
+    if type_ is None:
+        type_ = snapshot.types[key] = SyntaxTreeType(c_type, syntax_tree)
+    return type_
+
+
+class SyntaxTree(object):
+    '''Class represents an abstract syntax tree.
+
+    Syntax trees and their types are interned in the snapshot of their
+    translation unit, and they cache properties resolved from libclang.
+    '''
+
+    __slots__ = ('_cursor', 'translation_unit', 'annotation_table',
+                 'snapshot', 'node', '_key_id', '_attrs')
 
     SEVERITY = Diagnostic.Warning
 
@@ -49,11 +249,8 @@ class SyntaxTree:
         is_bitfield
         is_definition
         is_static_method
-        kind
-        location
         result_type
         semantic_parent
-        spelling
         type
         underlying_typedef_type
     '''.split())
@@ -78,51 +275,57 @@ class SyntaxTree:
                                  CursorKind.CLASS_DECL))
 
     @classmethod
-    def parse(cls, path, contents=None, args=None, annotation_table=None):
+    def parse(cls, path, contents=None, args=None, options=0, files=None,
+              state=None, annotation_table=None, key_table=None,
+              session=None):
         '''Parse C source file.'''
         if contents:
+            if hasattr(contents, 'read'):
+                contents = contents.read()
             unsaved_files = [(path, contents)]
         else:
             unsaved_files = None
-        # XXX Hold Index object at local level instead of module level
-        # because Python module cleanup does not guarantee that this module
-        # is cleaned up before cbind.cindex (and libclang).  If the cleanup
-        # ordering is reversed, Index.__del__ will be called after libclang
-        # is released.
-        index = Index.create()
-        tunit = index.parse(path, args=args, unsaved_files=unsaved_files)
-        for diag in tunit.diagnostics:
-            # I can't think of any test cases or real world scenarios
-            # that diag.location.file is None...
-            assert diag.location.file
-            severity_str = {
-                Diagnostic.Ignored: 'IGNORE',
-                Diagnostic.Note:    'NOTE',
-                Diagnostic.Warning: 'WARNING',
-                Diagnostic.Error:   'ERROR',
-                Diagnostic.Fatal:   'FATAL',
-            }[diag.severity]
-            message = '%s:%d:%d: %s: %s' % (diag.location.file.name,
-                                            diag.location.line,
-                                            diag.location.column,
-                                            severity_str,
-                                            diag.spelling)
-            if diag.severity >= cls.SEVERITY:
-                raise SyntaxError(message)
-            logging.info(message)
+        # The Index object is held in a session owned by the caller instead
+        # of at module level because Python module cleanup does not
+        # guarantee that this module is cleaned up before cbind.cindex (and
+        # libclang).  If the cleanup ordering is reversed, Index.__del__
+        # will be called after libclang is released.
+        if session is None:
+            session = ParseSession()
+        tunit, diagnostics = session.parse(path, args=args,
+                                           unsaved_files=unsaved_files,
+                                           options=options)
+        _check_diagnostics(diagnostics, cls.SEVERITY)
         if annotation_table is None:
-            annotation_table = defaultdict(dict)
-        return cls(tunit.cursor, tunit, annotation_table)
+            annotation_table = AnnotationStore()
+        if key_table is None:
+            key_table = KeyTable()
+        snapshot = Snapshot(tunit.cursor, key_table, files=files,
+                            state=state)
+        syntax_tree = snapshot.trees[0] = cls(tunit.cursor, tunit,
+                                              annotation_table,
+                                              snapshot=snapshot, node=0)
+        return syntax_tree
 
-    def __init__(self, cursor, translation_unit, annotation_table):
-        '''Initialize the object.'''
-        self.cursor = cursor
+    # pylint: disable=R0913
+    def __init__(self, cursor, translation_unit, annotation_table,
+                 snapshot=None, node=None):
+        '''Initialize the object.
+
+        A node of a snapshot reads its kind, spelling, location, and
+        children from the snapshot rather than from libclang.
+        '''
+        self._cursor = cursor
         self.translation_unit = translation_unit
         self.annotation_table = annotation_table
+        self.snapshot = snapshot
+        self.node = node
+        self._key_id = None
+        self._attrs = {}
 
     def __eq__(self, other):
         '''Implement __eq__().'''
-        return hash(self) == hash(other)
+        return isinstance(other, SyntaxTree) and self.key_id == other.key_id
 
     def __ne__(self, other):
         '''Implement __ne__().'''
@@ -130,15 +333,56 @@ class SyntaxTree:
 
     def __hash__(self):
         '''Compute hash of the cursor.'''
-        cursor = self.cursor
-        if cursor.spelling:
-            return hash('%s:%s' % (cursor.kind, cursor.spelling))
-        if cursor.location.file:
-            filename = basename(cursor.location.file.name)
-        else:
-            filename = '?'
-        return hash('%s:%s:%d' %
-                    (cursor.kind, filename, cursor.location.offset))
+        return self.key_id
+
+    @property
+    def cursor(self):
+        '''Return the cursor of this node.'''
+        if self._cursor is None:
+            self._cursor = self.snapshot.get_cursor(self.node)
+        return self._cursor
+
+    @property
+    def key(self):
+        '''Return a tuple that identifies this node across parses.'''
+        return self._get_key_table().get_key(self.key_id)
+
+    @property
+    def key_id(self):
+        '''Return the interned id of the node key.'''
+        if self.node is not None:
+            return self.snapshot.key_ids[self.node]
+        if self._key_id is None:
+            self._key_id = self._get_key_table().intern(
+                make_key(self.kind, self.spelling, self.location))
+        return self._key_id
+
+    def _get_key_table(self):
+        '''Return the table in which the key of this node is interned.'''
+        if self.snapshot is None:
+            return _DETACHED_KEY_TABLE
+        return self.snapshot.key_table
+
+    @property
+    def kind(self):
+        '''Return kind of this node.'''
+        if self.node is None:
+            return self.cursor.kind
+        return self.snapshot.kinds[self.node]
+
+    @property
+    def spelling(self):
+        '''Return spelling of this node.'''
+        if self.node is None:
+            return self.cursor.spelling
+        return self.snapshot.spellings[self.node]
+
+    @property
+    def location(self):
+        '''Return source location of this node.'''
+        if self.node is None:
+            return self.cursor.location
+        return self.snapshot.get_location(self.node)
 
     def __getattr__(self, name):
         '''Get property.'''
@@ -146,11 +390,16 @@ class SyntaxTree:
             cls = self.__class__.__name__
             message = '\'%s\' object has no attribute \'%s\'' % (cls, name)
             raise AttributeError(message)
+        try:
+            return self._attrs[name]
+        except KeyError:
+            pass
         attr = getattr(self.cursor, name)
         if isinstance(attr, Cursor):
-            attr = SyntaxTree(attr, None, self.annotation_table)
+            attr = _get_tree(self, attr)
         elif isinstance(attr, Type):
-            attr = SyntaxTreeType(attr, self)
+            attr = _get_type(self, attr)
+        self._attrs[name] = attr
         return attr
 
     @property
@@ -179,7 +428,16 @@ class SyntaxTree:
         '''Test if this is a field declaration.'''
         return self.kind in self.UDT_FIELD_DECL
 
-    get_children = _make_subtree_iterator(Cursor.get_children)
+    def get_children(self):
+        '''Get direct sub-trees.'''
+        if self.node is None or self.node in self.snapshot.shallow:
+            for cursor in self.cursor.get_children():
+                yield _get_tree(self, cursor)
+            return
+        snapshot = self.snapshot
+        for node in snapshot.get_children(self.node):
+            yield _get_node_tree(snapshot, self.annotation_table, node)
+
     get_arguments = _make_subtree_iterator(Cursor.get_arguments)
 
     def get_field_declaration(self):
@@ -198,38 +456,76 @@ class SyntaxTree:
             if child_tree.kind == CursorKind.CXX_METHOD:
                 yield child_tree
 
-    def traverse(self, preorder=None, postorder=None, prune=None):
-        '''Traverse the syntax tree.'''
+    def get_top_level_decls(self, files):
+        '''Get direct sub-trees that are in the files.'''
+        if self.node is None:
+            for child_tree in self.get_children():
+                location = child_tree.location
+                if location.file:
+                    name = location.file.name
+                else:
+                    name = None
+                if name in files:
+                    yield child_tree
+            return
+        snapshot = self.snapshot
+        for node in snapshot.get_top_level_nodes(files):
+            yield _get_node_tree(snapshot, self.annotation_table, node)
+
+    def traverse(self, preorder=None, postorder=None, prune=None,
+                 files=None):
+        '''Traverse the syntax tree.
+
+        If files is given, skip direct sub-trees that are not in the files.
+        '''
         if prune and prune(self):
             return
         if preorder:
             preorder(self)
-        for child_tree in self.get_children():
+        if files is None:
+            children = self.get_children()
+        else:
+            children = self.get_top_level_decls(files)
+        for child_tree in children:
             child_tree.traverse(preorder, postorder, prune)
         if postorder:
             postorder(self)
 
+    def get_memoized(self, name, compute):
+        '''Return compute(self), which is cached until names change.'''
+        return _get_memoized(self, name, compute)
+
     def annotate(self, key, value):
         '''Annotate this node.'''
-        self.annotation_table[self][key] = value
+        self.annotation_table.set(self.key_id, key, value)
 
     def get_annotation(self, key, default):
         '''Get the annotation.'''
-        return self.annotation_table[self].get(key, default)
+        return self.annotation_table.get(self.key_id, key, default)
 
 
 def _make_type_getter(getter):
     '''Create wrapper of type getter.'''
+    # ctypes function pointers (getters of min_cindex) are not hashable.
+    attr_key = id(getter)
+
     def wrapper(self):
         '''Wrapper of type getter.'''
-        c_type = getter(self.c_type)
-        return SyntaxTreeType(c_type, self.syntax_tree)
+        try:
+            return self._attrs[attr_key]
+        except KeyError:
+            pass
+        type_ = _get_type(self.syntax_tree, getter(self.c_type))
+        self._attrs[attr_key] = type_
+        return type_
     return wrapper
 
 
-class SyntaxTreeType:
+class SyntaxTreeType(object):
     '''Class represents C type.'''
 
+    __slots__ = ('c_type', 'syntax_tree', '_attrs')
+
     PROPERTIES = frozenset('''
         is_const_qualified
         is_function_variadic
@@ -237,6 +533,7 @@ class SyntaxTreeType:
         get_align
         get_array_size
         get_offset
+        get_size
         get_ref_qualifier
         kind
     '''.split())
@@ -248,6 +545,7 @@ class SyntaxTreeType:
         '''Initialize the object.'''
         self.c_type = c_type
         self.syntax_tree = syntax_tree
+        self._attrs = {}
 
     def __eq__(self, _):
         '''Wrapper of __eq__().'''
@@ -263,13 +561,22 @@ class SyntaxTreeType:
             cls = self.__class__.__name__
             message = '\'%s\' object has no attribute \'%s\'' % (cls, name)
             raise AttributeError(message)
-        attr = getattr(self.c_type, name)
+        try:
+            return self._attrs[name]
+        except KeyError:
+            pass
+        attr = self._attrs[name] = getattr(self.c_type, name)
         return attr
 
     def get_declaration(self):
         '''Wrapper of get_declaration.'''
-        cursor = self.c_type.get_declaration()
-        return SyntaxTree(cursor, None, self.syntax_tree.annotation_table)
+        try:
+            return self._attrs['get_declaration']
+        except KeyError:
+            pass
+        tree = _get_tree(self.syntax_tree, self.c_type.get_declaration())
+        self._attrs['get_declaration'] = tree
+        return tree
 
     get_array_element_type = _make_type_getter(Type.get_array_element_type)
     get_canonical = _make_type_getter(Type.get_canonical)
@@ -284,9 +591,33 @@ class SyntaxTreeType:
 
     def get_argument_types(self):
         '''Get type of arguments.'''
-        return tuple(SyntaxTreeType(c_type, self.syntax_tree)
-                     for c_type in self.c_type.argument_types())
+        try:
+            return self._attrs['get_argument_types']
+        except KeyError:
+            pass
+        argument_types = tuple(_get_type(self.syntax_tree, c_type)
+                               for c_type in self.c_type.argument_types())
+        self._attrs['get_argument_types'] = argument_types
+        return argument_types
 
     def is_user_defined_type(self):
         '''Test if this type is user-defined.'''
         return self.kind in self.UDT
+
+    def get_memoized(self, name, compute):
+        '''Return compute(self), which is cached until names change.'''
+        return _get_memoized(self, name, compute)
+
+
+def _get_memoized(obj, name, compute):
+    '''Memoize results derived from names of nodes.'''
+    # Types are interned, and so a type's cache is keyed by type identity.
+    if isinstance(obj, SyntaxTreeType):
+        generation = obj.syntax_tree.annotation_table.generation
+    else:
+        generation = obj.annotation_table.generation
+    entry = obj._attrs.get(name)  # pylint: disable=W0212
+    if entry is None or entry[0] != generation:
+        entry = (generation, compute(obj))
+        obj._attrs[name] = entry  # pylint: disable=W0212
+    return entry[1]
@@ -21,11 +21,61 @@ class TestCtypesBindingGenerator(unittest.TestCase):
     def run_test(self, c_code, python_code,
                  filename='input.c', args=None, config=None,
                  enable_cpp=False,
-                 assert_layout=False):
+                 assert_layout=False,
+                 lazy=False,
+                 alias_types=False,
+                 numpy_dtype=False,
+                 bulk_readers=False,
+                 backend=None):
         '''Generate Python code from C code and compare it to the answer.'''
+        cbgen, gen_code = self.generate(c_code, filename=filename, args=args,
+                                        config=config,
+                                        enable_cpp=enable_cpp,
+                                        assert_layout=assert_layout,
+                                        lazy=lazy,
+                                        alias_types=alias_types,
+                                        numpy_dtype=numpy_dtype,
+                                        bulk_readers=bulk_readers,
+                                        backend=backend)
+        error_message = prepare_error_message(
+            python_code, gen_code, tunits=cbgen.get_translation_units())
+        self.assertTrue(compare_codes(gen_code, python_code), error_message)
+        code = compile(gen_code, 'output.py', 'exec')
+        if assert_layout:
+            # Test if layout assertions are true
+            exec(code, self.get_env())  # pylint: disable=W0122
+
+    def load_binding(self, c_code, library=None, **kwargs):
+        '''Generate Python code from C code and run it; return its globals.
+
+        The binding loads symbols from library, or from a dummy one if it is
+        not given.  Other arguments are passed to generate().
+        '''
+        _, gen_code = self.generate(c_code, **kwargs)
+        code = compile(gen_code, 'output.py', 'exec')
+        env = dict(vars(ctypes))
+        env['_lib'] = Everything() if library is None else library
+        exec(code, env)  # pylint: disable=W0122
+        return env
+
+    # pylint: disable=R0913
+    @staticmethod
+    def generate(c_code, filename='input.c', args=None, config=None,
+                 enable_cpp=False,
+                 assert_layout=False,
+                 lazy=False,
+                 alias_types=False,
+                 numpy_dtype=False,
+                 bulk_readers=False,
+                 backend=None):
+        '''Generate Python code from C code; return generator and code.'''
         CodeGen.ENABLE_CPP = enable_cpp
         CodeGen.ASSERT_LAYOUT = assert_layout
-        cbgen = CtypesBindingGenerator()
+        CodeGen.LAZY = lazy
+        CodeGen.ALIAS_TYPES = alias_types
+        CodeGen.NUMPY_DTYPE = numpy_dtype
+        CodeGen.BULK_READERS = bulk_readers
+        cbgen = CtypesBindingGenerator(backend=backend)
         if config is not None:
             import yaml
             config = yaml.load(config)
@@ -41,15 +91,7 @@ class TestCtypesBindingGenerator(unittest.TestCase):
         if config and 'preamble' in config:
             cbgen.generate_preamble('cbind', None, output)
         cbgen.generate(output)
-        gen_code = output.getvalue()
-
-        error_message = prepare_error_message(
-            python_code, gen_code, tunits=cbgen.get_translation_units())
-        self.assertTrue(compare_codes(gen_code, python_code), error_message)
-        code = compile(gen_code, 'output.py', 'exec')
-        if assert_layout:
-            # Test if layout assertions are true
-            exec(code, self.get_env())  # pylint: disable=W0122
+        return cbgen, output.getvalue()
 
     @staticmethod
     def get_env():
@@ -2,15 +2,18 @@ import sys
 import unittest
 
 import test_builtin
+import test_cffi_backend
 import test_cindex
 import test_class
 import test_config
 import test_cparser
+import test_emitter
 import test_enum
 import test_function
 import test_include
 import test_macro
 import test_multiple_sources
+import test_package
 import test_struct
 import test_typedef
 import test_union
@@ -19,15 +22,18 @@ import test_variable
 
 suite_all = unittest.TestSuite([
     unittest.TestLoader().loadTestsFromModule(test_builtin),
+    unittest.TestLoader().loadTestsFromModule(test_cffi_backend),
     unittest.TestLoader().loadTestsFromModule(test_cindex),
     unittest.TestLoader().loadTestsFromModule(test_class),
     unittest.TestLoader().loadTestsFromModule(test_config),
     unittest.TestLoader().loadTestsFromModule(test_cparser),
+    unittest.TestLoader().loadTestsFromModule(test_emitter),
     unittest.TestLoader().loadTestsFromModule(test_enum),
     unittest.TestLoader().loadTestsFromModule(test_function),
     unittest.TestLoader().loadTestsFromModule(test_include),
     unittest.TestLoader().loadTestsFromModule(test_macro),
     unittest.TestLoader().loadTestsFromModule(test_multiple_sources),
+    unittest.TestLoader().loadTestsFromModule(test_package),
     unittest.TestLoader().loadTestsFromModule(test_struct),
     unittest.TestLoader().loadTestsFromModule(test_typedef),
     unittest.TestLoader().loadTestsFromModule(test_union),
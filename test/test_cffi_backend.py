@@ -0,0 +1,195 @@
+import unittest
+import helper
+import cbind.codegen.cffi_backend
+
+
+def check_yaml():
+    try:
+        import yaml
+    except ImportError:
+        return False
+    else:
+        return True
+
+
+def check_cffi():
+    try:
+        import cffi
+    except ImportError:
+        return False
+    else:
+        return True
+
+
+class TestCffiBackend(helper.TestCtypesBindingGenerator):
+
+    def test_declarations(self):
+        self.run_test('''
+struct foo {
+    int i;
+    unsigned int flag : 1;
+    int (*cb)(int);
+};
+
+typedef struct foo foo_t;
+
+enum color {
+    RED,
+    GREEN = 2,
+};
+
+extern int counter;
+
+foo_t *make_foo(const char *name, ...);
+        ''', """ffi.cdef('''
+struct foo {
+    int i;
+    unsigned int flag : 1;
+    int (*cb)(int);
+};
+typedef struct foo foo_t;
+enum color {
+    RED = 0,
+    GREEN = 2,
+};
+int counter;
+struct foo *make_foo(char *, ...);
+''')
+""" + cbind.codegen.cffi_backend.CFFI_RECORD + '''
+class foo(_CffiRecord):
+    _ctype_ = 'struct foo'
+
+foo_t = foo
+
+RED = 0
+GREEN = 2
+
+counter = ffi.addressof(_lib, 'counter')
+
+make_foo = _lib.make_foo
+        ''', backend='cffi')
+
+    @unittest.skipIf(not check_yaml(), 'require package yaml')
+    def test_annotations(self):
+        self.run_test('''
+struct foo {
+    int i;
+};
+
+int foo_get(struct foo *);
+
+int foo_check(void);
+        ''', """ffi.cdef('''
+struct foo {
+    int i;
+};
+int foo_get(struct foo *);
+int foo_check(void);
+''')
+""" + (cbind.codegen.cffi_backend.CFFI_RECORD +
+       cbind.codegen.cffi_backend.CFFI_FUNCTOR +
+       cbind.codegen.cffi_backend.CFFI_ERRCHECK) + '''
+class Foo(FooMixin, _CffiRecord):
+    _ctype_ = 'struct foo'
+
+foo_get = _lib.foo_get
+Foo.get = _CffiFunctor(foo_get)
+
+foo_check = _CffiErrcheck(_lib.foo_check, check_result)
+        ''', config='''
+rename:
+    - name: ^foo$
+      rename: Foo
+method:
+    - name: ^foo_get$
+      method: Foo.get
+errcheck:
+    - name: ^foo_check$
+      errcheck: check_result
+mixin:
+    - name: ^foo$
+      mixin: [FooMixin]
+        ''', backend='cffi')
+
+    @unittest.skipIf(not check_yaml(), 'require package yaml')
+    def test_batch(self):
+        with self.assertRaises(ValueError):
+            self.generate('''
+int abs(int);
+            ''', backend='cffi', config='''
+batch:
+    - name: ^abs$
+      batch: True
+            ''')
+
+    @unittest.skipIf(not check_yaml(), 'require package yaml')
+    def test_rename_fields(self):
+        self.run_test('''
+struct foo;
+struct bar {
+    struct foo *foo;
+};
+struct foo {
+    int x_value;
+    int y;
+};
+        ''', """ffi.cdef('''
+struct foo;
+struct bar {
+    struct foo *foo;
+};
+struct foo {
+    int x_value;
+    int y;
+};
+''')
+""" + cbind.codegen.cffi_backend.CFFI_RECORD + '''
+class foo(_CffiRecord):
+    _ctype_ = 'struct foo'
+
+class bar(_CffiRecord):
+    _ctype_ = 'struct bar'
+
+foo._field_names_ = {'x_value': 'x'}
+        ''', config='''
+rename:
+    - name: ^x_value$
+      rename: x
+        ''', backend='cffi')
+
+    @unittest.skipIf(not check_cffi() or not check_yaml(),
+                     'require packages cffi and yaml')
+    def test_cdef(self):
+        import cffi
+        _, gen_code = self.generate('''
+struct foo {
+    int x_value;
+    unsigned int flag : 1;
+    union {
+        int i;
+        float f;
+    } u;
+};
+
+typedef struct foo foo_t;
+
+enum color { RED, GREEN = 2 };
+
+foo_t *make_foo(const char *name, ...);
+        ''', config='''
+rename:
+    - name: ^x_value$
+      rename: x
+        ''', backend='cffi')
+        env = {'ffi': cffi.FFI(), '_lib': helper.Everything()}
+        exec(gen_code, env)  # pylint: disable=W0122
+        foo = env['foo'](x=1, flag=1)
+        self.assertEqual((1, 1), (foo.x, foo.flag))
+        foo.x = 2
+        self.assertEqual(2, foo._cdata.x_value)
+        self.assertEqual(2, env['GREEN'])
+        self.assertIs(env['foo'], env['foo_t'])
+
+
+if __name__ == '__main__':
+    unittest.main()
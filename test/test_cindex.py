@@ -1,11 +1,22 @@
 import os
+import shutil
 import tempfile
 import unittest
 
 import helper
 import cbind
+import cbind.annotations as annotations
+from cbind.annotation_store import AnnotationStore
+from cbind.cache import TranslationUnitCache
+from cbind.compatibility import StringIO
+from cbind.cindex import CursorKind
+from cbind.codegen import CodeGen
 from cbind.ctypes_binding import CtypesBindingGenerator
-from cbind.source import SyntaxTree, SyntaxTreeType
+from cbind.passes import find_required_files
+from cbind.passes.manager import CustomPass, PassManager, schedule
+from cbind.passes.util import traverse_postorder
+from cbind.snapshot import KeyTable
+from cbind.source import ParseSession, SyntaxTree, SyntaxTreeType
 
 
 class TestCIndex(helper.TestCtypesBindingGenerator):
@@ -54,6 +65,348 @@ int foo(,);
         with self.assertRaises(AttributeError):
             t1.xxx
 
+    def test_annotation_store(self):
+        store = AnnotationStore()
+        size = store.memory_usage()
+        self.assertFalse(store.get(100, annotations.REQUIRED, False))
+        self.assertIsNone(store.get(100, annotations.NAME, None))
+        self.assertEqual(size, store.memory_usage())
+        self.assertEqual([], store.items())
+
+        store.set(100, annotations.REQUIRED, True)
+        store.set(3, annotations.REQUIRED, False)
+        store.set(3, annotations.NAME, 'foo')
+        self.assertTrue(store.get(100, annotations.REQUIRED, False))
+        self.assertFalse(store.get(3, annotations.REQUIRED, True))
+        self.assertTrue(store.get(4, annotations.REQUIRED, True))
+        self.assertEqual('foo', store.get(3, annotations.NAME, None))
+        self.assertEqual(
+            [(3, {annotations.REQUIRED: False, annotations.NAME: 'foo'}),
+             (100, {annotations.REQUIRED: True})],
+            sorted(store.items()))
+
+        store.update(100, {annotations.REQUIRED: False})
+        self.assertFalse(store.get(100, annotations.REQUIRED, True))
+
+    def test_key_table(self):
+        key_table = KeyTable()
+        self.assertEqual(0, key_table.intern((1, 'foo')))
+        self.assertEqual(1, key_table.intern((1, 'bar')))
+        self.assertEqual(0, key_table.intern((1, 'foo')))
+        self.assertEqual((1, 'bar'), key_table.get_key(1))
+
+        # Every forest interns keys in its own table.
+        sizes = []
+        for _ in range(2):
+            cbgen = CtypesBindingGenerator()
+            cbgen.parse('input.c', contents=StringIO('int foo(int);'))
+            forest = cbgen.syntax_tree_forest
+            tree = forest[0]
+            self.assertIs(forest.key_table, tree.snapshot.key_table)
+            self.assertEqual(tree.key, forest.key_table.get_key(tree.key_id))
+            sizes.append(len(forest.key_table))
+        self.assertEqual(sizes[0], sizes[1])
+
+    def test_parse_session(self):
+        cbgen = CtypesBindingGenerator()
+        session = cbgen.syntax_tree_forest.session
+        cbgen.parse('a.c', contents=StringIO('int a;'))
+        index = session.index
+        cbgen.parse('b.c', contents=StringIO('int b;'))
+        self.assertIs(index, session.index)
+
+    def test_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            gen_codes = []
+            for _ in range(2):
+                cache = TranslationUnitCache(cache_dir)
+                session = ParseSession(cache=cache)
+                cbgen = CtypesBindingGenerator(session=session)
+                cbgen.parse('input.c', contents=StringIO('''
+struct foo {
+    int bar;
+};
+int foo_bar(struct foo *);
+                '''))
+                output = StringIO()
+                cbgen.generate(output)
+                gen_codes.append(output.getvalue())
+            self.assertEqual(1, cache.hits)
+            self.assertEqual(0, cache.misses)
+            self.assertEqual(gen_codes[0], gen_codes[1])
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_cache_dependencies(self):
+        tmp_dir = tempfile.mkdtemp()
+        cwd = os.getcwd()
+        try:
+            cache_dir = os.path.join(tmp_dir, 'cache')
+            header_path = os.path.join(tmp_dir, 'dep.h')
+            with open(header_path, 'w') as header:
+                header.write('int foo(int);\n')
+            with open(os.path.join(tmp_dir, 'input.c'), 'w') as source:
+                source.write('#include "dep.h"\n')
+
+            def parse():
+                cache = TranslationUnitCache(cache_dir)
+                session = ParseSession(cache=cache)
+                cbgen = CtypesBindingGenerator(session=session)
+                cbgen.parse(os.path.join(tmp_dir, 'input.c'))
+                return cache
+
+            os.chdir(tmp_dir)
+            self.assertEqual(1, parse().misses)
+            # Included files are found from other directories.
+            os.chdir(cwd)
+            self.assertEqual(1, parse().hits)
+            # Edits that keep size and modification time are caught.
+            stat = os.stat(header_path)
+            with open(header_path, 'w') as header:
+                header.write('int bar(int);\n')
+            os.utime(header_path, (stat.st_atime, stat.st_mtime))
+            self.assertEqual(1, parse().misses)
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(tmp_dir)
+
+    def test_prelude(self):
+        prelude_fd, prelude_path = tempfile.mkstemp(suffix='.h')
+        with os.fdopen(prelude_fd, 'w') as prelude:
+            prelude.write('''
+#ifndef PRELUDE_H
+#define PRELUDE_H
+typedef int prelude_int;
+#endif
+            ''')
+        session = ParseSession()
+        try:
+            session.add_prelude(prelude_path)
+            cbgen = CtypesBindingGenerator(session=session)
+            cbgen.parse('input.c', contents=StringIO('''
+prelude_int foo(void);
+            '''))
+            output = StringIO()
+            cbgen.generate(output)
+        finally:
+            session.close()
+            os.remove(prelude_path)
+        gen_code = output.getvalue()
+        python_code = '''
+foo = _lib.foo
+foo.restype = c_int
+        '''
+        self.assertTrue(helper.compare_codes(gen_code, python_code),
+                        helper.prepare_error_message(python_code, gen_code))
+
+    def test_parse_all(self):
+        gen_codes = self._parse_all((('a.c', 'struct foo { int x; } a;'),
+                                     ('b.c', 'struct foo *b(void);')))
+        self.assertEqual(gen_codes[0], gen_codes[1])
+
+    def test_parse_all_rename(self):
+        # The rule matches the name it renames to, and so a declaration of
+        # a header included by both files is renamed twice, in order.
+        config = {'rename': [{'name': '^foo', 'rename': 'foo_'}]}
+        gen_codes = self._parse_all((('foo.h', 'struct foo { int x; };'),
+                                     ('a.c', '#include "foo.h"\n'
+                                             'struct foo a;'),
+                                     ('b.c', '#include "foo.h"\n'
+                                             'struct foo *b(void);')),
+                                    config=config)
+        self.assertIn('class foo__(Structure)', gen_codes[0])
+        self.assertEqual(gen_codes[0], gen_codes[1])
+
+    @staticmethod
+    def _parse_all(sources, config=None):
+        '''Generate from the .c sources serially and in parallel.'''
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            paths = []
+            for name, code in sources:
+                path = os.path.join(tmp_dir, name)
+                with open(path, 'w') as c_src:
+                    c_src.write(code)
+                paths.append(path)
+            paths = [path for path in paths if path.endswith('.c')]
+            gen_codes = []
+            for jobs in (1, 2):
+                session = ParseSession()
+                try:
+                    cbgen = CtypesBindingGenerator(session=session)
+                    if config:
+                        cbgen.config(config)
+                    cbgen.parse_all(paths, jobs=jobs)
+                    output = StringIO()
+                    cbgen.generate(output)
+                finally:
+                    session.close()
+                gen_codes.append(output.getvalue())
+            return gen_codes
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_declarations_only(self):
+        c_code = '''
+static inline int foo(int x) {
+    struct bar { int y; } bar = { x };
+    return bar.y;
+}
+        '''
+        for declarations_only in (True, False):
+            cbgen = CtypesBindingGenerator(declarations_only=declarations_only)
+            cbgen.parse('input.c', contents=StringIO(c_code))
+            syntax_tree = cbgen.syntax_tree_forest[0]
+            kinds = []
+            syntax_tree.traverse(preorder=lambda tree: kinds.append(tree.kind))
+            self.assertEqual(not declarations_only,
+                             CursorKind.COMPOUND_STMT in kinds)
+            kinds = []
+            traverse_postorder(syntax_tree,
+                               lambda tree: kinds.append(tree.kind))
+            self.assertIn(CursorKind.FUNCTION_DECL, kinds)
+            self.assertNotIn(CursorKind.COMPOUND_STMT, kinds)
+            self.assertNotIn(CursorKind.STRUCT_DECL, kinds)
+
+    def test_snapshot(self):
+        cbgen = CtypesBindingGenerator()
+        cbgen.parse('input.c', contents=StringIO('''
+struct foo {
+    int x;
+};
+int bar(struct foo *);
+        '''))
+
+        def check(tree):
+            cursor = tree.cursor
+            self.assertIsNotNone(tree.node)
+            self.assertEqual(cursor.kind, tree.kind)
+            self.assertEqual(cursor.spelling, tree.spelling)
+            self.assertEqual(cursor.location.line, tree.location.line)
+            self.assertEqual(cursor.location.offset, tree.location.offset)
+            if cursor.location.file:
+                self.assertEqual(cursor.location.file.name,
+                                 tree.location.file.name)
+            else:
+                self.assertIsNone(tree.location.file)
+            self.assertEqual([child.kind for child in cursor.get_children()],
+                             [child.kind for child in tree.get_children()])
+
+        cbgen.syntax_tree_forest[0].traverse(preorder=check)
+
+    def test_interning(self):
+        cbgen = CtypesBindingGenerator()
+        cbgen.parse('input.c', contents=StringIO('''
+struct foo {
+    int x;
+};
+typedef struct foo *foo_ptr;
+        '''))
+        root = cbgen.syntax_tree_forest[0]
+        struct, typedef = list(root.get_children())
+        self.assertIs(struct, list(root.get_children())[0])
+        field = list(struct.get_children())[0]
+        self.assertIs(struct, field.semantic_parent)
+        self.assertIs(field.type, field.type)
+        pointee = typedef.underlying_typedef_type.get_pointee()
+        self.assertIs(pointee, typedef.underlying_typedef_type.get_pointee())
+        self.assertIs(struct, pointee.get_declaration())
+        with self.assertRaises(AttributeError):
+            struct.xxx = 1
+
+    def test_memoized_type(self):
+        cbgen = CtypesBindingGenerator()
+        cbgen.parse('input.c', contents=StringIO('''
+struct foo {
+    int x;
+};
+void bar(struct foo *);
+        '''))
+        struct, func = list(cbgen.syntax_tree_forest[0].get_children())
+        argtypes = CodeGen.make_function_argtypes(func)
+        self.assertEqual(('POINTER(foo)',), argtypes)
+        self.assertIs(argtypes, CodeGen.make_function_argtypes(func))
+        struct.annotate(annotations.NAME, 'Foo')
+        self.assertEqual(('POINTER(Foo)',),
+                         CodeGen.make_function_argtypes(func))
+
+    def test_required_files(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            used_path = os.path.join(tmp_dir, 'used.h')
+            unused_path = os.path.join(tmp_dir, 'unused.h')
+            with open(used_path, 'w') as header:
+                header.write('struct used { int x; };\n')
+            with open(unused_path, 'w') as header:
+                header.write('struct unused { int y; };\n')
+            cbgen = CtypesBindingGenerator()
+            cbgen.parse('input.c', contents=StringIO('''
+#include "%s"
+#include "%s"
+void foo(struct used *);
+            ''' % (used_path, unused_path)))
+            syntax_tree = cbgen.syntax_tree_forest[0]
+            self.assertEqual(set(['input.c', used_path]),
+                             find_required_files(syntax_tree))
+            names = [tree.spelling for tree in
+                     syntax_tree.get_top_level_decls([unused_path])]
+            self.assertEqual(['unused'], names)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_pass_manager(self):
+        passes = [CustomPass('a', None),
+                  CustomPass('b', None),
+                  CustomPass('c', None, requires=('a',)),
+                  CustomPass('d', None, requires=('x',)),
+                  CustomPass('e', None, requires=('c',))]
+        self.assertEqual([['a', 'b'], ['c', 'd'], ['e']],
+                         [[pass_.name for pass_ in stage]
+                          for stage in schedule(passes)])
+
+        cbgen = CtypesBindingGenerator()
+        cbgen.parse('input.c', contents=StringIO('int foo(int);'))
+        counts = cbgen.pass_manager.node_counts
+        self.assertEqual(counts['required_nodes'], counts['forward_decl'])
+        self.assertEqual(counts['required_nodes'], counts['anonymous_pod'])
+        self.assertTrue(counts['required_nodes'] > 0)
+
+        cbgen = CtypesBindingGenerator()
+        cbgen.pass_manager = PassManager(profile=True)
+        cbgen.parse('input.c', contents=StringIO('int foo(int);'))
+        self.assertEqual(counts, cbgen.pass_manager.node_counts)
+        self.assertEqual(set(counts), set(cbgen.pass_manager.pass_times))
+
+    def test_shallow_nodes(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(tmp_dir, 'dep.h'), 'w') as header:
+                header.write('''
+struct dep { struct inner { int x; } inner; };
+struct unused { int y; };
+                ''')
+            c_path = os.path.join(tmp_dir, 'input.c')
+            with open(c_path, 'w') as source:
+                source.write('''
+#include "dep.h"
+int foo(struct dep *);
+                ''')
+            cbgen = CtypesBindingGenerator()
+            cbgen.parse(c_path)
+            snapshot = cbgen.syntax_tree_forest[0].snapshot
+            # Top-level nodes of dep.h are not descended into.
+            self.assertEqual(2, len(snapshot.shallow))
+            for node in snapshot.shallow:
+                self.assertEqual(node + 1, snapshot.ends[node])
+            output = StringIO()
+            cbgen.generate(output)
+            self.assertIn("inner._fields_ = [('x', c_int)]",
+                          output.getvalue())
+            self.assertNotIn('unused', output.getvalue())
+        finally:
+            shutil.rmtree(tmp_dir)
+
     def test_file(self):
         c_file = os.path.join(os.path.dirname(__file__), 'file.c')
         cbgen = CtypesBindingGenerator()
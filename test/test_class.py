@@ -1,5 +1,6 @@
 import unittest
 import helper
+import cbind.codegen.ctypes_runtime
 
 
 class TestClass(helper.TestCtypesBindingGenerator):
@@ -46,7 +47,7 @@ struct cls {
     virtual void vmethod(void);
     static int smethod(char);
 };
-        ''', '''
+        ''', cbind.codegen.ctypes_runtime.LAYOUT_TABLE + '''
 class cls(Structure):
     pass
 cls._fields_ = [('__python_struct_padding', c_char * 8),
@@ -65,8 +66,9 @@ cls.smethod.argtypes = [c_char]
 cls.smethod.restype = c_int
 cls.smethod = staticmethod(cls.smethod)
 
-assert cls.memb.offset == 8, 'cls.memb.offset == 8'
-        ''', filename='input.cpp', enable_cpp=True, assert_layout=True)
+_python_layouts.append((cls, 16, 8, [('memb', 8)]))
+        ''' + cbind.codegen.ctypes_runtime.CHECK_LAYOUTS,
+            filename='input.cpp', enable_cpp=True, assert_layout=True)
 
 
 class TestMangler(helper.TestCppMangler):
@@ -1,6 +1,9 @@
+import array
+import ctypes
+import sys
 import unittest
 import helper
-import cbind.ctypes_binding
+import cbind.codegen.ctypes_runtime
 
 
 def check_yaml():
@@ -179,8 +182,9 @@ rename:
 
     @unittest.skipIf(not check_yaml(), 'require package yaml')
     def test_preamble(self):
-        header = cbind.ctypes_binding.HEADER.format(progname='cbind')
-        loader = cbind.ctypes_binding.LOAD_LIBRARY.format(
+        runtime = cbind.codegen.ctypes_runtime
+        header = runtime.HEADER.format(progname='cbind')
+        loader = runtime.LOAD_LIBRARY.format(
             posix_library='libclang.so',
             darwin_library='libclang.dylib',
             windows_library='libclang.dll')
@@ -251,7 +255,7 @@ void bar(struct foo*);
 void not_method_1(struct foo*, int i);
 
 void not_method_2(struct foo);
-        ''', cbind.ctypes_binding.METHOD_DESCRIPTOR + '''
+        ''', cbind.codegen.ctypes_runtime.METHOD_DESCRIPTOR + '''
 class foo(Structure):
     pass
 
@@ -270,6 +274,93 @@ method:
       method: foo.method_bar
         ''')
 
+    @unittest.skipIf(not check_yaml() or sys.platform == 'win32',
+                     'require package yaml and a POSIX libc')
+    def test_method_lazy(self):
+        # An empty preamble brings in the header the runtime relies on.
+        env = self.load_binding('''
+struct foo {
+    char s[4];
+};
+
+unsigned long strnlen(struct foo*, unsigned long);
+        ''', library=ctypes.CDLL(None), lazy=True, config='''
+preamble: ''
+method:
+    - argtypes: [POINTER\(foo\), c_ulong]
+      method: foo.length
+        ''')
+        foo = env['foo'](b'ab')
+        self.assertIsInstance(env['strnlen'], env['_LazyFunction'])
+        self.assertEqual(2, foo.length(4))
+        self.assertNotIsInstance(env['strnlen'], env['_LazyFunction'])
+        self.assertIs(env['strnlen'], vars(env['foo'])['length'].functor)
+
+    @unittest.skipIf(not check_yaml(), 'require package yaml')
+    def test_batch(self):
+        self.run_test('''
+double scale(double x, int n);
+
+void reset(int i);
+
+int not_batch(void);
+        ''', cbind.codegen.ctypes_runtime.BATCH_FUNCTOR + '''
+scale = _lib.scale
+scale.argtypes = [c_double, c_int]
+scale.restype = c_double
+scale_batch = _BatchFunctor('scale', [c_double, c_int], c_double)
+
+reset = _lib.reset
+reset.argtypes = [c_int]
+reset_all = _BatchFunctor('reset', [c_int], None)
+
+not_batch = _lib.not_batch
+not_batch.restype = c_int
+        ''', config='''
+batch:
+    - name: ^scale$
+      batch: True
+    - name: ^reset$
+      batch: reset_all
+        ''')
+
+    @unittest.skipIf(not check_yaml() or sys.platform == 'win32',
+                     'require package yaml and a POSIX libc')
+    def test_batch_arguments(self):
+        env = self.load_binding('''
+int abs(int);
+long long llabs(long long);
+        ''', library=ctypes.CDLL(None), config='''
+batch:
+    - name: ^(abs|llabs)$
+      batch: True
+        ''')
+        abs_batch = env['abs_batch']
+        ints = array.array('i', [-1, 0, 2, 0, -3, 0])
+        for arg in ([-1, 2, -3],
+                    array.array('i', [-1, 2, -3]),
+                    memoryview(ints)[::2],
+                    array.array('b', [-1, 2, -3]),
+                    [ctypes.c_int(-1), 2, ctypes.c_int(-3)]):
+            self.assertEqual([1, 2, 3], abs_batch(arg))
+        # Values that ctypes would pass as c_int must be converted.
+        self.assertEqual([2 ** 40, 3], env['llabs_batch']([-2 ** 40, -3]))
+
+    @unittest.skipIf(not check_yaml() or sys.platform == 'win32',
+                     'require package yaml and a POSIX libc')
+    def test_batch_lazy(self):
+        env = self.load_binding('''
+int abs(int);
+        ''', library=ctypes.CDLL(None), lazy=True, config='''
+batch:
+    - name: ^abs$
+      batch: True
+        ''')
+        abs_batch = env['abs_batch']
+        self.assertIsNone(abs_batch.functions)
+        self.assertEqual([1, 2], abs_batch([-1, 2]))
+        self.assertIsNotNone(abs_batch.functions)
+
     @unittest.skipIf(not check_yaml(), 'require package yaml')
     def test_mixin(self):
         self.run_test('''
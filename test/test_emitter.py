@@ -0,0 +1,70 @@
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+from cbind.codegen.emitter import (AtomicFileSink,
+                                   Emitter,
+                                   MemorySink,
+                                   make_emitter)
+
+
+class TestEmitter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'output.py')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_emitter(self):
+        sink = MemorySink()
+        emitter = Emitter(sink, block_size=8)
+        emitter.write('a = 1\n')
+        emitter.end_chunk()
+        self.assertEqual('', sink.getvalue())
+        emitter.write('b = 2\n')
+        emitter.end_chunk()
+        self.assertEqual('a = 1\nb = 2\n', sink.getvalue())
+        emitter.write('c = 3\n')
+        emitter.close()
+        self.assertEqual('a = 1\nb = 2\nc = 3\n', sink.getvalue())
+
+    def test_atomic_file(self):
+        with open(self.path, 'w') as output:
+            output.write('old\n')
+        with self.assertRaises(RuntimeError):
+            with Emitter(AtomicFileSink(self.path), block_size=1) as emitter:
+                emitter.write('new\n')
+                emitter.end_chunk()
+                raise RuntimeError()
+        self.assertEqual(['output.py'], os.listdir(self.tmp_dir))
+        with open(self.path) as output:
+            self.assertEqual('old\n', output.read())
+
+        with make_emitter(self.path) as emitter:
+            emitter.write('new\n')
+        self.assertEqual(['output.py'], os.listdir(self.tmp_dir))
+        with open(self.path) as output:
+            self.assertEqual('new\n', output.read())
+
+    @unittest.skipIf(sys.platform == 'win32', 'require POSIX file modes')
+    def test_atomic_file_mode(self):
+        umask = os.umask(0)
+        os.umask(umask)
+        with make_emitter(self.path) as emitter:
+            emitter.write('new\n')
+        self.assertEqual(0o666 & ~umask,
+                         stat.S_IMODE(os.stat(self.path).st_mode))
+
+        os.chmod(self.path, 0o600)
+        with make_emitter(self.path) as emitter:
+            emitter.write('newer\n')
+        self.assertEqual(0o600, stat.S_IMODE(os.stat(self.path).st_mode))
+
+
+if __name__ == '__main__':
+    unittest.main()
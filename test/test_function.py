@@ -1,5 +1,17 @@
+import ctypes
+import sys
 import unittest
 import helper
+import cbind.codegen.ctypes_runtime
+
+
+def check_yaml():
+    try:
+        import yaml
+    except ImportError:
+        return False
+    else:
+        return True
 
 
 class TestFunction(helper.TestCtypesBindingGenerator):
@@ -29,6 +41,48 @@ foo = _lib.foo
 foo.argtypes = [POINTER(c_int), c_char_p, c_void_p]
         ''')
 
+    def test_lazy(self):
+        self.run_test('''
+int foo(int);
+void bar(void);
+        ''', cbind.codegen.ctypes_runtime.LAZY_FUNCTION + '''
+foo = _LazyFunction(globals(), 'foo', 'foo',
+                    lambda: dict(argtypes=[c_int], restype=c_int))
+bar = _LazyFunction(globals(), 'bar', 'bar', lambda: dict())
+        ''', lazy=True)
+
+    @unittest.skipIf(not check_yaml() or sys.platform == 'win32',
+                     'require package yaml and a POSIX libc')
+    def test_lazy_binding(self):
+        env = self.load_binding('''
+int abs(int);
+        ''', library=ctypes.CDLL(None), lazy=True, config='''
+errcheck:
+    - name: ^abs$
+      errcheck: check_abs
+        ''')
+        lazy_abs = env['abs']
+        self.assertIsInstance(lazy_abs, env['_LazyFunction'])
+        results = []
+
+        def check_abs(result, function, args):
+            '''Record results.'''
+            results.append((result, args))
+            return result
+
+        # The errcheck function is looked up on the first call.
+        env['check_abs'] = check_abs
+
+        self.assertEqual(3, lazy_abs(-3))
+        function = env['abs']
+        self.assertIsNot(lazy_abs, function)
+        self.assertEqual([ctypes.c_int], function.argtypes)
+        self.assertIs(ctypes.c_int, function.restype)
+        self.assertIs(check_abs, function.errcheck)
+        self.assertEqual(4, lazy_abs(-4))
+        self.assertEqual(5, function(-5))
+        self.assertEqual([(3, (-3,)), (4, (-4,)), (5, (-5,))], results)
+
     def test_variadic(self):
         self.run_test('''
 int printf(const char *, ...);
@@ -0,0 +1,97 @@
+import ctypes
+import ctypes.util
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from cbind.codegen import CodeGen
+from cbind.ctypes_binding import CtypesBindingGenerator
+
+
+class TestPackage(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+        for name in list(sys.modules):
+            if name.split('.')[0] == 'pkg':
+                del sys.modules[name]
+
+    def write_source(self, name, code):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w') as c_src:
+            c_src.write(code)
+        return path
+
+    def test_package(self):
+        a_path = self.write_source('a.h', '''
+struct a {
+    int x;
+};
+enum { A_VALUE = 1 };
+        ''')
+        b_path = self.write_source('b.h', '''
+#include "a.h"
+struct b {
+    struct a a;
+    struct b *next;
+};
+        ''')
+        cbgen = CtypesBindingGenerator()
+        cbgen.parse(a_path)
+        cbgen.parse(b_path)
+        pkg_dir = os.path.join(self.tmp_dir, 'pkg')
+        cbgen.generate_package('cbind', None, pkg_dir)
+
+        self.assertEqual(['__init__.py', '_a_h.py', '_b_h.py', '_base.py'],
+                         sorted(os.listdir(pkg_dir)))
+        with open(os.path.join(pkg_dir, '_b_h.py')) as shard:
+            self.assertIn('from . import _a_h\n', shard.read())
+
+        sys.path.insert(0, self.tmp_dir)
+        try:
+            import pkg
+            self.assertEqual(1, pkg.A_VALUE)
+            self.assertEqual(2 * ctypes.sizeof(ctypes.c_void_p),
+                             ctypes.sizeof(pkg.b))
+            self.assertIs(ctypes.POINTER(pkg.b), dict(pkg.b._fields_)['next'])
+            namespace = {}
+            exec('from pkg import *', namespace)  # pylint: disable=W0122
+            for name in ('A_VALUE', 'a', 'b'):
+                self.assertIs(getattr(pkg, name), namespace[name])
+        finally:
+            sys.path.remove(self.tmp_dir)
+
+    def test_package_lazy(self):
+        libc = ctypes.util.find_library('c')
+        if not libc:
+            self.skipTest('libc is not found')
+        path = self.write_source('a.h', 'int abs(int);\n')
+        cbgen = CtypesBindingGenerator()
+        cbgen.parse(path)
+        pkg_dir = os.path.join(self.tmp_dir, 'pkg')
+        CodeGen.LAZY = True
+        try:
+            cbgen.generate_package('cbind', libc, pkg_dir)
+        finally:
+            CodeGen.LAZY = False
+
+        sys.path.insert(0, self.tmp_dir)
+        try:
+            import pkg
+            from pkg._base import _LazyFunction as lazy_function
+            self.assertIsInstance(pkg.abs, lazy_function)
+            self.assertNotIn('abs', vars(pkg))
+            self.assertEqual(3, pkg.abs(-3))
+            self.assertNotIsInstance(pkg.abs, lazy_function)
+            self.assertEqual(3, pkg.abs(-3))
+        finally:
+            sys.path.remove(self.tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
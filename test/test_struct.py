@@ -1,5 +1,21 @@
+import ctypes
+import io
+import os
+import sys
+import threading
+import time
 import unittest
 import helper
+import cbind.codegen.ctypes_runtime
+
+
+def check_numpy():
+    try:
+        import numpy
+    except ImportError:
+        return False
+    else:
+        return True
 
 
 class TestStruct(helper.TestCtypesBindingGenerator):
@@ -158,13 +174,12 @@ struct blob2 {
     int n : 16;
     int o;
 };
-        ''', '''
+        ''', cbind.codegen.ctypes_runtime.LAYOUT_TABLE + '''
 class blob1(Structure):
     pass
 blob1._fields_ = [('i', c_int),
                   ('j', c_int)]
-assert blob1.i.offset == 0, 'blob1.i.offset == 0'
-assert blob1.j.offset == 4, 'blob1.j.offset == 4'
+_python_layouts.append((blob1, 8, 4, [('i', 0), ('j', 4)]))
 class blob2(Structure):
     pass
 blob2._fields_ = [('i', c_int, 1),
@@ -174,14 +189,192 @@ blob2._fields_ = [('i', c_int, 1),
                   ('m', c_int, 16),
                   ('n', c_int, 16),
                   ('o', c_int)]
-assert blob2.i.offset == 0, 'blob2.i.offset == 0'
-assert blob2.j.offset == 0, 'blob2.j.offset == 0'
-assert blob2.k.offset == 4, 'blob2.k.offset == 4'
-assert blob2.l.offset == 8, 'blob2.l.offset == 8'
-assert blob2.m.offset == 12, 'blob2.m.offset == 12'
-assert blob2.n.offset == 12, 'blob2.n.offset == 12'
-assert blob2.o.offset == 16, 'blob2.o.offset == 16'
-        ''', assert_layout=True)
+_python_layouts.append((blob2, 20, 4, [('i', 0), ('j', 0), ('k', 4), \
+('l', 8), ('m', 12), ('n', 12), ('o', 16)]))
+        ''' + cbind.codegen.ctypes_runtime.CHECK_LAYOUTS, assert_layout=True)
+
+    def test_alias_types(self):
+        self.run_test('''
+struct node {
+    struct node *next;
+    unsigned char data[32];
+};
+void foo(struct node *, int (*)(struct node *));
+        ''', '''
+class node(Structure):
+    pass
+_T_ptr_node = POINTER(node)
+_T_arr32_c_ubyte = (c_ubyte * 32)
+node._fields_ = [('next', _T_ptr_node),
+                 ('data', _T_arr32_c_ubyte)]
+
+_T_fn1 = CFUNCTYPE(c_int, _T_ptr_node)
+foo = _lib.foo
+foo.argtypes = [_T_ptr_node, _T_fn1]
+        ''', alias_types=True)
+
+    def test_numpy_dtype(self):
+        self.run_test('''
+struct point {
+    int x;
+    int y;
+};
+
+struct event {
+    long long sec;
+    unsigned short type;
+    unsigned short code;
+    struct point pos[2];
+    unsigned int flag : 1;
+    unsigned int mode : 3;
+};
+        ''', cbind.codegen.ctypes_runtime.NUMPY_DTYPE + '''
+class point(Structure):
+    pass
+point._fields_ = [('x', c_int),
+                  ('y', c_int)]
+point._numpy_dtype_ = _NumpyDtype([0, 4], 8)
+
+class event(Structure):
+    pass
+event._fields_ = [('sec', c_longlong),
+                  ('type', c_ushort),
+                  ('code', c_ushort),
+                  ('pos', (point * 2)),
+                  ('flag', c_uint, 1),
+                  ('mode', c_uint, 3)]
+event._numpy_dtype_ = _NumpyDtype([0, 8, 10, 12, 28, 28], 32)
+        ''', numpy_dtype=True)
+
+    @unittest.skipIf(not check_numpy(), 'require package numpy')
+    def test_numpy_dtype_layout(self):
+        import numpy
+        env = self.load_binding('''
+struct point {
+    int x;
+    int y;
+};
+
+struct event {
+    char tag;
+    long long sec;
+    unsigned short type;
+    struct point pos[2];
+    unsigned int flag : 1;
+    unsigned int mode : 3;
+    int level : 5;
+    void *data;
+    double weight;
+};
+        ''', numpy_dtype=True)
+        point, event = env['point'], env['event']
+        for cls in (point, event):
+            dtype = cls._numpy_dtype_
+            self.assertEqual(ctypes.sizeof(cls), dtype.itemsize)
+            for name, (_, offset) in dtype.fields.items():
+                self.assertEqual(getattr(cls, name.split('|')[0]).offset,
+                                 offset, name)
+        self.assertIn('flag|mode|level', event._numpy_dtype_.names)
+
+        events = (event * 2)()
+        events[1].sec = 1234567890123
+        events[1].pos[1].y = -7
+        events[1].mode = 5
+        events[1].weight = 0.5
+        records = numpy.frombuffer(bytearray(events), event._numpy_dtype_)
+        self.assertEqual(1234567890123, records[1]['sec'])
+        self.assertEqual(-7, records[1]['pos'][1]['y'])
+        self.assertEqual(0.5, records[1]['weight'])
+        if sys.byteorder == 'little':
+            self.assertEqual(5, (records[1]['flag|mode|level'] >> 1) & 7)
+
+    def test_bulk_readers(self):
+        self.run_test('''
+struct foo {
+    int x;
+};
+        ''', cbind.codegen.ctypes_runtime.BULK_READERS + '''
+class foo(_BulkRecordMixin, Structure):
+    pass
+foo._fields_ = [('x', c_int)]
+        ''', bulk_readers=True)
+
+    def test_bulk_readers_short_reads(self):
+        foo = self._load_bulk_reader()
+        records = (foo * 3)((1, 2), (3, 4), (5, 6))
+        data = bytes(bytearray(records))
+        for buffering in (None, 0, -1):
+            read_fd = self._write_pipe(data)
+            if buffering is None:
+                file_ = read_fd
+            else:
+                file_ = io.open(read_fd, 'rb', buffering=buffering)
+            values = []
+            try:
+                while True:
+                    array = foo.read_array(file_, 4)
+                    if not array:
+                        break
+                    values.extend((r.x, r.y) for r in array)
+            finally:
+                if buffering is None:
+                    os.close(read_fd)
+                else:
+                    file_.close()
+            self.assertEqual([(1, 2), (3, 4), (5, 6)], values)
+        read_fd = self._write_pipe(data[:-1])
+        try:
+            self.assertRaises(EOFError,
+                              lambda: [foo.read_array(read_fd, 3)
+                                       for _ in range(3)])
+        finally:
+            os.close(read_fd)
+        view = memoryview(bytearray(data)).cast('B', (3, ctypes.sizeof(foo)))
+        self.assertEqual([r.x for r in foo.array_from_buffer(view)], [1, 3, 5])
+
+    def test_bulk_readers_available_records(self):
+        foo = self._load_bulk_reader()
+        read_fd, write_fd = os.pipe()
+        try:
+            # Records that are available are returned without waiting for
+            # more of them.
+            os.write(write_fd, bytes(bytearray(foo(7, 8))))
+            buffer = bytearray(ctypes.sizeof(foo) * 64)
+            array = foo.read_array(read_fd, 64, buffer=buffer)
+            self.assertEqual([(7, 8)], [(r.x, r.y) for r in array])
+            array[0].x = 9
+            self.assertEqual(9, foo.from_buffer(buffer).x)
+            self.assertRaises(ValueError, foo.read_array, read_fd, 65,
+                              buffer=buffer)
+        finally:
+            os.close(read_fd)
+            os.close(write_fd)
+
+    def _load_bulk_reader(self):
+        '''Return a record class with bulk readers.'''
+        return self.load_binding('''
+struct foo {
+    int x;
+    short y;
+};
+        ''', bulk_readers=True)['foo']
+
+    @staticmethod
+    def _write_pipe(data):
+        '''Write data to a pipe a few bytes at a time; return the read end.'''
+        read_fd, write_fd = os.pipe()
+
+        def write():
+            '''Write data in short chunks.'''
+            try:
+                for i in range(0, len(data), 5):
+                    os.write(write_fd, data[i:i + 5])
+                    time.sleep(0.001)
+            finally:
+                os.close(write_fd)
+
+        threading.Thread(target=write).start()
+        return read_fd
 
 
 if __name__ == '__main__':
@@ -1,5 +1,6 @@
 import unittest
 import helper
+import cbind.codegen.ctypes_runtime
 
 
 class TestStruct(helper.TestCtypesBindingGenerator):
@@ -22,12 +23,13 @@ union foo {
     int i;
     char c;
 };
-        ''', '''
+        ''', cbind.codegen.ctypes_runtime.LAYOUT_TABLE + '''
 class foo(Union):
     pass
 foo._fields_ = [('i', c_int),
                 ('c', c_char)]
-        ''', assert_layout=True)
+_python_layouts.append((foo, 4, 4, [('i', 0), ('c', 0)]))
+        ''' + cbind.codegen.ctypes_runtime.CHECK_LAYOUTS, assert_layout=True)
 
 
 